@@ -0,0 +1,410 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from analytics import SITES_FILE, USAGE_FILE
+from anomalies import DEFAULT_THRESHOLDS, mad_scores
+from core import DATA_DIR, DEFAULT_SITE, file_modified
+from portfolio import load_portfolio
+from snapshots import MANIFEST_FILE, SnapshotStore, commit_usage
+
+# Optional alert rules: one row per rule with its threshold, optionally for one site only
+ALERT_RULES_FILE = os.path.join(DATA_DIR, 'alert_rules.csv')
+
+# Alerts are appended here as JSON lines
+ALERTS_FILE = os.path.join(DATA_DIR, 'alerts.jsonl')
+
+# Seconds between checks of the data files for changes
+CHECK_INTERVAL = 60
+
+# Rule kinds: (description of the threshold, metrics checked)
+RULES = {
+    'cost_spike': ("cost up more than {threshold:g}% on the year before", ('totalCost',)),
+    'usage_spike': ("usage up more than {threshold:g}% on the year before", ('totalUsage',)),
+    'rate_change': ("cost per kWh changed by more than {threshold:g}% on the year before", ('costPerKwh',)),
+    'budget': ("cost above the yearly budget of ${threshold:,.0f}", ('totalCost',)),
+    'anomaly': ("anomaly score above {threshold:g}", ('totalUsage', 'totalCost', 'costPerKwh'))
+}
+
+METRIC_LABELS = {'totalUsage': "Usage", 'totalCost': "Cost", 'costPerKwh': "Cost per kWh"}
+
+
+class Rule(NamedTuple):
+    """An alert rule; a rule without a site applies to every site that has no rule of the same kind of its own"""
+    kind: str
+    threshold: float
+    site: str = ''
+
+
+class Alert(NamedTuple):
+    """A rule that fired for one site, year and metric"""
+    site: str
+    year: int
+    rule: str
+    metric: str
+    value: float
+    threshold: float
+    message: str
+    created_at: float
+
+    @property
+    def key(self):
+        return (self.site, self.year, self.rule, self.metric)
+
+
+# Rules used when there is no rules file
+DEFAULT_RULES = [
+    Rule('cost_spike', 20.0),
+    Rule('rate_change', 15.0),
+    Rule('anomaly', DEFAULT_THRESHOLDS['mad'])
+]
+
+
+def load_rules(path=ALERT_RULES_FILE):
+    """Read alert rules from a CSV file with rule and threshold columns (and an optional site column), else the defaults"""
+    if not os.path.exists(path):
+        return list(DEFAULT_RULES)
+    df = pd.read_csv(path, dtype={'site': str})
+    missing = [col for col in ['rule', 'threshold'] if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing alert rule columns: {missing}")
+    unknown = sorted(set(df['rule']) - set(RULES))
+    if unknown:
+        raise ValueError(f"Unknown alert rules {unknown}, expected some of {list(RULES)}")
+    thresholds = pd.to_numeric(df['threshold'], errors='coerce')
+    if thresholds.isna().any():
+        raise ValueError(f"Alert rule thresholds must be numbers, got {df['threshold'][thresholds.isna()].tolist()}")
+    sites = df['site'].fillna('') if 'site' in df.columns else pd.Series('', index=df.index)
+    return [Rule(rule, float(threshold), site) for rule, threshold, site in zip(df['rule'], thresholds, sites)]
+
+
+def site_rows(portfolio, sites):
+    """Row indices of some portfolio sites (concatenated in the given order) and the position of each row's site"""
+    offsets = portfolio.offsets
+    counts = offsets[sites + 1] - offsets[sites]
+    rows = np.repeat(offsets[sites] - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+    return rows, np.repeat(np.arange(len(sites)), counts)
+
+
+class AlertMonitor:
+    """Evaluates alert rules over the yearly data of every site, re-checking only the sites whose rows changed"""
+
+    def __init__(self, rules, known=()):
+        self.rules = list(rules)
+        # Portfolio the active alerts were evaluated on (None before the first evaluation)
+        self.portfolio = None
+        # site -> {(site, year, rule, metric) -> Alert} of every rule currently firing
+        self.active = {}
+        # Keys already reported before (e.g. in an earlier run), which are not reported again
+        self.known = set(known)
+
+    def set_rules(self, rules):
+        """Switch to new rules; the next update re-checks every site"""
+        self.rules = list(rules)
+        self.portfolio = None
+
+    def thresholds(self, kind, sites):
+        """Threshold of a rule kind for each of some sites (NaN where the rule doesn't apply)"""
+        shared = [rule.threshold for rule in self.rules if rule.kind == kind and not rule.site]
+        own = {rule.site: rule.threshold for rule in self.rules if rule.kind == kind and rule.site}
+        default = shared[-1] if shared else np.nan
+        return np.array([own.get(site, default) for site in sites], dtype=np.float64)
+
+    def evaluate(self, portfolio, sites):
+        """Alerts firing for some portfolio sites (indices), with every rule evaluated over all their rows at once"""
+        sites = np.asarray(sites, dtype=np.int64)
+        rows, owner = site_rows(portfolio, sites)
+        names = [portfolio.sites[i] for i in sites]
+        if len(rows) == 0:
+            return []
+        years = portfolio.years[rows]
+        values = {'totalUsage': portfolio.usage[rows], 'totalCost': portfolio.cost[rows], 'costPerKwh': portfolio.rate[rows]}
+
+        # Change on the previous row of the same site (NaN on each site's first row)
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = owner[1:] != owner[:-1]
+        changes = {}
+        for metric, column in values.items():
+            previous = np.concatenate([[np.nan], column[:-1]])
+            with np.errstate(invalid='ignore', divide='ignore'):
+                changes[metric] = np.where(first, np.nan, (column / previous - 1) * 100)
+
+        fired = []
+        for kind in RULES:
+            threshold = self.thresholds(kind, names)[owner]
+            if np.isnan(threshold).all():
+                continue
+            for metric in RULES[kind][1]:
+                if kind == 'anomaly':
+                    value = self.anomaly_scores(values[metric], owner, len(sites))
+                    hits = np.abs(value) > threshold
+                elif kind == 'budget':
+                    value = values[metric]
+                    hits = value > threshold
+                elif kind == 'rate_change':
+                    value = changes[metric]
+                    hits = np.abs(value) > threshold
+                else:
+                    value = changes[metric]
+                    hits = value > threshold
+                fired.extend((kind, metric, i, value[i], threshold[i]) for i in np.flatnonzero(hits))
+
+        now = time.time()
+        return [
+            Alert(names[owner[i]], int(years[i]), kind, metric, float(value), float(threshold), self.message(kind, metric, value, threshold), now)
+            for kind, metric, i, value, threshold in fired
+        ]
+
+    @staticmethod
+    def anomaly_scores(column, owner, n_sites):
+        """Robust anomaly scores of each site's rows, scored as the padded rows of one (site, year) matrix"""
+        counts = np.bincount(owner, minlength=n_sites)
+        starts = np.cumsum(counts) - counts
+        position = np.arange(len(column)) - starts[owner]
+        matrix = np.full((n_sites, counts.max()), np.nan)
+        matrix[owner, position] = column
+        with np.errstate(invalid='ignore'):
+            scores = mad_scores(matrix)
+        return scores[owner, position]
+
+    @staticmethod
+    def message(kind, metric, value, threshold):
+        label = METRIC_LABELS[metric]
+        if kind == 'anomaly':
+            return f"{label} looks anomalous (score {value:+.1f}, {RULES[kind][0].format(threshold=threshold)})"
+        if kind == 'budget':
+            return f"{label} of ${value:,.0f} is {value / threshold * 100 - 100:.1f}% over the yearly budget of ${threshold:,.0f}"
+        return f"{label} changed by {value:+.1f}% ({RULES[kind][0].format(threshold=threshold)})"
+
+    def update(self, portfolio):
+        """Move to a new version of the site data and return the alerts that started firing
+
+        Only the sites whose rows changed (or every site, on the first update and after a rule
+        change) are evaluated again, so the work grows with the changed data, not the whole history.
+        Alerts of re-checked sites that no longer fire are resolved.
+        """
+        if self.portfolio is None:
+            changed = np.arange(len(portfolio.sites))
+        else:
+            changed = portfolio.changed_sites(self.portfolio)
+        self.portfolio = portfolio
+
+        # Rebuild the alerts of the re-checked sites and drop those of removed sites
+        previous = self.active
+        active = dict(previous)
+        if len(active) > len(portfolio.sites) or not set(active) <= set(portfolio.sites):
+            active = {site: alerts for site, alerts in active.items() if site in portfolio.positions}
+        for i in changed:
+            active.pop(portfolio.sites[i], None)
+        new_alerts = []
+        for alert in self.evaluate(portfolio, changed) if len(changed) else []:
+            site_alerts = active.setdefault(alert.site, {})
+            before = previous.get(alert.site, {}).get(alert.key)
+            if before is not None:
+                site_alerts[alert.key] = before
+                continue
+            site_alerts[alert.key] = alert
+            if alert.key not in self.known:
+                self.known.add(alert.key)
+                new_alerts.append(alert)
+
+        # A resolved alert is reported again if it fires again later
+        for site, alerts in previous.items():
+            if active.get(site) is not alerts:
+                self.known.difference_update(key for key in alerts if key not in active.get(site, {}))
+        # Swapped in whole, so readers in other threads never see a half-updated dict
+        self.active = active
+        return new_alerts
+
+    def active_alerts(self, site=None):
+        """Alerts currently firing, optionally for one site, latest year first"""
+        if site is None:
+            alerts = [alert for site_alerts in self.active.values() for alert in site_alerts.values()]
+        else:
+            alerts = list(self.active.get(site, {}).values())
+        return sorted(alerts, key=lambda alert: (-alert.year, alert.site, alert.rule, alert.metric))
+
+
+class FileSink:
+    """Appends alerts to a JSON-lines file"""
+
+    def __init__(self, path=ALERTS_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def known(self):
+        """Keys of the alerts already in the file"""
+        if not os.path.exists(self.path):
+            return set()
+        keys = set()
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                # Lines that don't parse (e.g. cut short by a crash mid-write) are skipped
+                try:
+                    alert = json.loads(line)
+                    keys.add((alert['site'], alert['year'], alert['rule'], alert['metric']))
+                except (ValueError, KeyError, TypeError):
+                    continue
+        return keys
+
+    def write(self, alerts):
+        if not alerts:
+            return
+        lines = ''.join(json.dumps(alert._asdict()) + '\n' for alert in alerts)
+        with self.lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, 'a+b') as f:
+                # Start on a new line after a line that was cut short
+                if f.seek(0, os.SEEK_END):
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        lines = '\n' + lines
+                f.write(lines.encode('utf-8'))
+
+
+class QueueSink:
+    """Puts alerts on an in-process queue for another thread to consume"""
+
+    def __init__(self, maxsize=0):
+        self.queue = queue.Queue(maxsize)
+
+    def known(self):
+        return set()
+
+    def write(self, alerts):
+        for alert in alerts:
+            self.queue.put(alert)
+
+
+def load_site_data(store=None):
+    """Yearly data of the built-in site (its current version) and the optional sites file, as the dashboard loads it"""
+    store = SnapshotStore() if store is None else store
+    snapshot = commit_usage(store)
+    return load_portfolio(SITES_FILE, base=store.frame(snapshot.version).assign(site=DEFAULT_SITE))
+
+
+class AlertScheduler:
+    """Re-evaluates the alert rules in a background thread whenever the site data or rules change"""
+
+    def __init__(self, sinks, rules_path=ALERT_RULES_FILE, interval=CHECK_INTERVAL, load=load_site_data):
+        self.sinks = list(sinks)
+        self.rules_path = rules_path
+        self.interval = interval
+        self.load = load
+        # Last error raised while loading data or rules (the thread keeps running), and the last from the rules file alone
+        self.error = None
+        self.rules_error = None
+        # File modification times seen by the last check
+        self.modified = None
+        self.rules_modified = file_modified(rules_path)
+        try:
+            rules = load_rules(rules_path)
+        except (ValueError, OSError) as error:
+            # Start with the default rules until the file is fixed
+            rules = list(DEFAULT_RULES)
+            self.error = self.rules_error = error
+        try:
+            known = set().union(*(sink.known() for sink in self.sinks))
+        except OSError as error:
+            known = set()
+            self.error = error
+        self.monitor = AlertMonitor(rules, known)
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def submit(self, portfolio):
+        """Evaluate a version of the site data (only if it is new) and send the new alerts to the sinks"""
+        with self.lock:
+            if self.monitor.portfolio is not None and self.monitor.portfolio.version == portfolio.version:
+                return []
+            alerts = self.monitor.update(portfolio)
+        for sink in self.sinks:
+            sink.write(alerts)
+        return alerts
+
+    def reload_rules(self):
+        """Switch to the rules file if it changed since it was last read (an unreadable file keeps the current rules)"""
+        rules_modified = file_modified(self.rules_path)
+        if rules_modified == self.rules_modified:
+            return
+        self.rules_modified = rules_modified
+        try:
+            rules = load_rules(self.rules_path)
+        except (ValueError, OSError) as error:
+            self.error = self.rules_error = error
+            return
+        with self.lock:
+            self.monitor.set_rules(rules)
+        self.error = self.rules_error = None
+
+    def check(self):
+        """Reload the rules and site data if their files changed, and evaluate them"""
+        self.reload_rules()
+        try:
+            # A rollback changes the snapshot manifest, not the usage file
+            modified = (file_modified(SITES_FILE), file_modified(USAGE_FILE), file_modified(MANIFEST_FILE))
+            if modified != self.modified or self.monitor.portfolio is None:
+                alerts = self.submit(self.load())
+                self.modified = modified
+                self.error = self.rules_error
+                return alerts
+        except (ValueError, OSError) as error:
+            self.error = error
+        return []
+
+    def run(self):
+        while True:
+            self.check()
+            if self.stopped.wait(self.interval):
+                break
+
+    def start(self):
+        """Start checking in a daemon thread (once)"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='alert-scheduler', daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the site data against the alert rules and append new alerts to a file")
+    parser.add_argument('--interval', type=float, default=CHECK_INTERVAL, help="seconds between checks for changed data")
+    parser.add_argument('--output', default=ALERTS_FILE, help="JSON-lines file the alerts are appended to")
+    parser.add_argument('--once', action='store_true', help="check once and exit")
+    args = parser.parse_args()
+
+    scheduler = AlertScheduler([FileSink(args.output)], interval=args.interval)
+    if args.once:
+        alerts = scheduler.check()
+        if scheduler.error is not None:
+            parser.exit(1, f"{scheduler.error}\n")
+        print(f"{len(alerts)} new alerts, {len(scheduler.monitor.active_alerts())} firing")
+        return
+
+    print(f"Checking every {args.interval:g} s, writing alerts to {args.output}")
+    scheduler.start()
+    try:
+        while scheduler.thread.is_alive():
+            scheduler.thread.join(1)
+            if scheduler.error is not None:
+                print(f"Check failed: {scheduler.error}")
+                scheduler.error = None
+    except KeyboardInterrupt:
+        scheduler.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from anomalies import AnomalyEngine
+from core import DATA_DIR, DEFAULT_SITE, data_version
+from kpis import KpiEngine, KpiSnapshot
+from records import FIELDS, YearlyRecords
+from results_store import ResultsStore
+from rolling import rolling_mean
+from validation import validate_yearly
+
+# Built-in yearly data of the dashboard's site
+USAGE_DATA = [
+    {"year": 1998, "totalUsage": 4765600, "totalCost": 423102.07, "costPerKwh": 0.08878, "usageChange": 0, "costChange": 0, "rateChange": 0},
+    {"year": 1999, "totalUsage": 7673400, "totalCost": 671438.68, "costPerKwh": 0.0875, "usageChange": 61, "costChange": 58.7, "rateChange": -1.4},
+    {"year": 2000, "totalUsage": 7786800, "totalCost": 676049.56, "costPerKwh": 0.08682, "usageChange": 1.5, "costChange": 0.7, "rateChange": -0.8},
+    {"year": 2001, "totalUsage": 7840000, "totalCost": 690162.8, "costPerKwh": 0.08803, "usageChange": 0.7, "costChange": 2.1, "rateChange": 1.4},
+    {"year": 2002, "totalUsage": 8703800, "totalCost": 683468.49, "costPerKwh": 0.07853, "usageChange": 11, "costChange": -1, "rateChange": -10.8},
+    {"year": 2003, "totalUsage": 9065000, "totalCost": 749578.02, "costPerKwh": 0.08269, "usageChange": 4.1, "costChange": 9.7, "rateChange": 5.3},
+    {"year": 2004, "totalUsage": 9366000, "totalCost": 772713.61, "costPerKwh": 0.0825, "usageChange": 3.3, "costChange": 3.1, "rateChange": -0.2},
+    {"year": 2005, "totalUsage": 8947400, "totalCost": 850074.84, "costPerKwh": 0.09501, "usageChange": -4.5, "costChange": 10, "rateChange": 15.2},
+    {"year": 2006, "totalUsage": 8850800, "totalCost": 843114.19, "costPerKwh": 0.09526, "usageChange": -1.1, "costChange": -0.8, "rateChange": 0.3},
+    {"year": 2007, "totalUsage": 8869301, "totalCost": 830936.51, "costPerKwh": 0.09369, "usageChange": 0.2, "costChange": -1.4, "rateChange": -1.6},
+    {"year": 2008, "totalUsage": 8490312, "totalCost": 825909.05, "costPerKwh": 0.09728, "usageChange": -4.3, "costChange": -0.6, "rateChange": 3.8},
+    {"year": 2009, "totalUsage": 8026327, "totalCost": 542203.96, "costPerKwh": 0.06755, "usageChange": -5.5, "costChange": -34.4, "rateChange": -30.6},
+    {"year": 2010, "totalUsage": 8046772, "totalCost": 564842.44, "costPerKwh": 0.07019, "usageChange": 0.3, "costChange": 4.2, "rateChange": 3.9},
+    {"year": 2011, "totalUsage": 8091665, "totalCost": 494064.46, "costPerKwh": 0.06106, "usageChange": 0.6, "costChange": -12.5, "rateChange": -13},
+    {"year": 2012, "totalUsage": 8080384, "totalCost": 480434.92, "costPerKwh": 0.05946, "usageChange": -0.1, "costChange": -2.8, "rateChange": -2.6},
+    {"year": 2013, "totalUsage": 8061741, "totalCost": 588484.89, "costPerKwh": 0.073, "usageChange": -0.2, "costChange": 22.5, "rateChange": 22.8},
+    {"year": 2014, "totalUsage": 8140087, "totalCost": 683455, "costPerKwh": 0.08, "usageChange": 1, "costChange": 16.1, "rateChange": 9.6},
+    {"year": 2015, "totalUsage": 8750364, "totalCost": 560007, "costPerKwh": 0.06, "usageChange": 7.5, "costChange": -18.1, "rateChange": -25},
+    {"year": 2016, "totalUsage": 8697231, "totalCost": 460245, "costPerKwh": 0.05, "usageChange": -0.6, "costChange": -17.8, "rateChange": -16.7},
+    {"year": 2017, "totalUsage": 8255345, "totalCost": 425453, "costPerKwh": 0.05, "usageChange": -5.1, "costChange": -7.6, "rateChange": 0},
+    {"year": 2018, "totalUsage": 8636427, "totalCost": 475236, "costPerKwh": 0.06, "usageChange": 4.6, "costChange": 11.7, "rateChange": 20},
+    {"year": 2019, "totalUsage": 8418866, "totalCost": 419129, "costPerKwh": 0.05, "usageChange": -2.5, "costChange": -11.8, "rateChange": -16.7},
+    {"year": 2020, "totalUsage": 6754261, "totalCost": 327728, "costPerKwh": 0.05, "usageChange": -19.8, "costChange": -21.8, "rateChange": 0}
+]
+
+# Optional yearly billing data of the dashboard's site (year, totalUsage, totalCost), used instead of the built-in rows
+USAGE_FILE = os.path.join(DATA_DIR, 'usage.csv')
+
+# Optional yearly data for more sites: site, year, totalUsage, totalCost (costPerKwh and change columns are derived if missing)
+SITES_FILE = os.path.join(DATA_DIR, 'sites.csv')
+
+# Series screened for anomalies, with their display names
+ANOMALY_SERIES = {
+    'totalUsage': "Usage",
+    'totalCost': "Cost",
+    'costPerKwh': "Rate",
+    'usageChange': "Usage change",
+    'costChange': "Cost change",
+    'rateChange': "Rate change"
+}
+
+
+def complete_rows(df):
+    """Validate a yearly frame, filling in the rate and year-over-year change columns if they are missing"""
+    return validate_yearly(df)[0][list(FIELDS)]
+
+
+def load_usage(path=USAGE_FILE):
+    """Read the dashboard site's yearly data, or return the built-in rows if there is no file"""
+    if not os.path.exists(path):
+        return pd.DataFrame(USAGE_DATA)
+    return pd.read_csv(path)
+
+
+def load_sites(path=SITES_FILE):
+    """Read per-site yearly data, returning {site: list of row dicts} (empty if there is no file)"""
+    if not os.path.exists(path):
+        return {}
+    # Validate every site in one pass before splitting the rows up
+    df, _ = validate_yearly(pd.read_csv(path, dtype={'site': str}))
+    return {site: rows.drop(columns='site').to_dict('records') for site, rows in df.groupby('site', sort=True)}
+
+
+class UsageAnalytics:
+    """Yearly data, statistics, KPIs and insight verdicts of one site, shared by the dashboard and the query service"""
+    
+    def __init__(self, data=None, site=DEFAULT_SITE, results_store=None, anomaly_engine=None, kpi_engine=None):
+        # Initialize the data
+        self.site = site
+        self.data = USAGE_DATA if data is None else data
+        
+        # Convert to DataFrame, sorted, merged and checked (clean data passes through unchanged)
+        self.df, self.validation = validate_yearly(pd.DataFrame(self.data))
+        
+        # Compact columnar copy for fast first/previous/latest lookups
+        self.records = YearlyRecords.from_frame(self.df)
+        
+        # Fingerprint of the data, used to key every engine cache
+        self.data_version = data_version(self.df)
+        
+        # Results saved by earlier runs; loading them up front lets a restarted server skip recomputing
+        self.results_store = ResultsStore() if results_store is None else results_store
+        self.results_store.warm(self.data_version)
+        
+        # Anomaly detection (the flagged-period index is cached per data version and method)
+        self.anomaly_engine = AnomalyEngine() if anomaly_engine is None else anomaly_engine
+        
+        # KPI card values (snapshots are cached per site and year range)
+        self.kpi_engine = KpiEngine() if kpi_engine is None else kpi_engine
+        
+        # Calculate statistics (or reuse the stored ones)
+        self.full_range = (int(self.records.first['year']), int(self.records.latest['year']))
+        self.stats = self.results_store.get_or_compute(self.site, self.full_range, self.data_version, 'stats', self.calculate_stats)
+    
+    def calculate_stats(self):
+        """Calculate key statistics from the data"""
+        stats = {}
+        
+        # Basic statistics
+        stats['total_usage'] = self.df['totalUsage'].sum()
+        stats['avg_usage'] = self.df['totalUsage'].mean()
+        stats['total_cost'] = self.df['totalCost'].sum()
+        stats['avg_cost'] = self.df['totalCost'].mean()
+        stats['avg_rate'] = self.df['costPerKwh'].mean()
+        
+        # Max and min values
+        stats['max_usage'] = self.df['totalUsage'].max()
+        stats['max_usage_year'] = int(self.df.loc[self.df['totalUsage'].idxmax(), 'year'])
+        
+        stats['min_usage'] = self.df['totalUsage'].min()
+        stats['min_usage_year'] = int(self.df.loc[self.df['totalUsage'].idxmin(), 'year'])
+        
+        stats['max_cost'] = self.df['totalCost'].max()
+        stats['max_cost_year'] = int(self.df.loc[self.df['totalCost'].idxmax(), 'year'])
+        
+        stats['min_cost'] = self.df['totalCost'].min()
+        stats['min_cost_year'] = int(self.df.loc[self.df['totalCost'].idxmin(), 'year'])
+        
+        stats['max_rate'] = self.df['costPerKwh'].max()
+        stats['max_rate_year'] = int(self.df.loc[self.df['costPerKwh'].idxmax(), 'year'])
+        
+        stats['min_rate'] = self.df['costPerKwh'].min()
+        stats['min_rate_year'] = int(self.df.loc[self.df['costPerKwh'].idxmin(), 'year'])
+        
+        # Long-term trends
+        first_year = self.records.first
+        last_year = self.records.latest
+        
+        stats['usage_change_pct'] = ((last_year['totalUsage'] - first_year['totalUsage']) / first_year['totalUsage']) * 100
+        stats['cost_change_pct'] = ((last_year['totalCost'] - first_year['totalCost']) / first_year['totalCost']) * 100
+        stats['rate_change_pct'] = ((last_year['costPerKwh'] - first_year['costPerKwh']) / first_year['costPerKwh']) * 100
+        
+        # Largest single-year changes
+        stats['max_usage_increase'] = self.df['usageChange'].max()
+        stats['max_usage_increase_year'] = int(self.df.loc[self.df['usageChange'].idxmax(), 'year'])
+        
+        stats['max_usage_decrease'] = self.df['usageChange'].min()
+        stats['max_usage_decrease_year'] = int(self.df.loc[self.df['usageChange'].idxmin(), 'year'])
+        
+        stats['max_cost_increase'] = self.df['costChange'].max()
+        stats['max_cost_increase_year'] = int(self.df.loc[self.df['costChange'].idxmax(), 'year'])
+        
+        stats['max_cost_decrease'] = self.df['costChange'].min()
+        stats['max_cost_decrease_year'] = int(self.df.loc[self.df['costChange'].idxmin(), 'year'])
+        
+        # Correlation between usage and cost
+        stats['usage_cost_correlation'] = self.df['totalUsage'].corr(self.df['totalCost'])
+        
+        return stats
+    
+    def format_number(self, num):
+        """Format large numbers with commas"""
+        return f"{int(num):,}"
+    
+    def format_currency(self, num):
+        """Format currency values"""
+        return f"${num:,.2f}"
+    
+    def format_rate(self, num):
+        """Format rate values (cost per kWh)"""
+        return f"${num:.5f}"
+    
+    def format_percent(self, num):
+        """Format percentage values"""
+        return f"{num:.1f}%"
+    
+    def select(self, year_range):
+        """Return the rows of a year range as a DataFrame and as records"""
+        df = self.df[(self.df['year'] >= year_range[0]) & (self.df['year'] <= year_range[1])].copy()
+        return df, self.records.between(*year_range)
+    
+    def get_kpis(self, year_range):
+        """Return the KPI snapshot of a year range (stored per site and year range)"""
+        return KpiSnapshot.from_dict(self.results_store.get_or_compute(
+            self.site, year_range, self.data_version, 'kpis',
+            lambda: self.kpi_engine.snapshot(self.records, self.site, year_range, self.data_version)._asdict()
+        ))
+    
+    def get_yoy_extremes(self, df):
+        """Largest year-over-year increase and decrease of usage, cost and rate in the given rows"""
+        columns = ['usageChange', 'costChange', 'rateChange']
+        # The first row's change is relative to a year outside the selection
+        changes = df[columns].to_numpy(dtype=np.float64)[1:]
+        years = df['year'].to_numpy()[1:]
+        if len(changes) == 0:
+            return {}
+        
+        highest, lowest = changes.argmax(axis=0), changes.argmin(axis=0)
+        return {
+            column: {
+                'max_increase': float(changes[highest[i], i]),
+                'max_increase_year': int(years[highest[i]]),
+                'max_decrease': float(changes[lowest[i], i]),
+                'max_decrease_year': int(years[lowest[i]])
+            }
+            for i, column in enumerate(columns)
+        }
+    
+    def get_anomaly_index(self, method):
+        """Return the index of flagged periods for every screened series"""
+        columns = list(ANOMALY_SERIES)
+        values = self.df[columns].to_numpy(dtype=np.float64).T
+        
+        # The first year has no previous year, so its change columns aren't real observations
+        values[3:, 0] = np.nan
+        
+        return self.anomaly_engine.detect(
+            [(self.site, column) for column in columns],
+            self.df['year'].to_numpy(),
+            values,
+            self.data_version,
+            method=method
+        )
+    
+    def get_annual_changes(self, df, year_range):
+        """Return the year-over-year % changes of usage, cost and rate for a year range (stored per range)"""
+        columns = ['totalUsage', 'totalCost', 'costPerKwh']
+        changes = self.results_store.get_or_compute(
+            self.site, year_range, self.data_version, 'changes',
+            lambda: {'year': df['year'].tolist(), **{col: df[col].pct_change().mul(100).tolist() for col in columns}}
+        )
+        return np.array([changes[col] for col in columns], dtype=np.float64)
+    
+    def compute_insights(self, df, records, anomalies=None, window=5):
+        """Build the insight verdicts for the selected years, grouped by section"""
+        sections = {'usage': [], 'cost': [], 'summary': [], 'anomalies': []}
+        year_range = (int(df['year'].min()), int(df['year'].max()))
+        
+        def add(section, title, verdict, detail=''):
+            sections[section].append({'title': title, 'verdict': verdict, 'detail': detail})
+        
+        # Average annual change over the most recent window of years (usage, cost, rate)
+        annual_changes = self.get_annual_changes(df, year_range)
+        recent_trend, recent_cost_trend, recent_rate_trend = rolling_mean(annual_changes, window - 1)[:, -1]
+        
+        # Calculate long-term trends
+        first_year = records.first
+        last_year = records.latest
+        span = f"over {last_year['year'] - first_year['year']} years"
+        pct_change_usage = ((last_year['totalUsage'] - first_year['totalUsage']) / first_year['totalUsage']) * 100
+        
+        # Insights about usage
+        add('usage', "Long-term usage trend",
+            'Increasing' if pct_change_usage > 5 else 'Decreasing' if pct_change_usage < -5 else 'Stable',
+            f"({self.format_percent(pct_change_usage)} {span})")
+        add('usage', "Peak usage year",
+            str(int(df.loc[df['totalUsage'].idxmax(), 'year'])),
+            f"with {self.format_number(df['totalUsage'].max())} kWh")
+        add('usage', "Recent usage vs peak",
+            self.format_percent(((last_year['totalUsage'] / df['totalUsage'].max()) - 1) * 100),
+            "compared to peak")
+        
+        if len(df) > window:
+            # Detect any obvious patterns
+            add('usage', f"Recent {window}-year trend",
+                'Increasing' if recent_trend > 1 else 'Decreasing' if recent_trend < -1 else 'Stable',
+                f"(avg {self.format_percent(recent_trend)} per year)")
+        
+        # Calculate cost trends
+        pct_change_cost = ((last_year['totalCost'] - first_year['totalCost']) / first_year['totalCost']) * 100
+        pct_change_rate = ((last_year['costPerKwh'] - first_year['costPerKwh']) / first_year['costPerKwh']) * 100
+        
+        # Flagged cost changes in the selected period drive the volatility verdict
+        cost_anomalies = int(anomalies.mask(self.site, 'costChange', df['year']).sum()) if anomalies is not None else 0
+        
+        # Usage vs cost comparison
+        usage_cost_ratio = pct_change_usage / pct_change_cost if pct_change_cost != 0 else 0
+        
+        # Insights about costs
+        add('cost', "Cost per kWh trend",
+            'Increasing' if pct_change_rate > 5 else 'Decreasing' if pct_change_rate < -5 else 'Stable',
+            f"({self.format_percent(pct_change_rate)} {span})")
+        add('cost', "Usage vs cost changes",
+            'Usage changes outpace cost changes' if abs(usage_cost_ratio) > 1.2 and usage_cost_ratio > 0 else
+            'Cost changes outpace usage changes' if abs(usage_cost_ratio) < 0.8 and usage_cost_ratio > 0 else
+            'Usage decreases while costs increase' if usage_cost_ratio < 0 and pct_change_usage < 0 and pct_change_cost > 0 else
+            'Usage increases while costs decrease' if usage_cost_ratio < 0 and pct_change_usage > 0 and pct_change_cost < 0 else
+            'Usage and cost changes are proportional')
+        add('cost', "Cost volatility",
+            'High' if cost_anomalies > 1 else 'Moderate' if cost_anomalies == 1 else 'Low',
+            f"(std dev: {df['costChange'].std():.1f}%, {cost_anomalies} unusual {'year' if cost_anomalies == 1 else 'years'})")
+        
+        if len(df) > window:
+            # Analyze recent cost trends
+            add('cost', "Recent cost trend",
+                'Increasing' if recent_cost_trend > 1 else 'Decreasing' if recent_cost_trend < -1 else 'Stable',
+                f"(avg {self.format_percent(recent_cost_trend)} per year)")
+        
+        # Calculate efficiency - has the rate of usage relative to cost improved?
+        first_year_efficiency = first_year['totalCost'] / first_year['totalUsage']
+        last_year_efficiency = last_year['totalCost'] / last_year['totalUsage']
+        efficiency_change = ((last_year_efficiency - first_year_efficiency) / first_year_efficiency) * 100
+        
+        # Overall insights
+        correlation = df['totalUsage'].corr(df['totalCost'])
+        usage_anomalies = int(anomalies.mask(self.site, 'usageChange', df['year']).sum()) if anomalies is not None else 0
+        
+        add('summary', "Overall efficiency change",
+            'Improved' if efficiency_change < -5 else 'Worsened' if efficiency_change > 5 else 'Remained stable',
+            f"({self.format_percent(-efficiency_change)} {span})")
+        add('summary', "Usage-cost relationship",
+            'Strong correlation between usage and cost suggests billing is primarily usage-based.' if correlation > 0.7 else
+            'Moderate correlation suggests other factors besides usage significantly affect cost.' if correlation > 0.4 else
+            'Weak correlation indicates cost is largely independent of usage, suggesting fixed costs or rate changes are dominant factors.')
+        add('summary', "Cost-saving opportunities",
+            'Significant decreases in usage have not always led to proportional cost savings, suggesting investigating rate structures could yield benefits.'
+                if pct_change_usage < -10 and pct_change_cost > pct_change_usage else
+            'Cost per kWh has increased significantly over time, suggesting exploring alternative rate plans or energy efficiency measures.'
+                if pct_change_rate > 15 else
+            'Usage patterns show opportunities for potential load shifting or demand management to reduce costs.'
+                if usage_anomalies > 0 else
+            'Relatively stable usage and costs suggest focusing on long-term efficiency measures for gradual improvements.')
+        
+        # List the flagged periods in the selected range
+        if anomalies is not None:
+            flagged = anomalies.records(self.site, year_range[0], year_range[1])
+            
+            if not flagged:
+                add('anomalies', "", "No unusual periods were detected in the selected years.")
+            
+            for record in flagged:
+                add('anomalies', f"{ANOMALY_SERIES[record['metric']]} in {record['period']}",
+                    f"unusually {'high' if record['score'] > 0 else 'low'}",
+                    f"(score {record['score']:+.1f}, threshold ±{anomalies.threshold:.1f})")
+        
+        return sections
+    
+    def compute_emissions_insights(self, df):
+        """Build the emissions verdicts for the selected years with emissions data"""
+        items = []
+        rows = df[df['totalEmissions'].notna()]
+        first, last = rows.iloc[0], rows.iloc[-1]
+        span = f"over {int(last['year'] - first['year'])} years"
+        
+        pct_change_emissions = (last['totalEmissions'] / first['totalEmissions'] - 1) * 100
+        pct_change_intensity = (last['emissionsPerKwh'] / first['emissionsPerKwh'] - 1) * 100
+        items.append({'title': "Emissions trend",
+                      'verdict': 'Increasing' if pct_change_emissions > 5 else 'Decreasing' if pct_change_emissions < -5 else 'Stable',
+                      'detail': f"({self.format_percent(pct_change_emissions)} {span})"})
+        items.append({'title': "Emissions per kWh trend",
+                      'verdict': 'Increasing' if pct_change_intensity > 5 else 'Decreasing' if pct_change_intensity < -5 else 'Stable',
+                      'detail': f"({last['emissionsPerKwh']:.3f} kg CO2e per kWh in {int(last['year'])}, {self.format_percent(pct_change_intensity)} {span})"})
+        
+        # Split the change into the part from usage (at the first year's rate) and the part from the grid mix
+        usage_effect = (last['totalUsage'] - first['totalUsage']) * first['emissionsPerKwh'] / 1000
+        grid_effect = last['totalUsage'] * (last['emissionsPerKwh'] - first['emissionsPerKwh']) / 1000
+        if len(rows) > 1:
+            items.append({'title': "Main driver of the change",
+                          'verdict': ('Usage changes' if abs(usage_effect) > abs(grid_effect) else 'Grid carbon intensity'),
+                          'detail': f"({usage_effect:+,.0f} tCO2e from usage, {grid_effect:+,.0f} tCO2e from the grid mix)"})
+        return items
+    
+    def get_emissions_insights(self, df, intensity_version):
+        """Return the emissions verdicts for the selected years (stored per site, year range, data and intensity version)"""
+        year_range = (int(df['year'].min()), int(df['year'].max()))
+        return self.results_store.get_or_compute(
+            self.site, year_range, self.data_version, f"emissions-insights/{intensity_version}",
+            lambda: self.compute_emissions_insights(df)
+        )
+    
+    def get_insights(self, df, records, anomalies=None, window=5):
+        """Return the insight verdicts for the selected years (stored per site, year range and data version)"""
+        year_range = (int(df['year'].min()), int(df['year'].max()))
+        kind = f"insights/{anomalies.method if anomalies is not None else 'none'}/{window}"
+        return self.results_store.get_or_compute(
+            self.site, year_range, self.data_version, kind,
+            lambda: self.compute_insights(df, records, anomalies, window)
+        )
@@ -0,0 +1,171 @@
+import numpy as np
+
+from rolling import rolling_mean, rolling_std
+
+# Detection methods the engine supports
+METHODS = {
+    'mad': "Median / MAD",
+    'zscore': "Rolling z-score",
+    'seasonal': "Seasonal residual"
+}
+
+# Score magnitude above which a period is flagged, per method
+DEFAULT_THRESHOLDS = {'mad': 3.5, 'zscore': 3.0, 'seasonal': 3.5}
+
+# Scale factor that makes the MAD consistent with the standard deviation of normal data
+MAD_SCALE = 0.6745
+
+
+def rolling_zscore(values, window=5):
+    """Score each value against the mean and std of the `window` values before it"""
+    values = np.asarray(values, dtype=np.float64)
+
+    # Shift by one period so each value is compared with the window that precedes it
+    prior = np.concatenate([np.full((len(values), 1), np.nan), values[:, :-1]], axis=1)
+    mean = rolling_mean(prior, window, min_periods=3)
+    std = rolling_std(prior, window, min_periods=3)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scores = (values - mean) / std
+
+    # Need some spread in the window before a score means anything
+    return np.where(std > 0, scores, np.nan)
+
+
+def mad_scores(values):
+    """Robust (modified) z-scores based on each row's median and median absolute deviation"""
+    values = np.asarray(values, dtype=np.float64)
+    median = np.nanmedian(values, axis=1, keepdims=True)
+    deviation = np.abs(values - median)
+    mad = np.nanmedian(deviation, axis=1, keepdims=True)
+
+    # Fall back to the mean absolute deviation when more than half the values are identical
+    mean_deviation = np.nanmean(deviation, axis=1, keepdims=True) * 1.2533
+    scale = np.where(mad > 0, mad / MAD_SCALE, mean_deviation)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scores = (values - median) / scale
+    return np.where(scale > 0, scores, np.nan)
+
+
+def detrend(values):
+    """Remove each row's least-squares linear trend, ignoring missing values"""
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    t = np.broadcast_to(np.arange(values.shape[1], dtype=np.float64), values.shape)
+
+    # Closed-form slope and intercept for every row at once
+    n = valid.sum(axis=1, keepdims=True)
+    t_mean = np.where(valid, t, 0).sum(axis=1, keepdims=True) / np.maximum(n, 1)
+    y_mean = np.where(valid, values, 0).sum(axis=1, keepdims=True) / np.maximum(n, 1)
+    dt = np.where(valid, t - t_mean, 0)
+    dy = np.where(valid, values - y_mean, 0)
+    denominator = (dt ** 2).sum(axis=1, keepdims=True)
+    slope = np.divide((dt * dy).sum(axis=1, keepdims=True), denominator, out=np.zeros_like(denominator), where=denominator > 0)
+
+    return values - (y_mean + slope * (t - t_mean))
+
+
+def seasonal_residual_scores(values, season_length=None):
+    """Robust scores of what is left after removing the trend and the seasonal profile"""
+    residual = detrend(values)
+
+    if season_length and season_length > 1 and residual.shape[1] >= 2 * season_length:
+        # Fold each row into (cycles, season) and subtract the median of each season position
+        n_series, n_periods = residual.shape
+        n_cycles = -(-n_periods // season_length)
+        padded = np.full((n_series, n_cycles * season_length), np.nan)
+        padded[:, :n_periods] = residual
+        folded = padded.reshape(n_series, n_cycles, season_length)
+        folded = folded - np.nanmedian(folded, axis=1, keepdims=True)
+        residual = folded.reshape(n_series, -1)[:, :n_periods]
+
+    return mad_scores(residual)
+
+
+def score(values, method='mad', window=5, season_length=None):
+    """Anomaly scores for every row and period using the chosen method"""
+    if method == 'mad':
+        return mad_scores(values)
+    if method == 'zscore':
+        return rolling_zscore(values, window)
+    if method == 'seasonal':
+        return seasonal_residual_scores(values, season_length)
+    raise ValueError(f"Unknown anomaly method '{method}', expected one of {list(METHODS)}")
+
+
+class AnomalyIndex:
+    """Flagged periods for many (site, metric) series, stored in compressed-row form"""
+
+    def __init__(self, keys, periods, scores, threshold, method=None):
+        self.keys = list(keys)
+        self.positions = {key: i for i, key in enumerate(self.keys)}
+        self.threshold = threshold
+        self.method = method
+
+        # np.nonzero walks row by row, so each series' flags are one contiguous slice
+        flags = np.abs(np.nan_to_num(scores)) > threshold
+        rows, cols = np.nonzero(flags)
+        self.offsets = np.searchsorted(rows, np.arange(len(self.keys) + 1))
+        self.periods = np.asarray(periods)[cols]
+        self.scores = scores[rows, cols]
+
+    def __len__(self):
+        return len(self.periods)
+
+    def lookup(self, site, metric):
+        """Return the flagged periods and their scores for one series"""
+        i = self.positions.get((site, metric))
+        if i is None:
+            return self.periods[:0], self.scores[:0]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.periods[start:end], self.scores[start:end]
+
+    def mask(self, site, metric, periods):
+        """Boolean mask marking which of `periods` are flagged for a series"""
+        flagged, _ = self.lookup(site, metric)
+        return np.isin(np.asarray(periods), flagged)
+
+    def is_flagged(self, site, metric, period):
+        """Whether a single period is flagged for a series"""
+        flagged, _ = self.lookup(site, metric)
+        return bool(np.any(flagged == period))
+
+    def records(self, site=None, start=None, end=None):
+        """List flagged periods, most extreme first, optionally limited to a site and period range"""
+        records = []
+        for key_site, metric in self.keys:
+            if site is not None and key_site != site:
+                continue
+            periods, scores = self.lookup(key_site, metric)
+            keep = np.ones(len(periods), dtype=bool)
+            if start is not None:
+                keep &= periods >= start
+            if end is not None:
+                keep &= periods <= end
+            records.extend(
+                {'site': key_site, 'metric': metric, 'period': period, 'score': float(value)}
+                for period, value in zip(periods[keep].tolist(), scores[keep])
+            )
+        return sorted(records, key=lambda record: -abs(record['score']))
+
+
+class AnomalyEngine:
+    """Scores all series in one vectorized pass and caches the resulting index"""
+
+    def __init__(self):
+        # (series keys, data version, method, threshold, window, season length) -> AnomalyIndex
+        self.cache = {}
+
+    def detect(self, keys, periods, values, version, method='mad', threshold=None, window=5, season_length=None):
+        """Return the anomaly index for the given series, reusing it if already built"""
+        if method not in METHODS:
+            raise ValueError(f"Unknown anomaly method '{method}', expected one of {list(METHODS)}")
+
+        threshold = DEFAULT_THRESHOLDS[method] if threshold is None else threshold
+        cache_key = (tuple(keys), version, method, threshold, window, season_length)
+
+        if cache_key not in self.cache:
+            scores = score(values, method, window, season_length)
+            self.cache[cache_key] = AnomalyIndex(keys, periods, scores, threshold, method)
+        return self.cache[cache_key]
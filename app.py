@@ -4,6 +4,33 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import numpy as np
+import os
+import calendar
+import functools
+import html
+import streamlit.components.v1 as components
+
+from alerts import ALERTS_FILE, AlertScheduler, FileSink, load_site_data
+from analytics import ANOMALY_SERIES, SITES_FILE, USAGE_FILE, UsageAnalytics
+from anomalies import METHODS as ANOMALY_METHODS, AnomalyEngine
+from budgets import BUDGETS_FILE, BudgetEngine, load_budgets, yearly_variance
+from bucketing import BILLING_CYCLES_FILE, MIN_COVERAGE, BucketEngine, billing_cycles, calendar_years, fiscal_years, load_billing_reads
+from chart_payloads import PayloadCache, install_plotly_js
+from compression import INTERVALS_STORE, load_compressed_intervals
+from core import DEFAULT_SITE, TIMEZONE, data_version, file_modified
+from demand import DEMAND_WINDOWS, TOP_K, DemandEngine
+from emissions import GRID_INTENSITY_FILE, GRID_INTENSITY_PARQUET, EmissionsEngine, add_emissions, load_grid_intensity
+from forecasting import MIN_PERIODS, MODELS, ForecastEngine
+from hierarchy import HIERARCHY_FILE, HierarchyEngine, load_hierarchy
+from intervals import INTERVALS_FILE, load_intervals
+from kpis import KpiEngine
+from portfolio import LEADERBOARD_METRICS, PortfolioEngine, load_portfolio
+from results_store import ResultsStore
+from rolling import RollingEngine
+from scenarios import Scenario, ScenarioEngine
+from seasonal import SeasonalEngine
+from snapshots import SnapshotStore, commit_usage
+from weather import DEGREE_DAYS_FILE, WeatherEngine, load_degree_days
 
 # Set page configuration - using a dark theme for electric visualization
 st.set_page_config(
@@ -177,113 +204,231 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Line colors for what-if scenario overlays
+SCENARIO_COLORS = ['#ff9e00', '#48bfe3', '#f72585', '#80ffdb', '#ffd60a']
+
+# Most active alerts listed under the insights
+MAX_SHOWN_ALERTS = 5
+
+# Chart frontend that takes figures with base64 typed-array trace data, drawn by the installed plotly's plotly.js
+PLOTLY_COMPONENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "plotly_payload")
+install_plotly_js(PLOTLY_COMPONENT_DIR)
+plotly_payload_chart = components.declare_component("plotly_payload_chart", path=PLOTLY_COMPONENT_DIR)
+
+# Engines are cached across reruns so results that were already computed are reused
+@st.cache_resource
+def get_scenario_engine():
+    """Return the shared scenario engine"""
+    return ScenarioEngine()
+
+@st.cache_resource
+def get_forecast_engine():
+    """Return the shared forecasting engine"""
+    return ForecastEngine()
+
+@st.cache_resource
+def get_anomaly_engine():
+    """Return the shared anomaly detection engine"""
+    return AnomalyEngine()
+
+@st.cache_resource
+def get_rolling_engine():
+    """Return the shared rolling-statistics engine"""
+    return RollingEngine()
+
+@st.cache_resource
+def get_payload_cache():
+    """Return the shared cache of encoded chart data"""
+    return PayloadCache()
+
+@st.cache_resource
+def get_kpi_engine():
+    """Return the shared KPI engine"""
+    return KpiEngine()
+
+@st.cache_resource
+def get_seasonal_engine():
+    """Return the shared seasonal-profile engine"""
+    return SeasonalEngine()
+
+@st.cache_resource
+def get_demand_engine():
+    """Return the shared peak-demand engine"""
+    return DemandEngine()
+
+@st.cache_resource
+def get_weather_engine():
+    """Return the shared weather-normalization engine"""
+    return WeatherEngine()
+
+@st.cache_resource
+def get_emissions_engine():
+    """Return the shared grid-intensity join and emissions engine"""
+    return EmissionsEngine()
+
+@st.cache_resource
+def get_portfolio_engine():
+    """Return the shared site-comparison engine"""
+    return PortfolioEngine()
+
+@st.cache_resource
+def get_bucket_engine():
+    """Return the shared billing-period and fiscal-year bucketing engine"""
+    return BucketEngine()
+
+@st.cache_resource
+def get_hierarchy_engine():
+    """Return the shared meter hierarchy rollup engine"""
+    return HierarchyEngine()
+
+@st.cache_resource
+def get_alert_scheduler():
+    """Return the background alert scheduler (started once per server, reading the shared data versions)"""
+    return AlertScheduler([FileSink(ALERTS_FILE)], load=functools.partial(load_site_data, get_snapshot_store())).start()
+
+@st.cache_resource
+def get_budget_engine():
+    """Return the shared budget tracking engine"""
+    return BudgetEngine()
+
+@st.cache_resource
+def get_results_store():
+    """Return the shared persistent results store"""
+    return ResultsStore()
+
+@st.cache_resource
+def get_interval_data(modified, store_modified):
+    """Return the interval readings from the data folder: the CSV file, else the compressed store (reloaded when either changes)"""
+    intervals = load_intervals(INTERVALS_FILE)
+    if intervals is None:
+        store = load_compressed_intervals(INTERVALS_STORE)
+        intervals = store.read() if store is not None else None
+    return intervals
+
+@st.cache_resource
+def get_degree_days(modified):
+    """Return the daily degree days from the data folder (reloaded when the file changes)"""
+    return load_degree_days(DEGREE_DAYS_FILE)
+
+@st.cache_resource
+def get_grid_intensity(modified, parquet_modified):
+    """Return the hourly grid carbon intensity from the data folder (reloaded when the file changes)"""
+    return load_grid_intensity(GRID_INTENSITY_FILE, GRID_INTENSITY_PARQUET)
+
+@st.cache_resource
+def get_billing_reads(modified):
+    """Return the meter-read dates from the data folder (reloaded when the file changes)"""
+    return load_billing_reads(BILLING_CYCLES_FILE)
+
+@st.cache_resource
+def get_budgets(modified):
+    """Return the budgets from the data folder (reloaded when the file changes)"""
+    return load_budgets(BUDGETS_FILE)
+
+@st.cache_resource
+def get_portfolio(modified, version):
+    """Return the yearly data of the sites file plus one version of the dashboard's site (reloaded when the file changes)"""
+    return load_portfolio(SITES_FILE, base=get_snapshot_store().frame(version).assign(site=DEFAULT_SITE))
+
+@st.cache_resource
+def get_hierarchy(modified):
+    """Return the meter hierarchy from the data folder (reloaded when the file changes)"""
+    return load_hierarchy(HIERARCHY_FILE)
+
+@st.cache_resource
+def get_snapshot_store():
+    """Return the shared store of yearly data versions"""
+    return SnapshotStore()
+
+@st.cache_resource
+def get_usage_snapshot(modified):
+    """Snapshot the dashboard site's yearly data (a new version only when the file's rows changed, so rollbacks last)"""
+    return commit_usage(get_snapshot_store())
+
 # Create our Electric Usage Dashboard class
-class ElectricUsageDashboard:
+class ElectricUsageDashboard(UsageAnalytics):
     def __init__(self):
-        # Initialize the data
-        self.data = [
-            {"year": 1998, "totalUsage": 4765600, "totalCost": 423102.07, "costPerKwh": 0.08878, "usageChange": 0, "costChange": 0, "rateChange": 0},
-            {"year": 1999, "totalUsage": 7673400, "totalCost": 671438.68, "costPerKwh": 0.0875, "usageChange": 61, "costChange": 58.7, "rateChange": -1.4},
-            {"year": 2000, "totalUsage": 7786800, "totalCost": 676049.56, "costPerKwh": 0.08682, "usageChange": 1.5, "costChange": 0.7, "rateChange": -0.8},
-            {"year": 2001, "totalUsage": 7840000, "totalCost": 690162.8, "costPerKwh": 0.08803, "usageChange": 0.7, "costChange": 2.1, "rateChange": 1.4},
-            {"year": 2002, "totalUsage": 8703800, "totalCost": 683468.49, "costPerKwh": 0.07853, "usageChange": 11, "costChange": -1, "rateChange": -10.8},
-            {"year": 2003, "totalUsage": 9065000, "totalCost": 749578.02, "costPerKwh": 0.08269, "usageChange": 4.1, "costChange": 9.7, "rateChange": 5.3},
-            {"year": 2004, "totalUsage": 9366000, "totalCost": 772713.61, "costPerKwh": 0.0825, "usageChange": 3.3, "costChange": 3.1, "rateChange": -0.2},
-            {"year": 2005, "totalUsage": 8947400, "totalCost": 850074.84, "costPerKwh": 0.09501, "usageChange": -4.5, "costChange": 10, "rateChange": 15.2},
-            {"year": 2006, "totalUsage": 8850800, "totalCost": 843114.19, "costPerKwh": 0.09526, "usageChange": -1.1, "costChange": -0.8, "rateChange": 0.3},
-            {"year": 2007, "totalUsage": 8869301, "totalCost": 830936.51, "costPerKwh": 0.09369, "usageChange": 0.2, "costChange": -1.4, "rateChange": -1.6},
-            {"year": 2008, "totalUsage": 8490312, "totalCost": 825909.05, "costPerKwh": 0.09728, "usageChange": -4.3, "costChange": -0.6, "rateChange": 3.8},
-            {"year": 2009, "totalUsage": 8026327, "totalCost": 542203.96, "costPerKwh": 0.06755, "usageChange": -5.5, "costChange": -34.4, "rateChange": -30.6},
-            {"year": 2010, "totalUsage": 8046772, "totalCost": 564842.44, "costPerKwh": 0.07019, "usageChange": 0.3, "costChange": 4.2, "rateChange": 3.9},
-            {"year": 2011, "totalUsage": 8091665, "totalCost": 494064.46, "costPerKwh": 0.06106, "usageChange": 0.6, "costChange": -12.5, "rateChange": -13},
-            {"year": 2012, "totalUsage": 8080384, "totalCost": 480434.92, "costPerKwh": 0.05946, "usageChange": -0.1, "costChange": -2.8, "rateChange": -2.6},
-            {"year": 2013, "totalUsage": 8061741, "totalCost": 588484.89, "costPerKwh": 0.073, "usageChange": -0.2, "costChange": 22.5, "rateChange": 22.8},
-            {"year": 2014, "totalUsage": 8140087, "totalCost": 683455, "costPerKwh": 0.08, "usageChange": 1, "costChange": 16.1, "rateChange": 9.6},
-            {"year": 2015, "totalUsage": 8750364, "totalCost": 560007, "costPerKwh": 0.06, "usageChange": 7.5, "costChange": -18.1, "rateChange": -25},
-            {"year": 2016, "totalUsage": 8697231, "totalCost": 460245, "costPerKwh": 0.05, "usageChange": -0.6, "costChange": -17.8, "rateChange": -16.7},
-            {"year": 2017, "totalUsage": 8255345, "totalCost": 425453, "costPerKwh": 0.05, "usageChange": -5.1, "costChange": -7.6, "rateChange": 0},
-            {"year": 2018, "totalUsage": 8636427, "totalCost": 475236, "costPerKwh": 0.06, "usageChange": 4.6, "costChange": 11.7, "rateChange": 20},
-            {"year": 2019, "totalUsage": 8418866, "totalCost": 419129, "costPerKwh": 0.05, "usageChange": -2.5, "costChange": -11.8, "rateChange": -16.7},
-            {"year": 2020, "totalUsage": 6754261, "totalCost": 327728, "costPerKwh": 0.05, "usageChange": -19.8, "costChange": -21.8, "rateChange": 0}
-        ]
+        # Versions of the yearly data; the sidebar picks the one shown (the newest by default)
+        self.snapshots = get_snapshot_store()
+        get_usage_snapshot(file_modified(USAGE_FILE))
+        self.snapshot = self.snapshot_options().get(st.session_state.get('snapshot_version'), self.snapshots.latest)
+        
+        # Yearly data of every site (the shown version of the built-in site plus the optional sites file)
+        self.portfolio = get_portfolio(file_modified(SITES_FILE), self.snapshot.version)
+        
+        # Alert rules checked over every site in the background, always on the current version; freshly
+        # loaded site data is checked right away
+        self.alert_scheduler = get_alert_scheduler()
+        self.alert_scheduler.submit(get_portfolio(file_modified(SITES_FILE), self.snapshots.latest.version))
+        
+        # Optional meter hierarchy (None when there is no hierarchy file); every node's rollup is kept up to date
+        # as sites change, and the sidebar can switch the whole dashboard to one node
+        self.hierarchy = get_hierarchy(file_modified(HIERARCHY_FILE))
+        self.rollup = get_hierarchy_engine().rollup(self.hierarchy, self.portfolio) if self.hierarchy is not None else None
+        self.node = self.node_options().get(st.session_state.get('hierarchy_node'))
+        
+        # Data, statistics, KPIs and insights come from the shared analytics core (cached per data version)
+        super().__init__(
+            data=self.snapshots.frame(self.snapshot.version) if self.node is None else self.rollup.frame(self.node),
+            site=DEFAULT_SITE if self.node is None else self.node,
+            results_store=get_results_store(),
+            anomaly_engine=get_anomaly_engine(),
+            kpi_engine=get_kpi_engine()
+        )
         
-        # Convert to DataFrame for easier manipulation
-        self.df = pd.DataFrame(self.data)
+        # What-if scenario evaluation (results are cached by scenario parameters)
+        self.scenario_engine = get_scenario_engine()
         
-        # Calculate statistics
-        self.stats = self.calculate_stats()
-    
-    def calculate_stats(self):
-        """Calculate key statistics from the data"""
-        stats = {}
+        # Forecast models (fitted parameters are cached per site, metric and data version)
+        self.forecast_engine = get_forecast_engine()
         
-        # Basic statistics
-        stats['total_usage'] = self.df['totalUsage'].sum()
-        stats['avg_usage'] = self.df['totalUsage'].mean()
-        stats['total_cost'] = self.df['totalCost'].sum()
-        stats['avg_cost'] = self.df['totalCost'].mean()
-        stats['avg_rate'] = self.df['costPerKwh'].mean()
+        # Moving averages and rolling volatility (cached per data version, statistic and window)
+        self.rolling_engine = get_rolling_engine()
         
-        # Max and min values
-        stats['max_usage'] = self.df['totalUsage'].max()
-        stats['max_usage_year'] = int(self.df.loc[self.df['totalUsage'].idxmax(), 'year'])
+        # Encoded chart data, reused whenever the same series is shown again
+        self.payload_cache = get_payload_cache()
         
-        stats['min_usage'] = self.df['totalUsage'].min()
-        stats['min_usage_year'] = int(self.df.loc[self.df['totalUsage'].idxmin(), 'year'])
+        # What each chart's browser frame holds in this session, so reruns only send what changed
+        self.chart_deltas = st.session_state.get('chart_deltas', True)
+        self.chart_states = st.session_state.setdefault('chart_states', {})
+        self.chart_resyncs = st.session_state.setdefault('chart_resyncs', {})
+        self.chart_bytes = {}
         
-        stats['max_cost'] = self.df['totalCost'].max()
-        stats['max_cost_year'] = int(self.df.loc[self.df['totalCost'].idxmax(), 'year'])
+        # Optional interval meter readings (None when there is no interval file)
+        self.intervals = get_interval_data(file_modified(INTERVALS_FILE), file_modified(INTERVALS_STORE))
         
-        stats['min_cost'] = self.df['totalCost'].min()
-        stats['min_cost_year'] = int(self.df.loc[self.df['totalCost'].idxmin(), 'year'])
+        # Month x hour and day-type load profiles (precomputed for every site at once)
+        self.seasonal_engine = get_seasonal_engine()
         
-        stats['max_rate'] = self.df['costPerKwh'].max()
-        stats['max_rate_year'] = int(self.df.loc[self.df['costPerKwh'].idxmax(), 'year'])
+        # Rolling kW demand, top-k period peaks and load-duration curves (cached per site and period)
+        self.demand_engine = get_demand_engine()
         
-        stats['min_rate'] = self.df['costPerKwh'].min()
-        stats['min_rate_year'] = int(self.df.loc[self.df['costPerKwh'].idxmin(), 'year'])
+        # Optional daily heating/cooling degree days (None when there is no degree-day file)
+        self.degree_days = get_degree_days(file_modified(DEGREE_DAYS_FILE))
         
-        # Long-term trends
-        first_year = self.df.iloc[0]
-        last_year = self.df.iloc[-1]
+        # Usage ~ HDD + CDD regressions (all sites fitted in one batch, cached per data version)
+        self.weather_engine = get_weather_engine()
         
-        stats['usage_change_pct'] = ((last_year['totalUsage'] - first_year['totalUsage']) / first_year['totalUsage']) * 100
-        stats['cost_change_pct'] = ((last_year['totalCost'] - first_year['totalCost']) / first_year['totalCost']) * 100
-        stats['rate_change_pct'] = ((last_year['costPerKwh'] - first_year['costPerKwh']) / first_year['costPerKwh']) * 100
+        # Optional hourly grid carbon intensity (None when there is no intensity file)
+        self.grid_intensity = get_grid_intensity(file_modified(GRID_INTENSITY_FILE), file_modified(GRID_INTENSITY_PARQUET))
         
-        # Largest single-year changes
-        stats['max_usage_increase'] = self.df['usageChange'].max()
-        stats['max_usage_increase_year'] = int(self.df.loc[self.df['usageChange'].idxmax(), 'year'])
+        # Interval readings joined with the grid intensity, and yearly emission factors (cached per file version)
+        self.emissions_engine = get_emissions_engine()
         
-        stats['max_usage_decrease'] = self.df['usageChange'].min()
-        stats['max_usage_decrease_year'] = int(self.df.loc[self.df['usageChange'].idxmin(), 'year'])
+        # Site leaderboards (metrics of all sites at once, top-N lists patched when sites change)
+        self.portfolio_engine = get_portfolio_engine()
         
-        stats['max_cost_increase'] = self.df['costChange'].max()
-        stats['max_cost_increase_year'] = int(self.df.loc[self.df['costChange'].idxmax(), 'year'])
+        # Optional meter-read dates closing each billing cycle (None when there is no billing cycle file)
+        self.billing_reads = get_billing_reads(file_modified(BILLING_CYCLES_FILE))
         
-        stats['max_cost_decrease'] = self.df['costChange'].min()
-        stats['max_cost_decrease_year'] = int(self.df.loc[self.df['costChange'].idxmin(), 'year'])
+        # Interval readings re-bucketed into billing cycles and fiscal years (assignments cached per boundary set)
+        self.bucket_engine = get_bucket_engine()
         
-        # Correlation between usage and cost
-        stats['usage_cost_correlation'] = self.df['totalUsage'].corr(self.df['totalCost'])
+        # Optional budgets per site, year and month (None when there is no budget file)
+        self.budgets = get_budgets(file_modified(BUDGETS_FILE))
         
-        return stats
-    
-    def format_number(self, num):
-        """Format large numbers with commas"""
-        return f"{int(num):,}"
-    
-    def format_currency(self, num):
-        """Format currency values"""
-        return f"${num:,.2f}"
-    
-    def format_rate(self, num):
-        """Format rate values (cost per kWh)"""
-        return f"${num:.5f}"
-    
-    def format_percent(self, num):
-        """Format percentage values"""
-        return f"{num:.1f}%"
+        # Monthly budget tracking and year-end projections of every interval site (statuses cached per site and month)
+        self.budget_engine = get_budget_engine()
     
     def render_dashboard(self):
         """Main method to render the entire dashboard"""
@@ -291,48 +436,93 @@ class ElectricUsageDashboard:
         st.markdown('<h1 class="main-header">⚡ Electric Usage Analytics Dashboard</h1>', unsafe_allow_html=True)
         
         # Get options from sidebar
-        show_trend, normalize_data, year_range = self.render_sidebar()
+        show_trend, normalize_data, year_range, scenarios, forecast_options, anomaly_method, rolling_options, weather_normalize, comparison = self.render_sidebar()
         
         # Filter data based on selected years
-        filtered_df = self.df[(self.df['year'] >= year_range[0]) & (self.df['year'] <= year_range[1])].copy()
+        filtered_df, filtered_records = self.select(year_range)
         
         # Apply normalization if selected (convert kWh to MWh)
         if normalize_data:
             filtered_df['normalizedUsage'] = filtered_df['totalUsage'] / 1000  # convert to MWh
         
+        # Add weather-normalized usage if selected
+        if weather_normalize:
+            filtered_df['weatherNormalizedUsage'] = filtered_df['year'].map(self.get_weather_normalized_usage())
+        
+        # Add emissions when there is grid intensity data (changes are taken over the full history)
+        emissions = self.get_emissions()
+        if emissions is not None:
+            filtered_df = filtered_df.merge(emissions, on='year', how='left')
+        
+        # Evaluate the selected what-if scenarios for the same period
+        scenario_results = self.get_scenario_results(scenarios, year_range)
+        
+        # Forecast usage, cost and rate beyond the selected period
+        forecasts = self.get_forecasts(filtered_df, forecast_options)
+        
+        # Look up flagged periods across the full history
+        anomalies = self.get_anomaly_index(anomaly_method)
+        
+        # Moving averages and rolling volatility for the selected period
+        moving_averages, volatility = self.get_moving_statistics(rolling_options, year_range)
+        
         # Display KPI metrics
-        self.render_kpi_metrics(filtered_df)
+        self.render_kpi_metrics(year_range, filtered_df)
         
         # Create tabs for different visualizations
-        tab1, tab2, tab3, tab4, tab5 = st.tabs([
+        tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8, tab9 = st.tabs([
             "🔌 Usage & Cost", 
             "💲 Cost Analysis", 
             "📈 Rate Trends",
             "📊 Year-over-Year", 
+            "🌡️ Seasonal Profiles",
+            "⚡ Peak Demand",
+            "🧾 Billing Periods",
+            "🏆 Site Comparison",
             "📋 Data Table"
         ])
         
         with tab1:
-            self.render_usage_cost_view(filtered_df, show_trend, normalize_data)
+            self.render_usage_cost_view(filtered_df, show_trend, normalize_data, scenario_results, forecasts, anomalies, moving_averages, comparison)
         
         with tab2:
-            self.render_cost_analysis(filtered_df, show_trend)
+            self.render_cost_analysis(filtered_df, show_trend, scenario_results, forecasts, anomalies, moving_averages)
+            self.render_budget_tracking(year_range)
         
         with tab3:
-            self.render_rate_analysis(filtered_df, show_trend)
+            self.render_rate_analysis(filtered_df, show_trend, forecasts, anomalies, moving_averages)
         
         with tab4:
-            self.render_year_over_year(filtered_df)
+            self.render_year_over_year(filtered_df, anomalies, volatility)
         
         with tab5:
-            self.render_data_table(filtered_df, normalize_data)
+            self.render_seasonal_profiles(weather_normalize)
+        
+        with tab6:
+            self.render_peak_demand()
+        
+        with tab7:
+            self.render_billing_periods()
+        
+        with tab8:
+            self.render_site_comparison(year_range)
+        
+        with tab9:
+            self.render_data_table(filtered_df, normalize_data, comparison)
+            if self.node is not None and len(self.hierarchy.children(self.node)):
+                self.render_hierarchy_breakdown(year_range)
         
         # Display insights and analysis
         st.markdown('<h2 class="sub-header">Key Insights & Patterns</h2>', unsafe_allow_html=True)
-        self.render_insights(filtered_df)
+        self.render_insights(filtered_df, filtered_records, anomalies, rolling_options['window'])
         
         # Footer
         st.markdown('<div class="footer">⚡ Electric Usage Analytics Dashboard • Created with Streamlit • Data from 1998-2020</div>', unsafe_allow_html=True)
+        
+        # Forget charts not shown this run (their frames are gone) and report what the charts sent
+        for key in set(self.chart_states) - set(self.chart_bytes):
+            del self.chart_states[key]
+        self.render_chart_traffic()
     
     def render_sidebar(self):
         """Render the sidebar with controls"""
@@ -341,6 +531,17 @@ class ElectricUsageDashboard:
         # Add electric-themed icon
         st.sidebar.markdown("# ⚡")
         
+        # Meter hierarchy node picker (only when there is a hierarchy file)
+        if self.rollup is not None:
+            self.render_node_picker()
+            st.sidebar.markdown("---")
+        
+        # Data version picker (only when the data has been reloaded with changes and the dashboard's own data is shown)
+        comparison = None
+        if len(self.snapshots.snapshots) > 1 and self.node is None:
+            comparison = self.render_version_picker()
+            st.sidebar.markdown("---")
+        
         st.sidebar.markdown("### Data Range")
         
         # Year range slider
@@ -354,6 +555,12 @@ class ElectricUsageDashboard:
         )
         
         st.sidebar.markdown(f"🗓️ Selected period: {selected_years[0]} - {selected_years[1]}")
+        
+        if self.intervals is not None and self.intervals.missing:
+            st.sidebar.warning(
+                f"⚠️ Left out {self.intervals.missing:,} interval reading(s) in `{os.path.relpath(INTERVALS_FILE)}` "
+                "that have no kWh value."
+            )
         st.sidebar.markdown("---")
         
         # Analysis options
@@ -365,9 +572,60 @@ class ElectricUsageDashboard:
         if normalize_data:
             st.sidebar.info("📊 Displaying usage in Megawatt-hours (MWh) instead of Kilowatt-hours (kWh) for better readability.")
         
+        weather_normalize = st.sidebar.checkbox(
+            "Show weather-normalized usage",
+            value=False,
+            disabled=self.degree_days is None,
+            help=f"Needs daily heating/cooling degree days in `{os.path.relpath(DEGREE_DAYS_FILE)}`." if self.degree_days is None else None
+        )
+        
+        if weather_normalize:
+            _, fit = self.get_weather_fit()
+            _, per_hdd, per_cdd = fit.coefficients[0]
+            if np.isnan(per_hdd):
+                st.sidebar.warning(f"🌡️ Only {fit.observations[0]} years have complete degree-day data, which is too few to fit a weather model.")
+            else:
+                st.sidebar.info(
+                    f"🌡️ Usage adjusted to average weather: {per_hdd:,.0f} kWh per heating degree day and "
+                    f"{per_cdd:,.0f} kWh per cooling degree day (R² = {fit.r_squared[0]:.2f}, {fit.observations[0]} years)."
+                )
+        
         if show_trend:
             st.sidebar.info("📈 Trend lines show the general direction of the data over time, helping identify long-term patterns.")
         
+        show_moving_average = st.sidebar.checkbox("Show moving averages", value=False)
+        rolling_options = {'show': show_moving_average, 'stat': 'mean'}
+        if show_moving_average:
+            average_types = {"Simple": 'mean', "Exponential": 'ewma'}
+            rolling_options['stat'] = average_types[st.sidebar.radio("Average type", options=list(average_types), horizontal=True)]
+        rolling_options['window'] = st.sidebar.slider("Rolling window (years)", min_value=2, max_value=10, value=5)
+        
+        show_forecast = st.sidebar.checkbox("Show forecast", value=False)
+        forecast_options = None
+        if show_forecast:
+            model_names = {name: model for model, name in MODELS.items()}
+            forecast_options = {
+                'model': model_names[st.sidebar.radio("Forecast model", options=list(model_names))],
+                'horizon': st.sidebar.slider("Forecast horizon (years)", min_value=1, max_value=10, value=5),
+                'interval': 0.9
+            }
+            st.sidebar.info("🔮 Forecasts continue the selected period, with shaded bands showing the 90% prediction interval.")
+        
+        method_names = {name: method for method, name in ANOMALY_METHODS.items()}
+        anomaly_method = method_names[st.sidebar.selectbox("Anomaly detection", options=list(method_names))]
+        
+        st.sidebar.checkbox(
+            "Send only chart changes",
+            value=True,
+            key='chart_deltas',
+            help="Charts stay in the browser between reruns and receive only the traces, axes and values that changed."
+        )
+        
+        st.sidebar.markdown("---")
+        
+        # What-if scenarios
+        scenarios = self.render_scenario_builder(min_year, max_year)
+        
         st.sidebar.markdown("---")
         
         # About this dashboard
@@ -383,88 +641,398 @@ class ElectricUsageDashboard:
         Use the controls above to customize the visualization.
         """)
         
-        return show_trend, normalize_data, selected_years
+        return show_trend, normalize_data, selected_years, scenarios, forecast_options, anomaly_method, rolling_options, weather_normalize, comparison
     
-    def render_kpi_metrics(self, df):
-        """Render key performance indicator cards"""
-        st.markdown('<div class="metric-grid">', unsafe_allow_html=True)
+    def node_options(self):
+        """Picker labels of the meter hierarchy nodes with data, in tree order, after the dashboard's own data"""
+        options = {"Dashboard site": None}
+        if self.rollup is None:
+            return options
+        for i in self.hierarchy.tree_order():
+            node = self.hierarchy.nodes[i]
+            if self.rollup.has_data(node):
+                options[f"{'· ' * int(self.hierarchy.depths[i])}{node} ({self.hierarchy.levels[i]})"] = node
+        return options
+    
+    def render_node_picker(self):
+        """Render the meter hierarchy node picker"""
+        st.sidebar.markdown("### Meter Hierarchy")
+        st.sidebar.selectbox(
+            "Show node",
+            options=list(self.node_options()),
+            key='hierarchy_node',
+            help="Shows a meter, building or campus in every tab: its own yearly data plus that of everything below it."
+        )
+        if self.node is not None:
+            path = [self.hierarchy.nodes[i] for i in self.hierarchy.ancestors(self.node)] + [self.node]
+            children = len(self.hierarchy.children(self.node))
+            st.sidebar.info(
+                f"🏢 Showing {' › '.join(path)}"
+                + (f", rolled up from {children} {'child' if children == 1 else 'children'}." if children else ".")
+            )
+    
+    def snapshot_options(self):
+        """Picker labels of the stored data versions, newest first"""
+        return {
+            f"{snapshot.name} · {pd.Timestamp(snapshot.created_at, unit='s'):%Y-%m-%d %H:%M} · {snapshot.label}": snapshot
+            for snapshot in reversed(self.snapshots.snapshots)
+        }
+    
+    def render_version_picker(self):
+        """Render the data version picker and return the version to compare with, as (snapshot, rows), or None"""
+        st.sidebar.markdown("### Data Version")
+        
+        options = self.snapshot_options()
+        st.sidebar.selectbox(
+            "Show version",
+            options=list(options),
+            key='snapshot_version',
+            help="Every reload of the yearly data that changed it is kept as a version. Unchanged columns are shared between versions."
+        )
         
-        # Calculate metrics for filtered data
-        latest_year = df.iloc[-1]['year']
-        prev_year_idx = df.index[-2] if len(df) > 1 else df.index[-1]
-        latest_usage = df.iloc[-1]['totalUsage']
-        latest_cost = df.iloc[-1]['totalCost']
-        latest_rate = df.iloc[-1]['costPerKwh']
+        def roll_back(snapshot):
+            restored = self.snapshots.rollback(snapshot.version)
+            st.session_state['snapshot_version'] = next(label for label, option in self.snapshot_options().items() if option is restored)
         
-        # Usage change vs previous year
-        usage_change = 0
-        if len(df) > 1:
-            usage_change = ((df.iloc[-1]['totalUsage'] - df.iloc[-2]['totalUsage']) / df.iloc[-2]['totalUsage']) * 100
+        if self.snapshot.number != self.snapshots.latest.number:
+            st.sidebar.button(
+                f"↩️ Make {self.snapshot.name} the current version",
+                on_click=roll_back,
+                args=(self.snapshot,),
+                help="Adds this version as the newest one, so it becomes the default for everyone; nothing is copied."
+            )
         
-        # Cost change vs previous year
-        cost_change = 0
-        if len(df) > 1:
-            cost_change = ((df.iloc[-1]['totalCost'] - df.iloc[-2]['totalCost']) / df.iloc[-2]['totalCost']) * 100
+        others = {"None": None, **{label: snapshot for label, snapshot in options.items() if snapshot.version != self.snapshot.version}}
+        other = others[st.sidebar.selectbox("Compare with", options=list(others), key='snapshot_compare')]
+        if other is None:
+            return None
         
-        # Rate change vs previous year
-        rate_change = 0
-        if len(df) > 1:
-            rate_change = ((df.iloc[-1]['costPerKwh'] - df.iloc[-2]['costPerKwh']) / df.iloc[-2]['costPerKwh']) * 100
+        changed = [col for col in self.snapshots.changed_columns(other.version, self.snapshot.version) if col != 'year']
+        st.sidebar.info(
+            f"🗂️ Comparing {self.snapshot.name} with {other.name}: "
+            + (f"{', '.join(changed)} changed." if changed else "no values changed.")
+        )
+        return other, self.snapshots.frame(other.version)
+    
+    def render_scenario_builder(self, min_year, max_year):
+        """Render the what-if scenario builder and return the scenarios selected for display"""
+        st.sidebar.markdown("### What-if Scenarios")
+        
+        saved = st.session_state.setdefault('saved_scenarios', {})
+        
+        with st.sidebar.expander("➕ Build a scenario", expanded=not saved):
+            name = st.text_input("Scenario name", value=f"Scenario {len(saved) + 1}")
+            window = st.slider(
+                "Apply to years",
+                min_value=min_year,
+                max_value=max_year,
+                value=(min_year, max_year),
+                key="scenario_window"
+            )
+            usage_pct = st.slider("Usage change (%)", min_value=-50, max_value=50, value=0, step=1)
+            
+            rate_modes = {
+                "Keep actual rates": 'actual',
+                "Use one year's rate": 'fixed',
+                "Adjust rates by %": 'adjust'
+            }
+            rate_mode = rate_modes[st.radio("Rates", options=list(rate_modes))]
+            
+            rate_year = None
+            rate_pct = 0.0
+            if rate_mode == 'fixed':
+                rate_year = st.selectbox("Rate year", options=self.df['year'].astype(int).tolist())
+            elif rate_mode == 'adjust':
+                rate_pct = st.number_input("Rate change (%)", min_value=-90.0, max_value=200.0, value=0.0, step=1.0)
+            
+            if st.button("Save scenario", use_container_width=True):
+                if not name.strip():
+                    st.error("Please give the scenario a name.")
+                else:
+                    saved[name.strip()] = Scenario(name.strip(), window[0], window[1], usage_pct, rate_mode, rate_year, rate_pct)
+                    st.session_state['selected_scenarios'] = st.session_state.get('selected_scenarios', []) + [name.strip()]
+        
+        if not saved:
+            st.sidebar.caption("Saved scenarios appear here and can be overlaid on the usage and cost charts.")
+            return []
+        
+        # Drop selections for scenarios that no longer exist
+        st.session_state['selected_scenarios'] = [n for n in st.session_state.get('selected_scenarios', []) if n in saved]
+        selected = st.sidebar.multiselect(
+            "Show scenarios",
+            options=list(saved),
+            key='selected_scenarios'
+        )
+        for n in selected:
+            st.sidebar.caption(f"**{n}** — {saved[n].describe()}")
         
-        # Total usage in period
-        total_usage = df['totalUsage'].sum()
-        avg_usage = df['totalUsage'].mean()
+        def clear_scenarios():
+            saved.clear()
+            st.session_state['selected_scenarios'] = []
         
-        # Render metric cards using custom HTML/CSS
+        st.sidebar.button("Clear saved scenarios", on_click=clear_scenarios)
         
-        # Card 1: Latest Annual Usage
-        st.markdown(f'''
-        <div class="metric-card">
-            <div class="metric-value">{self.format_number(latest_usage)}</div>
-            <div class="metric-label">Annual Usage in {latest_year} (kWh)</div>
-            <div class="metric-trend {'trend-down' if usage_change < 0 else 'trend-up' if usage_change > 0 else 'trend-neutral'}">
-                {self.format_percent(usage_change)} vs Previous Year
-            </div>
-        </div>
-        ''', unsafe_allow_html=True)
+        return [saved[n] for n in selected]
+    
+    def get_scenario_results(self, scenarios, year_range):
+        """Evaluate scenarios over the full history and return them filtered to the selected years"""
+        if not scenarios:
+            return []
+        
+        # Results are cached for the full history, so moving the year slider never recomputes them
+        frames = self.scenario_engine.evaluate(self.df, scenarios)
+        
+        results = []
+        for scenario, frame in zip(scenarios, frames):
+            mask = (frame['year'] >= year_range[0]) & (frame['year'] <= year_range[1])
+            results.append((scenario, frame[mask]))
+        return results
+    
+    def get_forecasts(self, df, forecast_options):
+        """Fit (or reuse) forecast models for the selected period and project them forward"""
+        if not forecast_options or len(df) < MIN_PERIODS:
+            return {}
+        
+        # All three metrics are fitted together in one batch
+        metrics = ['totalUsage', 'totalCost', 'costPerKwh']
+        fits = self.forecast_engine.fit(
+            [(self.site, metric) for metric in metrics],
+            df[metrics].to_numpy(dtype=np.float64).T,
+            data_version(df),
+            model=forecast_options['model']
+        )
         
-        # Card 2: Latest Annual Cost
-        st.markdown(f'''
-        <div class="metric-card">
-            <div class="metric-value">{self.format_currency(latest_cost)}</div>
-            <div class="metric-label">Annual Cost in {latest_year}</div>
-            <div class="metric-trend {'trend-down' if cost_change < 0 else 'trend-up' if cost_change > 0 else 'trend-neutral'}">
-                {self.format_percent(cost_change)} vs Previous Year
-            </div>
-        </div>
-        ''', unsafe_allow_html=True)
+        horizon = forecast_options['horizon']
+        last_year = int(df['year'].iloc[-1])
+        future_years = np.arange(last_year + 1, last_year + horizon + 1)
         
-        # Card 3: Latest Rate
-        st.markdown(f'''
-        <div class="metric-card">
-            <div class="metric-value">{self.format_rate(latest_rate)}</div>
-            <div class="metric-label">Cost per kWh in {latest_year}</div>
-            <div class="metric-trend {'trend-down' if rate_change < 0 else 'trend-up' if rate_change > 0 else 'trend-neutral'}">
-                {self.format_percent(rate_change)} vs Previous Year
-            </div>
-        </div>
-        ''', unsafe_allow_html=True)
+        forecasts = {}
+        for metric, fit in zip(metrics, fits):
+            mean, lower, upper = fit.predict(horizon, forecast_options['interval'])
+            # Usage, cost and rates can't go negative
+            forecasts[metric] = (future_years, np.maximum(mean, 0), np.maximum(lower, 0), upper)
+        return forecasts
+    
+    def add_forecast_traces(self, fig, df, forecast, column, name, rgb, value_format=',.0f', prefix='', scale=1, secondary_y=None):
+        """Add a forecast line and its prediction band, continuing from the last actual value"""
+        future_years, mean, lower, upper = forecast
+        
+        # Anchor the forecast on the last actual point so the lines connect
+        x = np.concatenate([[df['year'].iloc[-1]], future_years])
+        last_value = df[column].iloc[-1]
+        mean, lower, upper = (np.concatenate([[last_value], values]) / scale for values in (mean, lower, upper))
+        
+        trace_kwargs = {} if secondary_y is None else {'secondary_y': secondary_y}
+        fig.add_trace(
+            go.Scatter(
+                x=x,
+                y=upper,
+                mode='lines',
+                line=dict(width=0),
+                showlegend=False,
+                hoverinfo='skip'
+            ),
+            **trace_kwargs
+        )
+        fig.add_trace(
+            go.Scatter(
+                x=x,
+                y=lower,
+                mode='lines',
+                line=dict(width=0),
+                fill='tonexty',
+                fillcolor=f'rgba({rgb}, 0.18)',
+                name=f'{name} Forecast Range',
+                hoverinfo='skip'
+            ),
+            **trace_kwargs
+        )
+        fig.add_trace(
+            go.Scatter(
+                x=x,
+                y=mean,
+                mode='lines+markers',
+                line=dict(color=f'rgba({rgb}, 0.9)', width=2, dash='dot'),
+                marker=dict(size=5),
+                name=f'{name} Forecast',
+                customdata=np.stack([lower, upper], axis=1),
+                hovertemplate=(
+                    f'Year: %{{x}}<br>{name} Forecast: {prefix}%{{y:{value_format}}} '
+                    f'({prefix}%{{customdata[0]:{value_format}}} - {prefix}%{{customdata[1]:{value_format}}})<extra></extra>'
+                )
+            ),
+            **trace_kwargs
+        )
+    
+    def add_anomaly_markers(self, fig, df, column, anomalies, scale=1, secondary_y=None):
+        """Circle the periods of a series that were flagged as anomalies"""
+        flagged = df[anomalies.mask(self.site, column, df['year'])]
+        if flagged.empty:
+            return
+        
+        trace_kwargs = {} if secondary_y is None else {'secondary_y': secondary_y}
+        fig.add_trace(
+            go.Scatter(
+                x=flagged['year'],
+                y=flagged[column] / scale,
+                mode='markers',
+                marker=dict(symbol='circle-open', size=16, color='#ff5757', line=dict(width=2)),
+                name=f'Unusual {ANOMALY_SERIES[column].lower()}',
+                hoverinfo='skip'
+            ),
+            **trace_kwargs
+        )
+    
+    def get_weather_fit(self):
+        """Return the years and the usage ~ HDD + CDD fit of the dashboard's site"""
+        return self.weather_engine.normalize_annual([self.site], self.df['year'], self.df['totalUsage'].to_numpy()[None], self.data_version, self.degree_days)
+    
+    def get_weather_normalized_usage(self):
+        """Return weather-normalized usage by year (NaN for years without degree-day data)"""
+        years, fit = self.get_weather_fit()
+        return pd.Series(fit.normalized[0], index=years)
+    
+    @property
+    def emissions_version(self):
+        """Version of the inputs of the emission factors (grid intensity and interval readings)"""
+        return f"{self.grid_intensity.version}/{self.intervals.version if self.intervals is not None else 'none'}"
+    
+    def get_emissions(self):
+        """Return emissions, emissions per kWh and their change by year (NaN for years without intensity data), or None"""
+        if self.grid_intensity is None:
+            return None
+        # A hierarchy node is weighted by the interval readings of its own meters only
+        sites = None if self.node is None else [self.hierarchy.nodes[i] for i in self.hierarchy.descendants(self.node)]
+        years, factors = self.emissions_engine.yearly_factors(self.site, self.grid_intensity, self.intervals, sites)
+        emissions = add_emissions(self.df[['year', 'totalUsage']], years, factors)
+        return emissions.drop(columns='totalUsage')
+    
+    def get_moving_statistics(self, rolling_options, year_range):
+        """Return moving averages (if shown) and rolling volatility, limited to the selected years"""
+        version = self.data_version
+        window = rolling_options['window']
+        mask = ((self.df['year'] >= year_range[0]) & (self.df['year'] <= year_range[1])).to_numpy()
+        years = self.df['year'][mask]
+        
+        # Statistics run over the full history so the first selected years still get a full window
+        moving_averages = None
+        if rolling_options['show']:
+            columns = ['totalUsage', 'totalCost', 'costPerKwh']
+            averages = self.rolling_engine.compute(
+                [(self.site, column) for column in columns],
+                self.df[columns].to_numpy(dtype=np.float64).T,
+                version,
+                rolling_options['stat'],
+                window
+            )
+            moving_averages = pd.DataFrame({'year': years, **{column: averages[(self.site, column)][mask] for column in columns}})
+        
+        # Volatility is the rolling standard deviation of the year-over-year changes
+        columns = ['usageChange', 'costChange', 'rateChange']
+        changes = self.df[columns].to_numpy(dtype=np.float64).T
+        changes[:, 0] = np.nan
+        deviations = self.rolling_engine.compute(
+            [(self.site, column) for column in columns],
+            changes,
+            version,
+            'std',
+            window
+        )
+        volatility = pd.DataFrame({'year': years, **{column: deviations[(self.site, column)][mask] for column in columns}})
+        
+        return moving_averages, volatility
+    
+    def add_moving_average_trace(self, fig, moving_averages, column, name, color, scale=1, secondary_y=None):
+        """Add a moving-average line for one series"""
+        trace_kwargs = {} if secondary_y is None else {'secondary_y': secondary_y}
+        fig.add_trace(
+            go.Scatter(
+                x=moving_averages['year'],
+                y=moving_averages[column] / scale,
+                mode='lines',
+                line=dict(color=color, width=2, shape='spline'),
+                name=f'{name} Moving Avg',
+                hoverinfo='skip'
+            ),
+            **trace_kwargs
+        )
+    
+    def show_chart(self, fig, key):
+        """Send a figure to the browser with its trace data as compact binary payloads, after the first
+        run only as the changes to what its frame already has"""
+        # A frame that missed an update asks for the whole figure again (its other value is its draw time)
+        request = st.session_state.get(key)
+        resend = isinstance(request, dict) and 'resync' in request and request['resync'] != self.chart_resyncs.get(key)
+        if resend:
+            self.chart_resyncs[key] = request['resync']
+        
+        spec, state = self.payload_cache.figure_update(fig, self.chart_states.get(key), not self.chart_deltas, resend)
+        self.chart_states[key] = state
+        self.chart_bytes[key] = (len(spec), state.full_size)
+        plotly_payload_chart(spec=spec, key=key, default=None)
+    
+    def render_chart_traffic(self):
+        """Sidebar note of the chart data sent to the browser by this run"""
+        if not self.chart_bytes:
+            return
+        sent, full = (sum(sizes) for sizes in zip(*self.chart_bytes.values()))
+        
+        # Each chart reports how long the browser took to draw its last update
+        draws = [st.session_state.get(key) for key in self.chart_bytes]
+        draw_ms = [draw['ms'] for draw in draws if isinstance(draw, dict) and 'ms' in draw]
+        drawn = f" The browser drew {len(draw_ms)} of them in {sum(draw_ms):,.0f} ms when they last changed." if draw_ms else ""
+        
+        st.sidebar.markdown("---")
+        st.sidebar.caption(
+            f"📡 This update sent {sent / 1024:,.1f} KB of chart data to the browser "
+            f"({full / 1024:,.1f} KB as whole figures, {len(self.chart_bytes)} charts).{drawn}"
+        )
+    
+    def is_anomaly(self, anomalies, column, year):
+        """Whether a year of a series was flagged by the anomaly detector"""
+        return anomalies is not None and year is not None and anomalies.is_flagged(self.site, column, year)
+    
+    def anomaly_outline(self, years, column, anomalies):
+        """Bar outline that highlights flagged years"""
+        if anomalies is None:
+            return dict(width=0)
+        mask = anomalies.mask(self.site, column, years)
+        return dict(color=np.where(mask, '#ff5757', 'rgba(0,0,0,0)'), width=np.where(mask, 3, 0))
+    
+    def render_kpi_metrics(self, year_range, df=None):
+        """Render key performance indicator cards"""
+        # Snapshots are stored per site and year range, so revisiting a range is just a lookup
+        kpis = self.get_kpis(year_range)
+        
+        cards = [
+            (self.format_number(kpis.latest_usage), f"Annual Usage in {kpis.latest_year} (kWh)", kpis.usage_change, "vs Previous Year"),
+            (self.format_currency(kpis.latest_cost), f"Annual Cost in {kpis.latest_year}", kpis.cost_change, "vs Previous Year"),
+            (self.format_rate(kpis.latest_rate), f"Cost per kWh in {kpis.latest_year}", kpis.rate_change, "vs Previous Year"),
+            (self.format_number(kpis.avg_usage), "Average Annual Usage (kWh)", kpis.avg_vs_latest, "vs Average")
+        ]
+        
+        # Emissions card when the latest year has grid intensity data
+        if df is not None and 'totalEmissions' in df.columns and np.isfinite(df['totalEmissions'].iloc[-1]):
+            cards.append((f"{df['totalEmissions'].iloc[-1]:,.0f}", f"Emissions in {kpis.latest_year} (tCO2e)", df['emissionsChange'].iloc[-1], "vs Previous Year"))
+        
+        # Budget card when the latest year has a budget
+        if self.budgets is not None:
+            variance = yearly_variance([self.site], [0], [kpis.latest_year], [kpis.latest_cost], self.budgets)
+            if len(variance):
+                cards.append((self.format_currency(variance['budget'].iloc[0]), f"Budget for {kpis.latest_year}", variance['variancePct'].iloc[0], "Actual vs Budget"))
         
-        # Card 4: Average Annual Usage
-        avg_vs_latest = ((latest_usage - avg_usage) / avg_usage) * 100
-        st.markdown(f'''
+        # Render the whole grid in one element so the cards arrive (and lay out) together
+        cards_html = ''.join(f'''
         <div class="metric-card">
-            <div class="metric-value">{self.format_number(avg_usage)}</div>
-            <div class="metric-label">Average Annual Usage (kWh)</div>
-            <div class="metric-trend {'trend-down' if avg_vs_latest < 0 else 'trend-up' if avg_vs_latest > 0 else 'trend-neutral'}">
-                {self.format_percent(avg_vs_latest)} vs Average
+            <div class="metric-value">{value}</div>
+            <div class="metric-label">{label}</div>
+            <div class="metric-trend {'trend-down' if change < 0 else 'trend-up' if change > 0 else 'trend-neutral'}">
+                {self.format_percent(change)} {comparison}
             </div>
-        </div>
-        ''', unsafe_allow_html=True)
-        
-        st.markdown('</div>', unsafe_allow_html=True)
+        </div>''' for value, label, change, comparison in cards)
+        st.markdown(f'<div class="metric-grid">{cards_html}</div>', unsafe_allow_html=True)
     
-    def render_usage_cost_view(self, df, show_trend=False, normalize_data=False):
+    def render_usage_cost_view(self, df, show_trend=False, normalize_data=False, scenario_results=None, forecasts=None, anomalies=None, moving_averages=None, comparison=None):
         """Render the combined usage and cost view"""
         st.markdown('<div class="card">', unsafe_allow_html=True)
         st.markdown('<h3>Usage and Cost Comparison</h3>', unsafe_allow_html=True)
@@ -489,6 +1057,21 @@ class ElectricUsageDashboard:
             secondary_y=False
         )
         
+        # Add weather-normalized usage if selected
+        if 'weatherNormalizedUsage' in df.columns:
+            fig.add_trace(
+                go.Scatter(
+                    x=df['year'],
+                    y=df['weatherNormalizedUsage'] / (1000 if usage_col == 'normalizedUsage' else 1),
+                    name="Weather-Normalized Usage",
+                    mode='lines+markers',
+                    line=dict(color='#ff9e00', width=2, dash='dot'),
+                    marker=dict(size=6, color='#ff9e00'),
+                    hovertemplate=f'Year: %{{x}}<br>Weather-normalized {usage_title.lower()}: %{{y:,.0f}}<extra></extra>'
+                ),
+                secondary_y=False
+            )
+        
         # Add line for cost
         fig.add_trace(
             go.Scatter(
@@ -503,6 +1086,35 @@ class ElectricUsageDashboard:
             secondary_y=True
         )
         
+        # Overlay another data version for comparison
+        if comparison is not None:
+            other, other_df = comparison
+            other_df = other_df[other_df['year'].between(df['year'].min(), df['year'].max())]
+            fig.add_trace(
+                go.Scatter(
+                    x=other_df['year'],
+                    y=other_df['totalUsage'] / (1000 if usage_col == 'normalizedUsage' else 1),
+                    name=f"Usage ({other.name})",
+                    mode='lines+markers',
+                    line=dict(color='#c77dff', width=2, dash='dash'),
+                    marker=dict(size=6, color='#c77dff', symbol='x'),
+                    hovertemplate=f'Year: %{{x}}<br>{usage_title} ({other.name}): %{{y:,.0f}}<extra></extra>'
+                ),
+                secondary_y=False
+            )
+            fig.add_trace(
+                go.Scatter(
+                    x=other_df['year'],
+                    y=other_df['totalCost'],
+                    name=f"Cost ({other.name})",
+                    mode='lines+markers',
+                    line=dict(color='#ff9e00', width=2, dash='dash'),
+                    marker=dict(size=6, color='#ff9e00', symbol='x'),
+                    hovertemplate=f'Year: %{{x}}<br>Cost ({other.name}): $%{{y:,.2f}}<extra></extra>'
+                ),
+                secondary_y=True
+            )
+        
         # Add trendlines if requested
         if show_trend:
             # Usage trendline
@@ -537,6 +1149,53 @@ class ElectricUsageDashboard:
                 secondary_y=True
             )
         
+        # Overlay what-if scenarios
+        for i, (scenario, scenario_df) in enumerate(scenario_results or []):
+            color = SCENARIO_COLORS[i % len(SCENARIO_COLORS)]
+            scenario_usage = scenario_df['totalUsage'] / 1000 if usage_col == 'normalizedUsage' else scenario_df['totalUsage']
+            
+            fig.add_trace(
+                go.Scatter(
+                    x=scenario_df['year'],
+                    y=scenario_usage,
+                    mode='lines',
+                    line=dict(color=color, width=2, dash='dot'),
+                    name=f'{scenario.name} Usage',
+                    hovertemplate=f'Year: %{{x}}<br>{scenario.name} {usage_title}: %{{y:,.0f}}<extra></extra>'
+                ),
+                secondary_y=False
+            )
+            
+            fig.add_trace(
+                go.Scatter(
+                    x=scenario_df['year'],
+                    y=scenario_df['totalCost'],
+                    mode='lines+markers',
+                    line=dict(color=color, width=2, dash='dash'),
+                    marker=dict(size=6, color=color),
+                    name=f'{scenario.name} Cost',
+                    hovertemplate=f'Year: %{{x}}<br>{scenario.name} Cost: $%{{y:,.2f}}<extra></extra>'
+                ),
+                secondary_y=True
+            )
+        
+        # Add forecast bands if requested
+        if forecasts:
+            usage_scale = 1000 if usage_col == 'normalizedUsage' else 1
+            self.add_forecast_traces(fig, df, forecasts['totalUsage'], 'totalUsage', 'Usage', '157, 78, 221', scale=usage_scale, secondary_y=False)
+            self.add_forecast_traces(fig, df, forecasts['totalCost'], 'totalCost', 'Cost', '83, 144, 217', value_format=',.2f', prefix='$', secondary_y=True)
+        
+        # Add moving averages if requested
+        if moving_averages is not None:
+            usage_scale = 1000 if usage_col == 'normalizedUsage' else 1
+            self.add_moving_average_trace(fig, moving_averages, 'totalUsage', 'Usage', 'rgba(224, 170, 255, 0.9)', scale=usage_scale, secondary_y=False)
+            self.add_moving_average_trace(fig, moving_averages, 'totalCost', 'Cost', 'rgba(144, 224, 239, 0.9)', secondary_y=True)
+        
+        # Highlight flagged periods
+        if anomalies is not None:
+            self.add_anomaly_markers(fig, df, 'totalUsage', anomalies, scale=1000 if usage_col == 'normalizedUsage' else 1, secondary_y=False)
+            self.add_anomaly_markers(fig, df, 'totalCost', anomalies, secondary_y=True)
+        
         # Update the layout
         fig.update_layout(
             title="Annual Electricity Usage and Cost",
@@ -581,7 +1240,11 @@ class ElectricUsageDashboard:
             secondary_y=True
         )
         
-        st.plotly_chart(fig, use_container_width=True)
+        self.show_chart(fig, 'usage_cost_chart')
+        
+        # Emissions and emissions per kWh for the years with grid intensity data
+        if 'totalEmissions' in df.columns:
+            self.render_emissions_chart(df[df['totalEmissions'].notna()], show_trend)
         
         # Add some insights about the relationship between usage and cost
         correlation = df['totalUsage'].corr(df['totalCost'])
@@ -597,7 +1260,74 @@ class ElectricUsageDashboard:
         
         st.markdown('</div>', unsafe_allow_html=True)
     
-    def render_cost_analysis(self, df, show_trend=False):
+    def render_emissions_chart(self, df, show_trend=False):
+        """Render annual emissions with the emissions per kWh of each year"""
+        if df.empty:
+            st.info("The grid intensity data doesn't cover any of the selected years.")
+            return
+        
+        fig = make_subplots(specs=[[{"secondary_y": True}]])
+        fig.add_trace(
+            go.Bar(
+                x=df['year'],
+                y=df['totalEmissions'],
+                name="Emissions",
+                marker_color='#7b2cbf',
+                opacity=0.85,
+                hovertemplate='Year: %{x}<br>Emissions: %{y:,.1f} tCO2e<extra></extra>'
+            ),
+            secondary_y=False
+        )
+        fig.add_trace(
+            go.Scatter(
+                x=df['year'],
+                y=df['emissionsPerKwh'],
+                name="Emissions per kWh",
+                mode='lines+markers',
+                line=dict(color='#ff9e00', width=3),
+                marker=dict(size=8, color='#ff9e00'),
+                hovertemplate='Year: %{x}<br>Emissions per kWh: %{y:.3f} kg CO2e<extra></extra>'
+            ),
+            secondary_y=True
+        )
+        
+        # Emissions trendline
+        if show_trend and len(df) > 1:
+            z = np.polyfit(df['year'], df['totalEmissions'], 1)
+            fig.add_trace(
+                go.Scatter(
+                    x=df['year'],
+                    y=np.polyval(z, df['year']),
+                    mode='lines',
+                    line=dict(color='rgba(123, 44, 191, 0.5)', width=2, dash='dash'),
+                    name='Emissions Trend',
+                    hoverinfo='skip'
+                ),
+                secondary_y=False
+            )
+        
+        fig.update_layout(
+            title="Annual Carbon Emissions",
+            hovermode="x unified",
+            legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=1.02,
+                xanchor="right",
+                x=1
+            ),
+            height=400,
+            plot_bgcolor='rgba(22, 33, 62, 0.5)',
+            paper_bgcolor='rgba(0,0,0,0)',
+            font=dict(color='#e6e6e6'),
+            margin=dict(l=60, r=60, t=80, b=60)
+        )
+        fig.update_xaxes(title_text="Year", gridcolor='rgba(123, 44, 191, 0.15)', tickfont=dict(size=12), tickmode='linear', dtick=1 if len(df) < 15 else 2)
+        fig.update_yaxes(title_text="Emissions (tCO2e)", gridcolor='rgba(123, 44, 191, 0.15)', tickfont=dict(size=12), tickformat=",", secondary_y=False)
+        fig.update_yaxes(title_text="kg CO2e per kWh", showgrid=False, tickfont=dict(size=12), secondary_y=True)
+        self.show_chart(fig, 'emissions_chart')
+    
+    def render_cost_analysis(self, df, show_trend=False, scenario_results=None, forecasts=None, anomalies=None, moving_averages=None):
         """Render the cost analysis view"""
         st.markdown('<div class="card">', unsafe_allow_html=True)
         st.markdown('<h3>Cost Analysis</h3>', unsafe_allow_html=True)
@@ -635,6 +1365,32 @@ class ElectricUsageDashboard:
                 )
             )
         
+        # Overlay what-if scenarios
+        for i, (scenario, scenario_df) in enumerate(scenario_results or []):
+            color = SCENARIO_COLORS[i % len(SCENARIO_COLORS)]
+            fig.add_trace(
+                go.Scatter(
+                    x=scenario_df['year'],
+                    y=scenario_df['totalCost'],
+                    mode='lines',
+                    name=f'{scenario.name}',
+                    line=dict(color=color, width=2, dash='dash'),
+                    hovertemplate=f'Year: %{{x}}<br>{scenario.name}: $%{{y:,.2f}}<extra></extra>'
+                )
+            )
+        
+        # Add forecast band if requested
+        if forecasts:
+            self.add_forecast_traces(fig, df, forecasts['totalCost'], 'totalCost', 'Cost', '83, 144, 217', value_format=',.2f', prefix='$')
+        
+        # Add moving average if requested
+        if moving_averages is not None:
+            self.add_moving_average_trace(fig, moving_averages, 'totalCost', 'Cost', 'rgba(144, 224, 239, 0.9)')
+        
+        # Highlight flagged periods
+        if anomalies is not None:
+            self.add_anomaly_markers(fig, df, 'totalCost', anomalies)
+        
         # Update the layout
         fig.update_layout(
             title="Annual Electricity Cost",
@@ -670,7 +1426,7 @@ class ElectricUsageDashboard:
             tickformat=","
         )
         
-        st.plotly_chart(fig, use_container_width=True)
+        self.show_chart(fig, 'cost_chart')
         
         # Calculate key metrics for the filtered data
         max_cost = df['totalCost'].max()
@@ -707,22 +1463,221 @@ class ElectricUsageDashboard:
         </div>
         """, unsafe_allow_html=True)
         
+        # Compare each scenario's total cost with the actual total for the period
+        actual_total = df['totalCost'].sum()
+        for scenario, scenario_df in scenario_results or []:
+            scenario_total = scenario_df['totalCost'].sum()
+            difference = scenario_total - actual_total
+            difference_pct = (difference / actual_total) * 100 if actual_total else 0
+            st.markdown(f"""
+            <div class="insight-item">
+                <strong>{html.escape(scenario.name)}: {self.format_currency(scenario_total)} total cost</strong> - 
+                {f"Would have cost {self.format_currency(difference)} more" if difference > 0 else
+                 f"Would have saved {self.format_currency(-difference)}" if difference < 0 else
+                 "Matches the actual cost"} ({self.format_percent(difference_pct)}) compared to actual costs ({scenario.describe()}).
+            </div>
+            """, unsafe_allow_html=True)
+        
         st.markdown('</div>', unsafe_allow_html=True)
     
-    def render_rate_analysis(self, df, show_trend=False):
-        """Render the rate analysis view"""
+    def render_budget_tracking(self, year_range):
+        """Render budget against actual cost, year-to-date tracking and projected year-end spend"""
         st.markdown('<div class="card">', unsafe_allow_html=True)
-        st.markdown('<h3>Rate Analysis (Cost per kWh)</h3>', unsafe_allow_html=True)
+        st.markdown('<h3>Budget vs Actual</h3>', unsafe_allow_html=True)
         
-        # Create line chart for rate
-        fig = go.Figure()
+        if self.budgets is None:
+            st.info(
+                f"Budget tracking needs budgets. Add `{os.path.relpath(BUDGETS_FILE)}` with `site`, `year` and "
+                "`budget` columns (and optionally `month`) to see it."
+            )
+            st.markdown('</div>', unsafe_allow_html=True)
+            return
         
-        # Add line chart for rate
-        fig.add_trace(
-            go.Scatter(
-                x=df['year'],
-                y=df['costPerKwh'],
-                mode='lines+markers',
+        # Yearly budget against the shown site's cost
+        selected = self.df[(self.df['year'] >= year_range[0]) & (self.df['year'] <= year_range[1])]
+        variance = yearly_variance([self.site], np.zeros(len(selected)), selected['year'], selected['totalCost'], self.budgets)
+        if len(variance):
+            fig = go.Figure()
+            fig.add_trace(
+                go.Bar(
+                    x=variance['year'],
+                    y=variance['actual'],
+                    name="Actual cost",
+                    marker_color=np.where(variance['variance'] > 0, '#ff9e00', '#5390d9'),
+                    customdata=variance['variancePct'],
+                    hovertemplate='%{x}<br>Actual: $%{y:,.2f} (%{customdata:+.1f}% vs budget)<extra></extra>'
+                )
+            )
+            fig.add_trace(
+                go.Scatter(
+                    x=variance['year'],
+                    y=variance['budget'],
+                    mode='lines+markers',
+                    name="Budget",
+                    line=dict(color='#c77dff', width=3, dash='dash'),
+                    marker=dict(size=8, color='#c77dff'),
+                    hovertemplate='%{x}<br>Budget: $%{y:,.2f}<extra></extra>'
+                )
+            )
+            fig.update_layout(
+                title=f"Budget vs Actual Cost ({self.site})",
+                hovermode="x unified",
+                legend=dict(
+                    orientation="h",
+                    yanchor="bottom",
+                    y=1.02,
+                    xanchor="right",
+                    x=1
+                ),
+                height=420,
+                plot_bgcolor='rgba(22, 33, 62, 0.5)',
+                paper_bgcolor='rgba(0,0,0,0)',
+                font=dict(color='#e6e6e6'),
+                margin=dict(l=60, r=60, t=80, b=60)
+            )
+            fig.update_xaxes(gridcolor='rgba(123, 44, 191, 0.15)', tickfont=dict(size=12))
+            fig.update_yaxes(title_text="Cost ($)", gridcolor='rgba(123, 44, 191, 0.15)', tickfont=dict(size=12))
+            self.show_chart(fig, 'budget_chart')
+        else:
+            st.markdown(f"No budget for {self.site} in the selected years.")
+        
+        # Year-to-date tracking and year-end projections from interval readings
+        if self.intervals is not None:
+            self.render_budget_projection()
+        
+        # Sites furthest over budget in the last selected year, from one vectorized pass over the whole portfolio
+        rows = self.budget_engine.portfolio_variance(self.portfolio, self.budgets)
+        rows = rows[(rows['year'] >= year_range[0]) & (rows['year'] <= year_range[1])]
+        if len(rows) and len(self.portfolio.sites) > 1:
+            year = rows['year'].max()
+            latest = rows[rows['year'] == year].sort_values('variancePct', ascending=False)
+            over = int((latest['variance'] > 0).sum())
+            st.markdown(f"**{over} of {len(latest):,} budgeted sites over budget in {year}**")
+            st.dataframe(
+                latest.head(10).drop(columns='year').rename(columns={
+                    'site': 'Site',
+                    'budget': 'Budget ($)',
+                    'actual': 'Actual ($)',
+                    'variance': 'Variance ($)',
+                    'variancePct': 'Variance (%)'
+                }),
+                hide_index=True,
+                use_container_width=True,
+                column_config={
+                    'Budget ($)': st.column_config.NumberColumn(format="$%.2f"),
+                    'Actual ($)': st.column_config.NumberColumn(format="$%.2f"),
+                    'Variance ($)': st.column_config.NumberColumn(format="$%.2f"),
+                    'Variance (%)': st.column_config.NumberColumn(format="%.1f")
+                }
+            )
+        
+        st.markdown('</div>', unsafe_allow_html=True)
+    
+    def render_budget_projection(self):
+        """Render an interval site's year-to-date cost against its budget, projected to the end of the year"""
+        # Monthly costs of every interval site, priced at the yearly average rate
+        tracking = self.budget_engine.tracking(self.intervals, self.df['year'].to_numpy(), self.df['costPerKwh'].to_numpy(), self.budgets)
+        years = np.arange(tracking.first_year, tracking.first_year + tracking.actual.shape[1])
+        budgeted = (tracking.cum_budget[..., 11] > 0) & (tracking.coverage.sum(axis=2) > 0)
+        sites = [site for i, site in enumerate(tracking.sites) if budgeted[i].any()]
+        if not sites:
+            return
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            site = st.selectbox("Site", options=sites, key='budget_site') if len(sites) > 1 else sites[0]
+        i = tracking.sites.index(site)
+        with col2:
+            year_options = years[budgeted[i]][::-1].tolist()
+            year = st.selectbox("Budget year", options=year_options, key='budget_year') if len(year_options) > 1 else year_options[0]
+        
+        status = self.budget_engine.status(tracking, site, year)
+        y, m = year - tracking.first_year, status.month - 1
+        months = list(calendar.month_abbr)[1:]
+        
+        fig = go.Figure()
+        fig.add_trace(
+            go.Scatter(
+                x=months,
+                y=tracking.cum_budget[i, y],
+                mode='lines+markers',
+                name="Budget",
+                line=dict(color='#c77dff', width=3, dash='dash'),
+                marker=dict(size=6, color='#c77dff'),
+                hovertemplate='%{x}<br>Budget to date: $%{y:,.2f}<extra></extra>'
+            )
+        )
+        fig.add_trace(
+            go.Scatter(
+                x=months[:m + 1],
+                y=tracking.cum_actual[i, y, :m + 1],
+                mode='lines+markers',
+                name="Actual",
+                line=dict(color='#9d4edd', width=3),
+                marker=dict(size=8, color='#9d4edd'),
+                hovertemplate='%{x}<br>Actual to date: $%{y:,.2f}<extra></extra>'
+            )
+        )
+        if m < 11:
+            # Remaining months follow the site's seasonal profile up to the projected year-end total
+            fig.add_trace(
+                go.Scatter(
+                    x=months[m:],
+                    y=np.concatenate([[status.actual_to_date], status.projected * np.cumsum(tracking.shares[i])[m + 1:]]),
+                    mode='lines',
+                    name="Projected",
+                    line=dict(color='#ff9e00', width=2, dash='dot'),
+                    hovertemplate='%{x}<br>Projected to date: $%{y:,.2f}<extra></extra>'
+                )
+            )
+        fig.update_layout(
+            title=f"Cumulative Cost vs Budget ({site}, {year})",
+            hovermode="x unified",
+            legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=1.02,
+                xanchor="right",
+                x=1
+            ),
+            height=420,
+            plot_bgcolor='rgba(22, 33, 62, 0.5)',
+            paper_bgcolor='rgba(0,0,0,0)',
+            font=dict(color='#e6e6e6'),
+            margin=dict(l=60, r=60, t=80, b=60)
+        )
+        fig.update_xaxes(gridcolor='rgba(123, 44, 191, 0.15)', tickfont=dict(size=12))
+        fig.update_yaxes(title_text="Cost to Date ($)", gridcolor='rgba(123, 44, 191, 0.15)', tickfont=dict(size=12))
+        self.show_chart(fig, 'budget_tracking_chart')
+        
+        st.markdown(f"""
+        <div class="insight-item">
+            <strong>Through {months[m]} {year}: {self.format_currency(status.actual_to_date)} spent</strong> - 
+            {self.format_currency(abs(status.variance))} {'over' if status.variance > 0 else 'under'} the {self.format_currency(status.budget_to_date)} budgeted to date
+            ({self.format_percent(status.variance_pct)}).
+        </div>
+        
+        <div class="insight-item">
+            <strong>Projected year-end: {self.format_currency(status.projected)}</strong> - 
+            {self.format_percent(status.projected_variance_pct)} against the {self.format_currency(status.annual_budget)} yearly budget
+            (following the site's seasonal profile; {self.format_currency(status.run_rate)} at the year-to-date run rate).
+        </div>
+        """, unsafe_allow_html=True)
+    
+    def render_rate_analysis(self, df, show_trend=False, forecasts=None, anomalies=None, moving_averages=None):
+        """Render the rate analysis view"""
+        st.markdown('<div class="card">', unsafe_allow_html=True)
+        st.markdown('<h3>Rate Analysis (Cost per kWh)</h3>', unsafe_allow_html=True)
+        
+        # Create line chart for rate
+        fig = go.Figure()
+        
+        # Add line chart for rate
+        fig.add_trace(
+            go.Scatter(
+                x=df['year'],
+                y=df['costPerKwh'],
+                mode='lines+markers',
                 name='Cost per kWh',
                 line=dict(color='#7b2cbf', width=3),
                 marker=dict(size=8, color='#7b2cbf'),
@@ -746,6 +1701,18 @@ class ElectricUsageDashboard:
                 )
             )
         
+        # Add forecast band if requested
+        if forecasts:
+            self.add_forecast_traces(fig, df, forecasts['costPerKwh'], 'costPerKwh', 'Rate', '199, 125, 255', value_format='.5f', prefix='$')
+        
+        # Add moving average if requested
+        if moving_averages is not None:
+            self.add_moving_average_trace(fig, moving_averages, 'costPerKwh', 'Rate', 'rgba(224, 170, 255, 0.9)')
+        
+        # Highlight flagged periods
+        if anomalies is not None:
+            self.add_anomaly_markers(fig, df, 'costPerKwh', anomalies)
+        
         # Add threshold line for average
         avg_rate = df['costPerKwh'].mean()
         fig.add_shape(
@@ -809,7 +1776,7 @@ class ElectricUsageDashboard:
             tickformat=".5f"
         )
         
-        st.plotly_chart(fig, use_container_width=True)
+        self.show_chart(fig, 'rate_chart')
         
         # Calculate key metrics for the filtered data
         max_rate = df['costPerKwh'].max()
@@ -848,7 +1815,7 @@ class ElectricUsageDashboard:
         
         st.markdown('</div>', unsafe_allow_html=True)
     
-    def render_year_over_year(self, df):
+    def render_year_over_year(self, df, anomalies=None, volatility=None):
         """Render the year-over-year changes"""
         st.markdown('<div class="card">', unsafe_allow_html=True)
         st.markdown('<h3>Year-over-Year Changes</h3>', unsafe_allow_html=True)
@@ -869,6 +1836,7 @@ class ElectricUsageDashboard:
                 y=df['usageChange'][1:],
                 name="Usage Change %",
                 marker_color='#9d4edd',
+                marker_line=self.anomaly_outline(df['year'][1:], 'usageChange', anomalies),
                 hovertemplate='Year: %{x}<br>Usage Change: %{y:.1f}%<extra></extra>'
             )
         )
@@ -880,6 +1848,7 @@ class ElectricUsageDashboard:
                 y=df['costChange'][1:],
                 name="Cost Change %",
                 marker_color='#5390d9',
+                marker_line=self.anomaly_outline(df['year'][1:], 'costChange', anomalies),
                 hovertemplate='Year: %{x}<br>Cost Change: %{y:.1f}%<extra></extra>'
             )
         )
@@ -891,6 +1860,7 @@ class ElectricUsageDashboard:
                 y=df['rateChange'][1:],
                 name="Rate Change %",
                 marker_color='#c77dff',
+                marker_line=self.anomaly_outline(df['year'][1:], 'rateChange', anomalies),
                 hovertemplate='Year: %{x}<br>Rate Change: %{y:.1f}%<extra></extra>'
             )
         )
@@ -944,7 +1914,11 @@ class ElectricUsageDashboard:
             ticksuffix="%"
         )
         
-        st.plotly_chart(fig, use_container_width=True)
+        self.show_chart(fig, 'yoy_chart')
+        
+        # Rolling volatility of the year-over-year changes
+        if volatility is not None and volatility[['usageChange', 'costChange', 'rateChange']].notna().any().any():
+            self.render_volatility_chart(volatility)
         
         # Find the most dramatic changes
         if len(df) > 1:
@@ -964,32 +1938,565 @@ class ElectricUsageDashboard:
             st.markdown(f"""
             <div class="insight-item">
                 <strong>Most significant usage increase: {self.format_percent(max_usage_increase)} in {max_usage_increase_year}</strong> - 
-                {'This represents an unusual surge in electricity consumption.' if max_usage_increase > 15 else
+                {'This represents an unusual surge in electricity consumption.' if self.is_anomaly(anomalies, 'usageChange', max_usage_increase_year) else
                  'This indicates a moderate increase in electricity demand.'}
             </div>
             
             <div class="insight-item">
                 <strong>Most significant usage decrease: {self.format_percent(max_usage_decrease)} in {max_usage_decrease_year}</strong> - 
-                {'This represents a dramatic reduction in electricity consumption.' if max_usage_decrease < -15 else
+                {'This represents a dramatic reduction in electricity consumption.' if self.is_anomaly(anomalies, 'usageChange', max_usage_decrease_year) else
                  'This indicates a moderate decrease in electricity demand.'}
             </div>
             
             <div class="insight-item">
                 <strong>Most significant cost increase: {self.format_percent(max_cost_increase)} in {max_cost_increase_year}</strong> - 
-                {'This spike in costs had a major impact on overall expenses.' if max_cost_increase > 20 else
+                {'This spike in costs had a major impact on overall expenses.' if self.is_anomaly(anomalies, 'costChange', max_cost_increase_year) else
                  'This increase in costs is notable but not extreme.'}
             </div>
             
             <div class="insight-item">
                 <strong>Most significant cost decrease: {self.format_percent(max_cost_decrease)} in {max_cost_decrease_year}</strong> - 
-                {'This dramatic cost reduction represents potential savings opportunities.' if max_cost_decrease < -20 else
+                {'This dramatic cost reduction represents potential savings opportunities.' if self.is_anomaly(anomalies, 'costChange', max_cost_decrease_year) else
                  'This decrease in costs provided some budget relief.'}
             </div>
             """, unsafe_allow_html=True)
         
         st.markdown('</div>', unsafe_allow_html=True)
     
-    def render_data_table(self, df, normalize_data=False):
+    def render_volatility_chart(self, volatility):
+        """Render the rolling standard deviation of the year-over-year changes"""
+        fig = go.Figure()
+        
+        for column, name, color in [
+            ('usageChange', "Usage Volatility", '#9d4edd'),
+            ('costChange', "Cost Volatility", '#5390d9'),
+            ('rateChange', "Rate Volatility", '#c77dff')
+        ]:
+            fig.add_trace(
+                go.Scatter(
+                    x=volatility['year'],
+                    y=volatility[column],
+                    mode='lines+markers',
+                    name=name,
+                    line=dict(color=color, width=2),
+                    marker=dict(size=6, color=color),
+                    hovertemplate=f'Year: %{{x}}<br>{name}: %{{y:.1f}}%<extra></extra>'
+                )
+            )
+        
+        # Update the layout
+        fig.update_layout(
+            title="Rolling Volatility (Std Dev of Annual Changes)",
+            hovermode="x unified",
+            legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=1.02,
+                xanchor="right",
+                x=1
+            ),
+            height=380,
+            plot_bgcolor='rgba(22, 33, 62, 0.5)',
+            paper_bgcolor='rgba(0,0,0,0)',
+            font=dict(color='#e6e6e6'),
+            margin=dict(l=60, r=60, t=80, b=60)
+        )
+        
+        # Configure axes
+        fig.update_xaxes(
+            title_text="Year",
+            gridcolor='rgba(123, 44, 191, 0.15)',
+            tickfont=dict(size=12),
+            tickmode='linear',
+            dtick=1 if len(volatility) < 15 else 2
+        )
+        
+        fig.update_yaxes(
+            title_text="Std Dev (%)",
+            gridcolor='rgba(123, 44, 191, 0.15)',
+            tickfont=dict(size=12),
+            ticksuffix="%"
+        )
+        
+        self.show_chart(fig, 'volatility_chart')
+    
+    def render_seasonal_profiles(self, weather_normalize=False):
+        """Render the month x hour load heatmap, day-type profiles, peak hours and weather-normalized daily usage from interval data"""
+        if self.intervals is None:
+            st.info(
+                f"Seasonal profiles need interval meter readings. Add `{os.path.relpath(INTERVALS_FILE)}` "
+                "with `site`, `timestamp` and `kwh` columns to see them."
+            )
+            return
+        
+        profiles = self.seasonal_engine.profiles(self.intervals)
+        sites = self.intervals.sites
+        site = st.selectbox("Site", options=sites, key='seasonal_site') if len(sites) > 1 else sites[0]
+        profile = profiles[site]
+        
+        hours = [f"{hour:02d}:00" for hour in range(24)]
+        months = list(calendar.month_abbr[1:])
+        
+        # Month x hour-of-day heatmap of average load
+        fig = go.Figure(
+            go.Heatmap(
+                z=profile.heatmap,
+                x=hours,
+                y=months,
+                colorscale=[[0, '#16213e'], [0.5, '#7b2cbf'], [1, '#ff9e00']],
+                colorbar=dict(title="kW"),
+                hovertemplate='%{y} %{x}<br>Average load: %{z:,.1f} kW<extra></extra>'
+            )
+        )
+        fig.update_layout(
+            title=f"Average Load by Month and Hour ({site})",
+            height=460,
+            plot_bgcolor='rgba(22, 33, 62, 0.5)',
+            paper_bgcolor='rgba(0,0,0,0)',
+            font=dict(color='#e6e6e6'),
+            margin=dict(l=60, r=60, t=80, b=60)
+        )
+        fig.update_yaxes(autorange='reversed')
+        self.show_chart(fig, 'seasonal_heatmap')
+        
+        # Weekday vs weekend daily load shapes
+        fig = go.Figure()
+        for values, name, color in [
+            (profile.weekday, "Weekday", '#9d4edd'),
+            (profile.weekend, "Weekend", '#5390d9')
+        ]:
+            fig.add_trace(
+                go.Scatter(
+                    x=hours,
+                    y=values,
+                    mode='lines+markers',
+                    name=name,
+                    line=dict(color=color, width=3),
+                    marker=dict(size=6, color=color),
+                    hovertemplate=f'%{{x}}<br>{name}: %{{y:,.1f}} kW<extra></extra>'
+                )
+            )
+        
+        # Shade the peak hours
+        for hour in profile.peak_hours:
+            fig.add_vrect(x0=int(hour) - 0.5, x1=int(hour) + 0.5, fillcolor='#ff5757', opacity=0.12, line_width=0)
+        
+        fig.update_layout(
+            title="Average Daily Load Profile",
+            hovermode="x unified",
+            legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=1.02,
+                xanchor="right",
+                x=1
+            ),
+            height=380,
+            plot_bgcolor='rgba(22, 33, 62, 0.5)',
+            paper_bgcolor='rgba(0,0,0,0)',
+            font=dict(color='#e6e6e6'),
+            margin=dict(l=60, r=60, t=80, b=60)
+        )
+        fig.update_xaxes(title_text="Hour of Day", gridcolor='rgba(123, 44, 191, 0.15)', tickfont=dict(size=12))
+        fig.update_yaxes(title_text="Average Load (kW)", gridcolor='rgba(123, 44, 191, 0.15)', tickfont=dict(size=12))
+        self.show_chart(fig, 'daily_profile_chart')
+        
+        # Peak-hour summary
+        peak_hours = ', '.join(hours[hour] for hour in profile.peak_hours)
+        peak_time = pd.Timestamp(profile.peak_timestamp)
+        busiest_month = months[int(np.nanargmax(np.nanmean(profile.heatmap, axis=1)))]
+        st.markdown(f"""
+        <div class="insight-item">
+            <strong>Peak hours: {peak_hours}</strong> - 
+            The hours with the highest average load across the year; shifting load out of them lowers demand charges.
+        </div>
+        
+        <div class="insight-item">
+            <strong>Highest interval: {profile.peak_kw:,.1f} kW on {peak_time:%b %d, %Y at %H:%M}</strong> - 
+            {busiest_month} has the highest average load of any month.
+        </div>
+        """, unsafe_allow_html=True)
+        
+        if weather_normalize:
+            self.render_daily_weather_normalized(site)
+    
+    def render_daily_weather_normalized(self, site):
+        """Render a site's daily interval usage next to its weather-normalized daily usage"""
+        site_codes, days, usage, fit = self.weather_engine.normalize_daily(self.intervals, self.degree_days)
+        code = self.intervals.positions[site]
+        rows = site_codes == code
+        _, per_hdd, per_cdd = fit.coefficients[code]
+        if np.isnan(per_hdd):
+            st.info(f"🌡️ Only {fit.observations[code]} days of `{site}` have complete degree-day data, which is too few to fit a daily weather model.")
+            return
+        
+        fig = go.Figure()
+        for values, name, color in [
+            (usage[rows], "Daily Usage", '#9d4edd'),
+            (fit.normalized[rows], "Weather-Normalized", '#ff9e00')
+        ]:
+            fig.add_trace(
+                go.Scatter(
+                    x=days[rows],
+                    y=values,
+                    mode='lines',
+                    name=name,
+                    line=dict(color=color, width=2),
+                    hovertemplate=f'%{{x|%b %d, %Y}}<br>{name}: %{{y:,.0f}} kWh<extra></extra>'
+                )
+            )
+        fig.update_layout(
+            title=f"Daily Usage Adjusted to Average Weather ({site})",
+            hovermode="x unified",
+            legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=1.02,
+                xanchor="right",
+                x=1
+            ),
+            height=380,
+            plot_bgcolor='rgba(22, 33, 62, 0.5)',
+            paper_bgcolor='rgba(0,0,0,0)',
+            font=dict(color='#e6e6e6'),
+            margin=dict(l=60, r=60, t=80, b=60)
+        )
+        fig.update_xaxes(gridcolor='rgba(123, 44, 191, 0.15)', tickfont=dict(size=12))
+        fig.update_yaxes(title_text="Usage (kWh)", gridcolor='rgba(123, 44, 191, 0.15)', tickfont=dict(size=12))
+        self.show_chart(fig, 'daily_weather_chart')
+        st.caption(
+            f"🌡️ {per_hdd:,.1f} kWh per heating degree day and {per_cdd:,.1f} kWh per cooling degree day "
+            f"(R² {fit.r_squared[code]:.2f} over {fit.observations[code]:,} days); each day is compared with the average "
+            "degree days of the same day of the year."
+        )
+    
+    def render_peak_demand(self):
+        """Render monthly peak demand and the load-duration curve from interval data"""
+        if self.intervals is None:
+            st.info(
+                f"Peak demand analytics need interval meter readings. Add `{os.path.relpath(INTERVALS_FILE)}` "
+                "with `site`, `timestamp` and `kwh` columns to see them."
+            )
+            return
+        
+        sites = self.intervals.sites
+        col1, col2 = st.columns(2)
+        with col1:
+            site = st.selectbox("Site", options=sites, key='demand_site') if len(sites) > 1 else sites[0]
+        with col2:
+            windows = {f"{minutes} minutes": minutes for minutes in DEMAND_WINDOWS}
+            window = windows[st.radio("Demand Interval", options=list(windows), horizontal=True, key='demand_window')]
+        
+        # Top-k peaks of every month, looked up for the selected site
+        months, peaks, peak_times = self.demand_engine.peaks(self.intervals, window, 'month').lookup(site)
+        month_labels = [f"{month:%b %Y}" for month in pd.to_datetime(months)]
+        
+        fig = go.Figure()
+        fig.add_trace(
+            go.Bar(
+                x=month_labels,
+                y=peaks[:, 0],
+                name="Monthly Peak",
+                marker_color='#7b2cbf',
+                customdata=[f"{time:%b %d %H:%M}" for time in pd.to_datetime(peak_times[:, 0])],
+                hovertemplate='%{x}<br>Peak: %{y:,.1f} kW<br>At: %{customdata}<extra></extra>'
+            )
+        )
+        for rank in range(1, peaks.shape[1]):
+            fig.add_trace(
+                go.Scatter(
+                    x=month_labels,
+                    y=peaks[:, rank],
+                    mode='markers',
+                    name=f"Peak #{rank + 1}",
+                    marker=dict(size=8, color='#c77dff', symbol='diamond'),
+                    hovertemplate=f'%{{x}}<br>Peak #{rank + 1}: %{{y:,.1f}} kW<extra></extra>'
+                )
+            )
+        
+        fig.update_layout(
+            title=f"Monthly Peak Demand ({window}-minute, top {TOP_K})",
+            hovermode="x unified",
+            legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=1.02,
+                xanchor="right",
+                x=1
+            ),
+            height=420,
+            plot_bgcolor='rgba(22, 33, 62, 0.5)',
+            paper_bgcolor='rgba(0,0,0,0)',
+            font=dict(color='#e6e6e6'),
+            margin=dict(l=60, r=60, t=80, b=60)
+        )
+        fig.update_xaxes(gridcolor='rgba(123, 44, 191, 0.15)', tickfont=dict(size=12))
+        fig.update_yaxes(title_text="Demand (kW)", gridcolor='rgba(123, 44, 191, 0.15)', tickfont=dict(size=12))
+        self.show_chart(fig, 'peak_demand_chart')
+        
+        # Load-duration curve for one year or the whole record
+        years = sorted({month.year for month in pd.to_datetime(months)})
+        year_options = {"All years": None, **{str(year): year for year in years}}
+        year = year_options[st.selectbox("Load-Duration Period", options=list(year_options), key='load_duration_year')]
+        share, curve = self.demand_engine.load_duration(self.intervals, site, window, year)
+        
+        fig = go.Figure(
+            go.Scatter(
+                x=share,
+                y=curve,
+                mode='lines',
+                name="Load Duration",
+                line=dict(color='#9d4edd', width=3),
+                fill='tozeroy',
+                fillcolor='rgba(157, 78, 221, 0.2)',
+                hovertemplate='Exceeded %{x:.0f}% of the time<br>Demand: %{y:,.1f} kW<extra></extra>'
+            )
+        )
+        fig.update_layout(
+            title=f"Load-Duration Curve ({'all years' if year is None else year})",
+            height=380,
+            plot_bgcolor='rgba(22, 33, 62, 0.5)',
+            paper_bgcolor='rgba(0,0,0,0)',
+            font=dict(color='#e6e6e6'),
+            margin=dict(l=60, r=60, t=80, b=60)
+        )
+        fig.update_xaxes(title_text="Share of Time (%)", gridcolor='rgba(123, 44, 191, 0.15)', tickfont=dict(size=12), ticksuffix="%")
+        fig.update_yaxes(title_text="Demand (kW)", gridcolor='rgba(123, 44, 191, 0.15)', tickfont=dict(size=12))
+        self.show_chart(fig, 'load_duration_chart')
+        
+        # Peak and load factor summary (load factor = average demand / peak demand)
+        highest = int(np.nanargmax(peaks[:, 0]))
+        average = float(np.trapz(curve, share) / 100)  # area under the load-duration curve
+        load_factor = average / curve[0] * 100 if curve[0] else 0
+        st.markdown(f"""
+        <div class="insight-item">
+            <strong>Highest peak: {peaks[highest, 0]:,.1f} kW in {month_labels[highest]}</strong> - 
+            Reached at {pd.Timestamp(peak_times[highest, 0]):%b %d, %Y %H:%M}; demand charges are usually set by peaks like this one.
+        </div>
+        
+        <div class="insight-item">
+            <strong>Load factor: {load_factor:.0f}%</strong> - 
+            {'Load is fairly flat, so there is little peak to shave.' if load_factor > 60 else
+             'Short peaks well above the typical load are driving demand charges.'}
+        </div>
+        """, unsafe_allow_html=True)
+    
+    def render_billing_periods(self):
+        """Render usage and cost per billing cycle or fiscal year, re-bucketed from interval data"""
+        if self.intervals is None:
+            st.info(
+                f"Billing periods need interval meter readings. Add `{os.path.relpath(INTERVALS_FILE)}` "
+                "with `site`, `timestamp` and `kwh` columns to see them."
+            )
+            return
+        
+        sites = self.intervals.sites
+        reads = self.billing_reads or {}
+        col1, col2 = st.columns(2)
+        with col1:
+            site = st.selectbox("Site", options=sites, key='billing_site') if len(sites) > 1 else sites[0]
+        bills = reads.get(site, reads.get(''))
+        with col2:
+            bases = ["Fiscal year", "Calendar year"] + (["Billing cycles"] if bills is not None and len(bills[0]) > 1 else [])
+            basis = st.radio("Periods", options=bases, horizontal=True, key='billing_basis')
+        
+        # Period boundaries covering the interval readings
+        timestamps = self.intervals.timestamps.view('datetime64[ns]')
+        first_year, last_year = pd.Timestamp(timestamps.min()).year, pd.Timestamp(timestamps.max()).year
+        if basis == "Fiscal year":
+            buckets = fiscal_years(first_year, last_year + 1)
+        elif basis == "Calendar year":
+            buckets = calendar_years(first_year, last_year)
+        else:
+            buckets = billing_cycles(bills[0])
+        
+        # Readings are priced from the bills where there are any, otherwise at the yearly average rate
+        rows, coverage = self.bucket_engine.period_rows(
+            self.intervals, site, buckets, self.df['year'].to_numpy(), self.df['costPerKwh'].to_numpy(),
+            bills if basis == "Billing cycles" else None, TIMEZONE
+        )
+        if rows.empty:
+            st.info(f"No {basis.lower()} period has readings for at least {MIN_COVERAGE:.0%} of its hours.")
+            return
+        
+        # Period rows share the yearly schema, so the same statistics apply to them
+        periods = UsageAnalytics(rows, f"{site} ({basis.lower()})", self.results_store, self.anomaly_engine, self.kpi_engine)
+        labels = dict(zip(buckets.keys.tolist(), buckets.labels))
+        period_df = periods.df.assign(period=periods.df['year'].map(labels))
+        
+        fig = make_subplots(specs=[[{"secondary_y": True}]])
+        fig.add_trace(
+            go.Bar(
+                x=period_df['period'],
+                y=period_df['totalUsage'],
+                name="Usage (kWh)",
+                marker_color='#7b2cbf',
+                hovertemplate='%{x}<br>Usage: %{y:,.0f} kWh<extra></extra>'
+            ),
+            secondary_y=False
+        )
+        fig.add_trace(
+            go.Scatter(
+                x=period_df['period'],
+                y=period_df['totalCost'],
+                mode='lines+markers',
+                name="Cost ($)",
+                line=dict(color='#ff9e00', width=3),
+                marker=dict(size=8, color='#ff9e00'),
+                hovertemplate='%{x}<br>Cost: $%{y:,.2f}<extra></extra>'
+            ),
+            secondary_y=True
+        )
+        fig.update_layout(
+            title=f"Usage and Cost by {basis.rstrip('s').title()} ({site})",
+            hovermode="x unified",
+            legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=1.02,
+                xanchor="right",
+                x=1
+            ),
+            height=420,
+            plot_bgcolor='rgba(22, 33, 62, 0.5)',
+            paper_bgcolor='rgba(0,0,0,0)',
+            font=dict(color='#e6e6e6'),
+            margin=dict(l=60, r=60, t=80, b=60)
+        )
+        fig.update_xaxes(gridcolor='rgba(123, 44, 191, 0.15)', tickfont=dict(size=12))
+        fig.update_yaxes(title_text="Usage (kWh)", gridcolor='rgba(123, 44, 191, 0.15)', tickfont=dict(size=12), secondary_y=False)
+        fig.update_yaxes(title_text="Cost ($)", showgrid=False, tickfont=dict(size=12), secondary_y=True)
+        self.show_chart(fig, 'billing_period_chart')
+        
+        st.dataframe(
+            period_df[['period', 'totalUsage', 'totalCost', 'costPerKwh', 'usageChange', 'costChange']].rename(columns={
+                'period': 'Period',
+                'totalUsage': 'Usage (kWh)',
+                'totalCost': 'Cost ($)',
+                'costPerKwh': 'Cost per kWh ($)',
+                'usageChange': 'Usage Change (%)',
+                'costChange': 'Cost Change (%)'
+            }),
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                'Usage (kWh)': st.column_config.NumberColumn(format="%.0f"),
+                'Cost ($)': st.column_config.NumberColumn(format="$%.2f"),
+                'Cost per kWh ($)': st.column_config.NumberColumn(format="$%.4f")
+            }
+        )
+        
+        # Summary of the periods, plus the periods left out for missing readings
+        stats = periods.stats
+        partial = [label for label, share in zip(buckets.labels, coverage) if 0 < share < MIN_COVERAGE]
+        pricing = "billed amounts" if basis == "Billing cycles" and np.isfinite(bills[1][1:]).any() else "the yearly average cost per kWh"
+        st.markdown(f"""
+        <div class="insight-item">
+            <strong>Highest usage: {self.format_number(stats['max_usage'])} kWh in {labels[stats['max_usage_year']]}</strong> - 
+            Average of {self.format_number(stats['avg_usage'])} kWh and {self.format_currency(stats['avg_cost'])} per period, priced from {pricing}.
+        </div>
+        
+        <div class="insight-item">
+            <strong>{len(rows)} complete period{'s' if len(rows) != 1 else ''}</strong> - 
+            {'Partial periods left out: ' + ', '.join(partial) + '.' if partial else 'Every period with readings is fully covered.'}
+            {'Period lengths follow ' + TIMEZONE + ' daylight saving time.' if TIMEZONE else ''}
+        </div>
+        """, unsafe_allow_html=True)
+    
+    def render_site_comparison(self, year_range):
+        """Render ranked site leaderboards and small-multiple charts of the leading sites"""
+        if len(self.portfolio.sites) < 2:
+            st.info(
+                f"Site comparison needs yearly data for more sites. Add `{os.path.relpath(SITES_FILE)}` "
+                "with `site`, `year`, `totalUsage` and `totalCost` columns to see it."
+            )
+            return
+        
+        metrics = {label: metric for metric, (label, _) in LEADERBOARD_METRICS.items()}
+        col1, col2, col3 = st.columns([2, 2, 1])
+        with col1:
+            metric = metrics[st.selectbox("Rank Sites By", options=list(metrics), key='comparison_metric')]
+        with col2:
+            orders = {"Highest first": True, "Lowest first": False}
+            default_order = 0 if LEADERBOARD_METRICS[metric][1] else 1
+            descending = orders[st.radio("Order", options=list(orders), index=default_order, horizontal=True, key='comparison_order')]
+        with col3:
+            top_n = st.selectbox("Sites", options=[10, 25, 50, 100], key='comparison_top_n')
+        
+        # Metrics of every site for the selected years; only the leading rows are sent to the browser
+        board = self.portfolio_engine.leaderboard(self.portfolio, year_range)
+        top = board.top(metric, top_n, descending)
+        if len(top) == 0:
+            st.info("No site has at least two years of data in the selected period.")
+            return
+        
+        leaderboard = pd.DataFrame({
+            'Rank': np.arange(1, len(top) + 1),
+            'Site': [self.portfolio.sites[i] for i in top],
+            'Years': [f"{board.metrics.first_year[i]}-{board.metrics.last_year[i]}" for i in top],
+            **{label: board.metrics.values[column][top] for column, (label, _) in LEADERBOARD_METRICS.items()}
+        })
+        st.markdown(f"**{len(top)} of {len(self.portfolio.sites):,} sites** ranked by {LEADERBOARD_METRICS[metric][0].lower()} - click a column header to re-sort")
+        st.dataframe(
+            leaderboard,
+            hide_index=True,
+            use_container_width=True,
+            column_config={label: st.column_config.NumberColumn(format="%.1f") for label, _ in LEADERBOARD_METRICS.values()}
+        )
+        
+        self.render_validation_report(self.portfolio.validation)
+        
+        # Small multiples of the leading sites, each over the selected years
+        shown = top[:12]
+        columns = 4
+        rows = (len(shown) + columns - 1) // columns
+        series = {
+            'costGrowth': ('Cost ($)', 2),
+            'costVolatility': ('Cost ($)', 2),
+            'rateGrowth': ('Cost per kWh ($)', 3),
+            'efficiencyChange': ('Cost per kWh ($)', 3),
+            'usageGrowth': ('Usage (kWh)', 1)
+        }
+        title, field = series[metric]
+        fig = make_subplots(
+            rows=rows,
+            cols=columns,
+            subplot_titles=[self.portfolio.sites[i] for i in shown],
+            shared_xaxes=True,
+            vertical_spacing=0.12 if rows > 1 else 0.2,
+            horizontal_spacing=0.05
+        )
+        for n, i in enumerate(shown):
+            site_data = self.portfolio.site(self.portfolio.sites[i])
+            years = site_data[0]
+            in_range = (years >= year_range[0]) & (years <= year_range[1])
+            fig.add_trace(
+                go.Scatter(
+                    x=years[in_range],
+                    y=site_data[field][in_range],
+                    mode='lines',
+                    name=self.portfolio.sites[i],
+                    line=dict(color='#9d4edd' if n % 2 == 0 else '#5390d9', width=2),
+                    hovertemplate=f'%{{x}}<br>{title}: %{{y:,.3~f}}<extra>{self.portfolio.sites[i]}</extra>'
+                ),
+                row=n // columns + 1,
+                col=n % columns + 1
+            )
+        
+        fig.update_layout(
+            title=f"{title} of the Top {len(shown)} Sites",
+            showlegend=False,
+            height=180 * rows + 120,
+            plot_bgcolor='rgba(22, 33, 62, 0.5)',
+            paper_bgcolor='rgba(0,0,0,0)',
+            font=dict(color='#e6e6e6'),
+            margin=dict(l=60, r=60, t=80, b=60)
+        )
+        fig.update_xaxes(gridcolor='rgba(123, 44, 191, 0.15)', tickfont=dict(size=10))
+        fig.update_yaxes(gridcolor='rgba(123, 44, 191, 0.15)', tickfont=dict(size=10))
+        self.show_chart(fig, 'site_comparison_chart')
+    
+    def render_data_table(self, df, normalize_data=False, comparison=None):
         """Render the data table view"""
         st.markdown('<div class="card">', unsafe_allow_html=True)
         st.markdown('<h3>Data Table</h3>', unsafe_allow_html=True)
@@ -1003,10 +2510,17 @@ class ElectricUsageDashboard:
         display_df['costPerKwh'] = display_df['costPerKwh'].apply(self.format_rate)
         
         # Format percentage columns
-        for col in ['usageChange', 'costChange', 'rateChange']:
+        for col in ['usageChange', 'costChange', 'rateChange', 'emissionsChange']:
             if col in display_df.columns:
                 display_df[col] = display_df[col].apply(lambda x: f"{x:.1f}%" if not pd.isna(x) else "N/A")
         
+        if 'weatherNormalizedUsage' in display_df.columns:
+            display_df['weatherNormalizedUsage'] = display_df['weatherNormalizedUsage'].apply(lambda x: self.format_number(x) if not pd.isna(x) else "N/A")
+        
+        if 'totalEmissions' in display_df.columns:
+            display_df['totalEmissions'] = display_df['totalEmissions'].apply(lambda x: f"{x:,.1f}" if not pd.isna(x) else "N/A")
+            display_df['emissionsPerKwh'] = display_df['emissionsPerKwh'].apply(lambda x: f"{x:.3f}" if not pd.isna(x) else "N/A")
+        
         # If normalized data is available, include it
         if normalize_data and 'normalizedUsage' in display_df.columns:
             display_df['normalizedUsage'] = display_df['normalizedUsage'].apply(lambda x: f"{x:,.0f}")
@@ -1016,22 +2530,30 @@ class ElectricUsageDashboard:
                 'year': 'Year',
                 'totalUsage': 'Usage (kWh)',
                 'normalizedUsage': 'Usage (MWh)',
+                'weatherNormalizedUsage': 'Weather-Normalized Usage (kWh)',
                 'totalCost': 'Total Cost',
                 'costPerKwh': 'Cost per kWh',
                 'usageChange': 'Usage Change (%)',
                 'costChange': 'Cost Change (%)',
-                'rateChange': 'Rate Change (%)'
+                'rateChange': 'Rate Change (%)',
+                'totalEmissions': 'Emissions (tCO2e)',
+                'emissionsPerKwh': 'Emissions per kWh (kg CO2e)',
+                'emissionsChange': 'Emissions Change (%)'
             })
         else:
             # Rename columns
             display_df = display_df.rename(columns={
                 'year': 'Year',
                 'totalUsage': 'Usage (kWh)',
+                'weatherNormalizedUsage': 'Weather-Normalized Usage (kWh)',
                 'totalCost': 'Total Cost',
                 'costPerKwh': 'Cost per kWh',
                 'usageChange': 'Usage Change (%)',
                 'costChange': 'Cost Change (%)',
-                'rateChange': 'Rate Change (%)'
+                'rateChange': 'Rate Change (%)',
+                'totalEmissions': 'Emissions (tCO2e)',
+                'emissionsPerKwh': 'Emissions per kWh (kg CO2e)',
+                'emissionsChange': 'Emissions Change (%)'
             })
         
         # Display the table
@@ -1041,6 +2563,13 @@ class ElectricUsageDashboard:
             use_container_width=True
         )
         
+        # What the load-time checks repaired or set aside
+        self.render_validation_report(self.validation)
+        
+        # Cell-level differences from the version being compared
+        if comparison is not None:
+            self.render_version_diff(comparison[0])
+        
         # Add download button for CSV
         csv = df.to_csv(index=False).encode('utf-8')
         st.download_button(
@@ -1053,131 +2582,156 @@ class ElectricUsageDashboard:
         
         st.markdown('</div>', unsafe_allow_html=True)
     
-    def render_insights(self, df):
+    def render_version_diff(self, other):
+        """Render the values that differ between the shown data version and another one"""
+        changes = self.snapshots.diff(other.version, self.snapshot.version)
+        logical, stored = self.snapshots.footprint()
+        st.markdown(f"<h3>Changes from {other.name} to {self.snapshot.name}</h3>", unsafe_allow_html=True)
+        if changes.empty:
+            st.markdown("No values differ between the two versions.")
+        else:
+            # Relative change of the measured values (the change columns are already percentages)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                relative = ((changes['new'] / changes['old'] - 1) * 100).round(1)
+            changes['change (%)'] = relative.where(changes['column'].isin(['totalUsage', 'totalCost', 'costPerKwh']))
+            st.dataframe(
+                changes.rename(columns={'year': 'Year', 'column': 'Column', 'old': other.name, 'new': self.snapshot.name}),
+                hide_index=True,
+                use_container_width=True
+            )
+        st.caption(
+            f"{len(self.snapshots.snapshots)} versions stored in {stored / 1024:,.1f} KB of shared chunks "
+            f"({logical / 1024:,.1f} KB as full copies)."
+        )
+    
+    def render_hierarchy_breakdown(self, year_range):
+        """Render how the shown hierarchy node's usage and cost split over its children"""
+        st.markdown(f"<h3>Breakdown of {html.escape(self.node)}</h3>", unsafe_allow_html=True)
+        
+        # Each child's usage by year, stacked to the node's total
+        child_years = self.rollup.child_years(self.node, year_range)
+        colors = ['#9d4edd', '#5390d9', '#c77dff', '#7b2cbf', '#ff9e00']
+        fig = go.Figure()
+        for n, (child, rows) in enumerate(child_years.groupby('node', sort=False)):
+            fig.add_trace(
+                go.Bar(
+                    x=rows['year'],
+                    y=rows['totalUsage'],
+                    name=child,
+                    marker_color=colors[n % len(colors)],
+                    customdata=rows['totalCost'],
+                    hovertemplate=f'%{{x}}<br>Usage: %{{y:,.0f}} kWh<br>Cost: $%{{customdata:,.2f}}<extra>{child}</extra>'
+                )
+            )
+        fig.update_layout(
+            title=f"Usage of {self.node} by {self.hierarchy.levels[self.hierarchy.children(self.node)[0]]}",
+            barmode='stack',
+            legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=1.02,
+                xanchor="right",
+                x=1
+            ),
+            height=420,
+            plot_bgcolor='rgba(22, 33, 62, 0.5)',
+            paper_bgcolor='rgba(0,0,0,0)',
+            font=dict(color='#e6e6e6'),
+            margin=dict(l=60, r=60, t=80, b=60)
+        )
+        fig.update_xaxes(gridcolor='rgba(123, 44, 191, 0.15)', tickfont=dict(size=12))
+        fig.update_yaxes(title_text="Usage (kWh)", gridcolor='rgba(123, 44, 191, 0.15)', tickfont=dict(size=12))
+        self.show_chart(fig, 'hierarchy_breakdown_chart')
+        
+        # Totals over the selected years; allocated cost adds a usage-based share of charges billed to the groups above
+        breakdown = self.rollup.breakdown(self.node, year_range)
+        st.dataframe(
+            breakdown.rename(columns={
+                'node': 'Node',
+                'level': 'Level',
+                'totalUsage': 'Usage (kWh)',
+                'totalCost': 'Cost ($)',
+                'allocatedCost': 'Allocated Cost ($)',
+                'usageShare': 'Usage Share (%)'
+            }),
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                'Usage (kWh)': st.column_config.NumberColumn(format="%.0f"),
+                'Cost ($)': st.column_config.NumberColumn(format="$%.2f"),
+                'Allocated Cost ($)': st.column_config.NumberColumn(format="$%.2f"),
+                'Usage Share (%)': st.column_config.NumberColumn(format="%.1f")
+            }
+        )
+    
+    def render_validation_report(self, report):
+        """Render the findings of the load-time data checks, if there are any"""
+        if report is None or report.ok:
+            return
+        
+        with st.expander(f"⚠️ Data checks: {report.rows:,} rows read, {report.kept:,} used"):
+            for line in report.summary():
+                st.markdown(f"- {line}")
+            if len(report.quarantine):
+                st.markdown("**Quarantined rows** (left out of every chart and statistic)")
+                st.dataframe(report.quarantine.head(100), hide_index=True, use_container_width=True)
+    
+    def insight_html(self, items):
+        """Format insight verdicts as insight-item blocks"""
+        blocks = []
+        for item in items:
+            title = f"<strong>{item['title']}:</strong> " if item['title'] else ""
+            text = f"{item['verdict']} {item['detail']}".strip()
+            blocks.append(f'<div class="insight-item">{title}{text}</div>')
+        return ''.join(blocks)
+    
+    def render_insights(self, df, records, anomalies=None, window=5):
         """Render insights and analysis about the data"""
         st.markdown('<div class="card">', unsafe_allow_html=True)
         
+        # Insight verdicts are stored per site, year range and data version, so they're only built once
+        sections = self.get_insights(df, records, anomalies, window)
+        
         # Create columns for insights
         col1, col2 = st.columns(2)
         
         with col1:
             st.markdown('<h4>Usage Patterns</h4>', unsafe_allow_html=True)
-            
-            # Calculate long-term trends
-            first_year = df.iloc[0]
-            last_year = df.iloc[-1]
-            pct_change_usage = ((last_year['totalUsage'] - first_year['totalUsage']) / first_year['totalUsage']) * 100
-            
-            # Create insights about usage
-            st.markdown(f"""
-            <div class="insight-item">
-                <strong>Long-term usage trend:</strong> {'Increasing' if pct_change_usage > 5 else 'Decreasing' if pct_change_usage < -5 else 'Stable'} 
-                ({self.format_percent(pct_change_usage)} over {last_year['year'] - first_year['year']} years)
-            </div>
-            
-            <div class="insight-item">
-                <strong>Peak usage year:</strong> {int(df.loc[df['totalUsage'].idxmax(), 'year'])} with {self.format_number(df['totalUsage'].max())} kWh
-            </div>
-            
-            <div class="insight-item">
-                <strong>Recent usage vs peak:</strong> {self.format_percent(((last_year['totalUsage'] / df['totalUsage'].max()) - 1) * 100)} compared to peak
-            </div>
-            """, unsafe_allow_html=True)
-            
-            if len(df) > 5:
-                # Detect any obvious patterns
-                recent_trend = df.iloc[-5:]['totalUsage'].pct_change().mean() * 100
-                st.markdown(f"""
-                <div class="insight-item">
-                    <strong>Recent 5-year trend:</strong> {'Increasing' if recent_trend > 1 else 'Decreasing' if recent_trend < -1 else 'Stable'} 
-                    (avg {self.format_percent(recent_trend)} per year)
-                </div>
-                """, unsafe_allow_html=True)
+            st.markdown(self.insight_html(sections['usage']), unsafe_allow_html=True)
         
         with col2:
             st.markdown('<h4>Cost Insights</h4>', unsafe_allow_html=True)
-            
-            # Calculate cost trends
-            pct_change_cost = ((last_year['totalCost'] - first_year['totalCost']) / first_year['totalCost']) * 100
-            pct_change_rate = ((last_year['costPerKwh'] - first_year['costPerKwh']) / first_year['costPerKwh']) * 100
-            
-            # Usage vs cost comparison
-            usage_cost_ratio = pct_change_usage / pct_change_cost if pct_change_cost != 0 else 0
-            
-            # Create insights about costs
-            st.markdown(f"""
-            <div class="insight-item">
-                <strong>Cost per kWh trend:</strong> {'Increasing' if pct_change_rate > 5 else 'Decreasing' if pct_change_rate < -5 else 'Stable'} 
-                ({self.format_percent(pct_change_rate)} over {last_year['year'] - first_year['year']} years)
-            </div>
-            
-            <div class="insight-item">
-                <strong>Usage vs cost changes:</strong> {'Usage changes outpace cost changes' if abs(usage_cost_ratio) > 1.2 and usage_cost_ratio > 0 else
-                                                      'Cost changes outpace usage changes' if abs(usage_cost_ratio) < 0.8 and usage_cost_ratio > 0 else
-                                                      'Usage decreases while costs increase' if usage_cost_ratio < 0 and pct_change_usage < 0 and pct_change_cost > 0 else
-                                                      'Usage increases while costs decrease' if usage_cost_ratio < 0 and pct_change_usage > 0 and pct_change_cost < 0 else
-                                                      'Usage and cost changes are proportional'}
-            </div>
-            
-            <div class="insight-item">
-                <strong>Cost volatility:</strong> {'High' if df['costChange'].std() > 15 else 'Moderate' if df['costChange'].std() > 7 else 'Low'} 
-                (std dev: {df['costChange'].std():.1f}%)
-            </div>
-            """, unsafe_allow_html=True)
-            
-            if len(df) > 5:
-                # Analyze recent cost trends
-                recent_cost_trend = df.iloc[-5:]['totalCost'].pct_change().mean() * 100
-                recent_rate_trend = df.iloc[-5:]['costPerKwh'].pct_change().mean() * 100
-                
-                st.markdown(f"""
-                <div class="insight-item">
-                    <strong>Recent cost trend:</strong> {'Increasing' if recent_cost_trend > 1 else 'Decreasing' if recent_cost_trend < -1 else 'Stable'} 
-                    (avg {self.format_percent(recent_cost_trend)} per year)
-                </div>
-                """, unsafe_allow_html=True)
+            st.markdown(self.insight_html(sections['cost']), unsafe_allow_html=True)
         
         # Add an overall interpretation of the data
         st.markdown('<h4>Summary Analysis</h4>', unsafe_allow_html=True)
-        
-        # Calculate efficiency - has the rate of usage relative to cost improved?
-        first_year_efficiency = first_year['totalCost'] / first_year['totalUsage']
-        last_year_efficiency = last_year['totalCost'] / last_year['totalUsage']
-        efficiency_change = ((last_year_efficiency - first_year_efficiency) / first_year_efficiency) * 100
-        
-        # Overall insights
-        correlation = df['totalUsage'].corr(df['totalCost'])
-        
-        st.markdown(f"""
-        <div class="insight-item">
-            <strong>Overall efficiency change:</strong> {'Improved' if efficiency_change < -5 else 'Worsened' if efficiency_change > 5 else 'Remained stable'}
-            ({self.format_percent(-efficiency_change)} over {last_year['year'] - first_year['year']} years)
-        </div>
-        
-        <div class="insight-item">
-            <strong>Usage-cost relationship:</strong> {
-                'Strong correlation between usage and cost suggests billing is primarily usage-based.' if correlation > 0.7 else
-                'Moderate correlation suggests other factors besides usage significantly affect cost.' if correlation > 0.4 else
-                'Weak correlation indicates cost is largely independent of usage, suggesting fixed costs or rate changes are dominant factors.'
-            }
-        </div>
-        
-        <div class="insight-item">
-            <strong>Cost-saving opportunities:</strong> {
-                'Significant decreases in usage have not always led to proportional cost savings, suggesting investigating rate structures could yield benefits.' 
-                    if pct_change_usage < -10 and pct_change_cost > pct_change_usage else
-                'Cost per kWh has increased significantly over time, suggesting exploring alternative rate plans or energy efficiency measures.' 
-                    if pct_change_rate > 15 else
-                'Usage patterns show opportunities for potential load shifting or demand management to reduce costs.' 
-                    if df['usageChange'].std() > 10 else
-                'Relatively stable usage and costs suggest focusing on long-term efficiency measures for gradual improvements.'
-            }
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(self.insight_html(sections['summary']), unsafe_allow_html=True)
+        
+        # Emissions verdicts when there is grid intensity data for the selected years
+        if 'totalEmissions' in df.columns and df['totalEmissions'].notna().any():
+            st.markdown('<h4>Emissions</h4>', unsafe_allow_html=True)
+            st.markdown(self.insight_html(self.get_emissions_insights(df, self.emissions_version)), unsafe_allow_html=True)
+        
+        # List the flagged periods in the selected range
+        if anomalies is not None:
+            st.markdown('<h4>Detected Anomalies</h4>', unsafe_allow_html=True)
+            st.markdown(self.insight_html(sections['anomalies']), unsafe_allow_html=True)
+        
+        # Alert rules currently firing for the shown site (kept up to date by the background scheduler)
+        alerts = self.alert_scheduler.monitor.active_alerts(self.site)
+        if alerts:
+            st.markdown('<h4>Active Alerts</h4>', unsafe_allow_html=True)
+            st.markdown(self.insight_html([
+                {'title': f"{alert.year} {alert.rule.replace('_', ' ')}", 'verdict': alert.message, 'detail': ''}
+                for alert in alerts[:MAX_SHOWN_ALERTS]
+            ]), unsafe_allow_html=True)
+            if len(alerts) > MAX_SHOWN_ALERTS:
+                st.caption(f"{len(alerts) - MAX_SHOWN_ALERTS} earlier alerts are in `{os.path.relpath(ALERTS_FILE)}`.")
+        if self.alert_scheduler.error is not None:
+            st.caption(f"⚠️ Alerts: {self.alert_scheduler.error}")
         
         st.markdown('</div>', unsafe_allow_html=True)
-
-
+        
 # Run the dashboard
 if __name__ == "__main__":
     dashboard = ElectricUsageDashboard()
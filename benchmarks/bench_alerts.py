@@ -0,0 +1,75 @@
+"""Time alert rule evaluation over synthetic portfolios: a full check and re-checks of a few changed sites.
+
+Run from the repository root:
+
+    python benchmarks/bench_alerts.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alerts import AlertMonitor, Rule
+from portfolio import PortfolioData
+
+RULES = [
+    Rule('cost_spike', 20.0),
+    Rule('usage_spike', 25.0),
+    Rule('rate_change', 15.0),
+    Rule('budget', 1_100_000.0),
+    Rule('anomaly', 3.5)
+]
+
+
+def make_portfolio(n_sites, years, seed=0):
+    """Yearly usage and cost for n_sites sites over the same years"""
+    rng = np.random.default_rng(seed)
+    n = n_sites * years
+    usage = rng.uniform(1e5, 1e7, n_sites).repeat(years) * rng.uniform(0.9, 1.1, n)
+    cost = usage * rng.uniform(0.05, 0.12, n_sites).repeat(years) * rng.uniform(0.95, 1.05, n)
+    offsets = np.arange(n_sites + 1, dtype=np.int64) * years
+    return PortfolioData([f"site-{i}" for i in range(n_sites)], offsets, np.tile(np.arange(1998, 1998 + years), n_sites), usage, cost, cost / usage)
+
+
+def changed(data, n_changed, seed):
+    """Copy of a portfolio with the latest cost of n_changed random sites doubled"""
+    rng = np.random.default_rng(seed)
+    cost = data.cost.copy()
+    for i in rng.choice(len(data.sites), n_changed, replace=False):
+        cost[data.offsets[i + 1] - 1] *= 2
+    return PortfolioData(data.sites, data.offsets, data.years, data.usage, cost, cost / data.usage)
+
+
+def main():
+    years = 23
+    print(f"{'sites':>8} {'rows':>11} {'step':>24} {'ms':>9} {'alerts':>8}")
+    for n_sites in [1_000, 10_000, 100_000]:
+        data = make_portfolio(n_sites, years)
+        monitor = AlertMonitor(RULES)
+        steps = []
+
+        start = time.perf_counter()
+        alerts = monitor.update(data)
+        steps.append(('check every site', time.perf_counter() - start, len(alerts)))
+
+        for n_changed in [1, 10, 100]:
+            new_data = changed(data, n_changed, seed=n_changed)
+            start = time.perf_counter()
+            alerts = monitor.update(new_data)
+            steps.append((f"re-check {n_changed} changed", time.perf_counter() - start, len(alerts)))
+            data = new_data
+
+        # The patched alerts match a check of every site from scratch
+        fresh = AlertMonitor(RULES)
+        fresh.update(data)
+        assert {alert.key for alert in fresh.active_alerts()} == {alert.key for alert in monitor.active_alerts()}
+
+        for step, seconds, count in steps:
+            print(f"{n_sites:>8,} {len(data):>11,} {step:>24} {seconds * 1000:>9.1f} {count:>8,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Time fiscal-year and billing-cycle re-bucketing of interval readings, with and without cached assignments.
+
+Run from the repository root:
+
+    python benchmarks/bench_bucketing.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bucketing import BucketEngine, billing_cycles, fiscal_years
+from intervals import NS_PER_MINUTE, IntervalData
+
+
+def make_portfolio(n_sites, days):
+    """15-minute readings for n_sites meters over the same span of days"""
+    rng = np.random.default_rng(0)
+    per_site = days * 96
+    start = np.datetime64('2018-01-01', 'ns').astype(np.int64)
+    timestamps = np.tile(start + np.arange(per_site, dtype=np.int64) * 15 * NS_PER_MINUTE, n_sites)
+    values = rng.gamma(2.0, 5.0, n_sites * per_site)
+    offsets = np.arange(n_sites + 1, dtype=np.int64) * per_site
+    return IntervalData([f"meter-{i}" for i in range(n_sites)], offsets, timestamps, values, 15)
+
+
+def timed(func):
+    """Wall time of one call, plus its result"""
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    days = 730
+    years, rates = np.array([2018, 2019]), np.array([0.11, 0.12])
+    read_dates = np.datetime64('2018-01-05') + np.cumsum(np.random.default_rng(1).integers(28, 34, 24))
+    bills = (read_dates, np.full(len(read_dates), 1000.0))
+    print(f"{'sites':>6} {'readings':>12} {'periods':>16} {'step':>22} {'ms':>9}")
+    for n_sites in [10, 100, 300]:
+        data = make_portfolio(n_sites, days)
+        for name, buckets, site_bills in [
+            ('fiscal years', fiscal_years(2018, 2020), None),
+            ('billing cycles', billing_cycles(read_dates), bills)
+        ]:
+            engine = BucketEngine()
+            steps = []
+            steps.append(('assign all readings', timed(lambda: engine.assignment(data, buckets, 'America/New_York'))[0]))
+            steps.append(('rows, one site', timed(lambda: engine.period_rows(data, 'meter-0', buckets, years, rates, site_bills, 'America/New_York'))[0]))
+            steps.append(('rows, one site (cached)', timed(lambda: engine.period_rows(data, 'meter-0', buckets, years, rates, site_bills, 'America/New_York'))[0]))
+            for step, seconds in steps:
+                print(f"{n_sites:>6,} {len(data.values):>12,} {name:>16} {step:>22} {seconds * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Time budget variance over large portfolios and monthly budget tracking of many interval sites.
+
+Run from the repository root:
+
+    python benchmarks/bench_budgets.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from budgets import BudgetEngine, Budgets, portfolio_variance
+from intervals import NS_PER_MINUTE, IntervalData
+from portfolio import PortfolioData
+
+
+def make_portfolio(n_sites, years, seed=0):
+    """Yearly usage and cost for n_sites sites over the same years"""
+    rng = np.random.default_rng(seed)
+    n = n_sites * years
+    usage = rng.uniform(1e5, 1e7, n_sites).repeat(years) * rng.uniform(0.9, 1.1, n)
+    cost = usage * rng.uniform(0.05, 0.12, n)
+    offsets = np.arange(n_sites + 1, dtype=np.int64) * years
+    return PortfolioData([f"site-{i}" for i in range(n_sites)], offsets, np.tile(np.arange(1998, 1998 + years), n_sites), usage, cost, cost / usage)
+
+
+def make_budgets(data, seed=1):
+    """A whole-year budget near the actual cost for every site and year"""
+    rng = np.random.default_rng(seed)
+    sites = np.repeat(np.array(data.sites, dtype=object), np.diff(data.offsets))
+    return Budgets.from_frame(pd.DataFrame({'site': sites, 'year': data.years, 'budget': data.cost * rng.uniform(0.9, 1.1, len(data))}))
+
+
+def make_intervals(n_sites, days):
+    """15-minute readings for n_sites meters over the same span of days"""
+    rng = np.random.default_rng(2)
+    per_site = days * 96
+    start = np.datetime64('2019-01-01', 'ns').astype(np.int64)
+    timestamps = np.tile(start + np.arange(per_site, dtype=np.int64) * 15 * NS_PER_MINUTE, n_sites)
+    offsets = np.arange(n_sites + 1, dtype=np.int64) * per_site
+    return IntervalData([f"site-{i}" for i in range(n_sites)], offsets, timestamps, rng.gamma(2.0, 5.0, n_sites * per_site), 15)
+
+
+def main():
+    print(f"{'sites':>8} {'rows':>12} {'step':>28} {'ms':>9}")
+    for n_sites in [1_000, 10_000, 100_000]:
+        data = make_portfolio(n_sites, 23)
+        budgets = make_budgets(data)
+        start = time.perf_counter()
+        variance = portfolio_variance(data, budgets)
+        seconds = time.perf_counter() - start
+        assert len(variance) == len(data)
+        print(f"{n_sites:>8,} {len(data):>12,} {'yearly variance (all sites)':>28} {seconds * 1000:>9.1f}")
+
+    years, rates = np.arange(2019, 2021), np.array([0.11, 0.12])
+    for n_sites in [10, 50, 150]:
+        # A year and a half of readings, so the second year is projected from its first half
+        intervals = make_intervals(n_sites, 365 + 182)
+        budgets = Budgets.from_frame(pd.DataFrame({'site': [''] * 2, 'year': [2019, 2020], 'budget': [100_000.0, 110_000.0]}))
+        engine = BudgetEngine()
+        steps = []
+
+        start = time.perf_counter()
+        tracking = engine.tracking(intervals, years, rates, budgets)
+        steps.append(('monthly tracking', time.perf_counter() - start))
+
+        start = time.perf_counter()
+        statuses = [engine.status(tracking, site, 2020) for site in intervals.sites]
+        steps.append(('status of every site', time.perf_counter() - start))
+
+        start = time.perf_counter()
+        [engine.status(tracking, site, 2020) for site in intervals.sites]
+        steps.append(('status (cached)', time.perf_counter() - start))
+
+        # Evenly spread readings at a flat rate project to about twice the first half-year
+        assert all(abs(status.projected / status.actual_to_date - 2) < 0.05 for status in statuses)
+        for step, seconds in steps:
+            print(f"{n_sites:>8,} {len(intervals):>12,} {step:>28} {seconds * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Compare plain Plotly figure JSON with the binary chart payloads.
+
+Run from the repository root:
+
+    python benchmarks/bench_chart_payloads.py
+"""
+import base64
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chart_payloads import PayloadCache
+
+
+def build_figure(n):
+    """Usage bars and a cost line over n periods, shaped like the dashboard's usage view"""
+    rng = np.random.default_rng(0)
+    periods = np.arange(n)
+    usage = rng.integers(4_000_000, 9_000_000, n).astype(np.float64)
+    cost = usage * rng.uniform(0.05, 0.1, n)
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=periods, y=usage, name="Electricity Usage"))
+    fig.add_trace(go.Scatter(x=periods, y=cost, name="Total Cost", mode='lines'))
+    return fig, usage
+
+
+def timed(func, repeat=3):
+    """Best wall time of a few runs, plus the last result"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    # Streamlit deployments don't ship orjson, so measure the standard JSON engine
+    pio.json.config.default_engine = 'json'
+
+    print(f"{'points':>10} {'plotly JSON':>14} {'payload JSON':>14} {'plotly ms':>10} {'cold ms':>9} {'warm ms':>9}")
+    for n in [1_000, 10_000, 100_000, 1_000_000]:
+        fig, usage = build_figure(n)
+
+        plain_time, plain = timed(lambda: pio.to_json(fig, validate=False))
+        cache = PayloadCache()
+        cold_time, payload = timed(lambda: PayloadCache().figure_json(fig))
+        cache.figure_json(fig)
+        warm_time, payload = timed(lambda: cache.figure_json(fig))
+
+        # The encoded data must decode back to the exact values
+        spec = json.loads(payload)['data'][0]['y']
+        decoded = np.frombuffer(base64.b64decode(spec['bdata']), dtype=np.dtype(spec['dtype']))
+        assert np.array_equal(decoded, usage)
+
+        print(
+            f"{n:>10,} {len(plain):>14,} {len(payload):>14,} "
+            f"{plain_time * 1000:>10.1f} {cold_time * 1000:>9.1f} {warm_time * 1000:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
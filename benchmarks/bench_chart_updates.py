@@ -0,0 +1,116 @@
+"""Compare whole-figure chart updates with the changes-only updates sent when sidebar options change.
+
+Run from the repository root:
+
+    python benchmarks/bench_chart_updates.py
+"""
+import base64
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import plotly.graph_objects as go
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chart_payloads import PayloadCache
+
+
+def build_figure(periods, usage, cost, first, last, trend=True, scale=1):
+    """Usage bars, a cost line and an optional trend line over periods[first:last], like the usage view"""
+    x, y = periods[first:last], usage[first:last] / scale
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=x, y=y, name="Electricity Usage", marker=dict(color='#9d4edd')))
+    fig.add_trace(go.Scatter(x=x, y=cost[first:last], name="Total Cost", mode='lines', yaxis='y2'))
+    if trend:
+        slope, intercept = np.polyfit(x, y, 1)
+        fig.add_trace(go.Scatter(x=x[[0, -1]], y=intercept + slope * x[[0, -1]], name="Usage Trend", mode='lines'))
+    fig.update_layout(title="Usage and Cost", height=500, xaxis=dict(range=[x[0] - 0.5, x[-1] + 0.5]), yaxis2=dict(overlaying='y', side='right'))
+    return fig
+
+
+def decode(value):
+    """Plain values of a typed-array spec, as the browser decodes them"""
+    if isinstance(value, dict) and 'bdata' in value and 'shape' not in value:
+        return np.frombuffer(base64.b64decode(value['bdata']), dtype=np.dtype(value['dtype'])).tolist()
+    return value
+
+
+def apply_patch(target, patch):
+    """Apply one trace or layout patch the way the browser component does"""
+    for name, value in patch.items():
+        if value is None:
+            target.pop(name, None)
+        elif isinstance(value, dict) and '__slice__' in value:
+            target[name] = target[name][value['__slice__'][0]:value['__slice__'][1]]
+        elif isinstance(value, dict) and '__extend__' in value:
+            target[name] = list(decode(value['__extend__'][0])) + list(target[name]) + list(decode(value['__extend__'][1]))
+        else:
+            target[name] = decode(value)
+    return target
+
+
+def apply_update(figure, update):
+    """The browser's figure after an update"""
+    if update['rev'] == figure.get('rev'):
+        return figure
+    if update['base'] is None:
+        return {'rev': update['rev'], 'data': [apply_patch({}, trace) for trace in update['data']], 'layout': update['layout']}
+    assert update['base'] == figure['rev']
+    data = (figure['data'] + [{}] * update['length'])[:update['length']]
+    for i, patch in update['data'].items():
+        data[int(i)] = apply_patch(dict(data[int(i)]), patch)
+    return {'rev': update['rev'], 'data': data, 'layout': apply_patch(dict(figure['layout']), update['layout'])}
+
+
+def plain(figure):
+    """JSON text of a figure's data and layout with every array as a list of floats, for comparing
+
+    NaN is read as null (short arrays are sent as JSON lists, where plotly.js takes null as a gap too),
+    and integers as floats (a window of a float array is encoded as integers when its values are whole).
+    """
+    text = json.dumps({'data': [{k: decode(v) for k, v in trace.items()} for trace in figure['data']], 'layout': figure['layout']}, default=list)
+    return json.dumps(json.loads(text, parse_int=float, parse_constant=lambda name: None), sort_keys=True)
+
+
+def main():
+    # Interactions in the order a user makes them: (label, first, last, trend, scale) as fractions of the history
+    steps = [
+        ("first draw", 0.0, 1.0, True, 1),
+        ("narrow year range", 0.2, 0.9, True, 1),
+        ("widen year range", 0.1, 1.0, True, 1),
+        ("hide trend line", 0.1, 1.0, False, 1),
+        ("usage in MWh", 0.1, 1.0, False, 1000),
+        ("rerun, nothing changed", 0.1, 1.0, False, 1000),
+    ]
+
+    print(f"{'points':>10} {'interaction':>24} {'whole bytes':>12} {'sent bytes':>12} {'whole ms':>9} {'delta ms':>9}")
+    for n in [1_000, 10_000, 100_000]:
+        rng = np.random.default_rng(0)
+        periods = np.arange(n, dtype=np.float64)
+        usage = rng.integers(4_000_000, 9_000_000, n).astype(np.float64)
+        cost = usage * rng.uniform(0.05, 0.1, n)
+
+        cache, state, browser = PayloadCache(), None, {}
+        for label, first, last, trend, scale in steps:
+            fig = build_figure(periods, usage, cost, int(first * n), int(last * n), trend, scale)
+
+            start = time.perf_counter()
+            whole, _ = PayloadCache().figure_update(fig)
+            whole_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            update, state = cache.figure_update(fig, state)
+            delta_time = time.perf_counter() - start
+
+            # The patched figure in the browser matches the figure sent whole
+            browser = apply_update(browser, json.loads(update))
+            assert plain(browser) == plain(json.loads(whole))
+
+            print(f"{n:>10,} {label:>24} {len(whole):>12,} {len(update):>12,} {whole_time * 1000:>9.1f} {delta_time * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Measure the compression ratio and decode throughput of the compressed interval store.
+
+Run from the repository root:
+
+    python benchmarks/bench_compression.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compression import CompressedIntervals
+from intervals import NS_PER_MINUTE, IntervalData
+
+
+def make_portfolio(n_sites, days, decimals=3, seed=0):
+    """15-minute readings for n_sites meters, rounded like meter data (None for full-precision floats)"""
+    rng = np.random.default_rng(seed)
+    per_site = days * 96
+    start = np.datetime64('2016-01-01', 'ns').astype(np.int64)
+    timestamps = np.tile(start + np.arange(per_site, dtype=np.int64) * 15 * NS_PER_MINUTE, n_sites)
+    # A daily load shape plus noise
+    shape = 10 + 6 * np.sin(np.arange(per_site) % 96 / 96 * 2 * np.pi)
+    values = np.tile(shape, n_sites) * rng.uniform(0.5, 2.0, n_sites).repeat(per_site) + rng.gamma(2.0, 1.0, n_sites * per_site)
+    if decimals is not None:
+        values = values.round(decimals)
+    offsets = np.arange(n_sites + 1, dtype=np.int64) * per_site
+    return IntervalData([f"meter-{i}" for i in range(n_sites)], offsets, timestamps, values, 15)
+
+
+def main():
+    days = 5 * 365
+    print(f"{'sites':>6} {'readings':>12} {'values':>12} {'raw MB':>8} {'stored MB':>10} {'ratio':>6} "
+          f"{'encode s':>9} {'all M/s':>8} {'1 year ms':>10} {'1 site ms':>10}")
+    for n_sites, decimals in [(10, 3), (100, 3), (100, 1), (100, None)]:
+        data = make_portfolio(n_sites, days, decimals)
+        raw = data.timestamps.nbytes + data.values.nbytes
+
+        start = time.perf_counter()
+        store = CompressedIntervals.from_intervals(data)
+        encode = time.perf_counter() - start
+
+        start = time.perf_counter()
+        decoded = store.read()
+        full = time.perf_counter() - start
+        assert decoded.version == data.version
+
+        # Range queries decode only the chunks that overlap the range
+        start = time.perf_counter()
+        year = store.read((2018, 2018))
+        one_year = time.perf_counter() - start
+        assert len(year) == n_sites * 365 * 96
+
+        start = time.perf_counter()
+        store.read(sites=['meter-0'])
+        one_site = time.perf_counter() - start
+
+        label = f"{decimals} decimals" if decimals is not None else "full float"
+        print(f"{n_sites:>6,} {len(data):>12,} {label:>12} {raw / 1e6:>8.1f} {store.nbytes / 1e6:>10.1f} {raw / store.nbytes:>6.1f} "
+              f"{encode:>9.2f} {len(data) / full / 1e6:>8.1f} {one_year * 1000:>10.1f} {one_site * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
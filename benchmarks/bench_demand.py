@@ -0,0 +1,66 @@
+"""Time rolling demand, monthly top-k peaks and load-duration curves on a synthetic meter portfolio.
+
+Run from the repository root:
+
+    python benchmarks/bench_demand.py
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from demand import TOP_K, load_duration_curve, period_peaks, rolling_demand
+from intervals import NS_PER_MINUTE, IntervalData
+
+
+def make_portfolio(n_sites, days):
+    """15-minute readings for n_sites meters over the same span of days"""
+    rng = np.random.default_rng(0)
+    per_site = days * 96
+    start = np.datetime64('2018-01-01', 'ns').astype(np.int64)
+    timestamps = np.tile(start + np.arange(per_site, dtype=np.int64) * 15 * NS_PER_MINUTE, n_sites)
+    values = rng.gamma(2.0, 5.0, n_sites * per_site)
+    offsets = np.arange(n_sites + 1, dtype=np.int64) * per_site
+    return IntervalData([f"meter-{i}" for i in range(n_sites)], offsets, timestamps, values, 15)
+
+
+def timed(func):
+    """Wall time and peak traced memory of one call, plus its result"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def main():
+    days = 3 * 365
+    print(f"{'meters':>7} {'readings':>12} {'step':>16} {'seconds':>8} {'peak MB':>8}")
+    for n_sites in [100, 1_000]:
+        intervals = make_portfolio(n_sites, days)
+        demand_time, demand_mem, demand = timed(lambda: rolling_demand(intervals, 30))
+        peak_time, peak_mem, table = timed(lambda: period_peaks(intervals, demand, 'month', TOP_K))
+        site_demand = demand[intervals.offsets[0]:intervals.offsets[1]]
+        curve_time, curve_mem, _ = timed(lambda: [load_duration_curve(site_demand) for _ in range(n_sites)])
+
+        # The peaks must match a plain sort of one site-month
+        months, values, _ = table.lookup(intervals.sites[0])
+        first_month = site_demand[:31 * 96]
+        assert np.allclose(values[0], np.sort(first_month[~np.isnan(first_month)])[::-1][:TOP_K])
+
+        for step, seconds, memory in [
+            ('30-min demand', demand_time, demand_mem),
+            (f'monthly top-{TOP_K}', peak_time, peak_mem),
+            ('load duration', curve_time, curve_mem)
+        ]:
+            print(f"{n_sites:>7,} {len(intervals):>12,} {step:>16} {seconds:>8.2f} {memory / 1e6:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Time the hourly grid-intensity join and yearly emissions on years of 15-minute readings for many sites.
+
+Run from the repository root:
+
+    python benchmarks/bench_emissions.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from emissions import MAX_GAP_HOURS, EmissionsEngine, GridIntensity
+from intervals import NS_PER_HOUR, NS_PER_MINUTE, IntervalData
+
+
+def make_portfolio(n_sites, days):
+    """15-minute readings for n_sites meters over the same span of days"""
+    rng = np.random.default_rng(0)
+    per_site = days * 96
+    start = np.datetime64('2018-01-01', 'ns').astype(np.int64)
+    timestamps = np.tile(start + np.arange(per_site, dtype=np.int64) * 15 * NS_PER_MINUTE, n_sites)
+    values = rng.gamma(2.0, 5.0, n_sites * per_site)
+    offsets = np.arange(n_sites + 1, dtype=np.int64) * per_site
+    return IntervalData([f"meter-{i}" for i in range(n_sites)], offsets, timestamps, values, 15)
+
+
+def make_intensity(days, regions):
+    """Hourly intensity for the first few meters plus a shared series for the others, with a few hours missing"""
+    rng = np.random.default_rng(1)
+    hours = pd.date_range('2018-01-01', periods=days * 24, freq='h')
+    df = pd.DataFrame({
+        'site': np.repeat([f"meter-{i}" for i in range(regions)] + [None], len(hours)),
+        'timestamp': np.tile(hours, regions + 1),
+        'intensity': rng.uniform(150, 600, (regions + 1) * len(hours))
+    })
+    return GridIntensity.from_frame(df.sample(frac=0.999, random_state=1))
+
+
+def check(data, intensity, joined, sample=200_000):
+    """Compare a sample of the joined intensities with pandas merge_asof"""
+    rng = np.random.default_rng(2)
+    rows = np.sort(rng.choice(len(data), sample, replace=False))
+    codes = data.site_codes()[rows]
+    readings = pd.DataFrame({'station': [intensity.station(data.sites[code]) for code in codes], 'hour': data.timestamps[rows] // NS_PER_HOUR, 'row': rows})
+    table = pd.DataFrame({'station': np.repeat(np.arange(len(intensity.sites)), np.diff(intensity.offsets)), 'hour': intensity.hours, 'known': intensity.hours, 'value': intensity.values})
+    merged = pd.merge_asof(readings.sort_values('hour'), table.sort_values('hour'), on='hour', by='station').sort_values('row')
+    expected = np.where(merged['hour'] - merged['known'] <= MAX_GAP_HOURS, merged['value'], np.nan)
+    assert np.allclose(expected[np.isfinite(expected)], joined[rows][np.isfinite(expected)])
+
+
+def main():
+    days = 3 * 365
+    print(f"{'sites':>6} {'readings':>12} {'step':>24} {'seconds':>8}")
+    for n_sites in [10, 50, 150]:
+        data = make_portfolio(n_sites, days)
+        intensity = make_intensity(days, regions=5)
+        engine = EmissionsEngine()
+        steps = []
+
+        start = time.perf_counter()
+        joined = intensity.join(data.sites, data.site_codes(), data.timestamps)
+        steps.append(('join', time.perf_counter() - start))
+        check(data, intensity, joined)
+
+        start = time.perf_counter()
+        engine.site_years(data, intensity)
+        steps.append(('join + gaps + yearly', time.perf_counter() - start))
+
+        start = time.perf_counter()
+        engine.site_years(data, intensity)
+        steps.append(('yearly (cached join)', time.perf_counter() - start))
+
+        for step, seconds in steps:
+            print(f"{n_sites:>6,} {len(data):>12,} {step:>24} {seconds:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Time batched forecast fitting and prediction for a portfolio of monthly meter series.
+
+Run from the repository root:
+
+    python benchmarks/bench_forecasting.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from forecasting import ForecastEngine
+
+
+def make_series(n_series, n_periods, season_length=12):
+    """Monthly usage with a per-meter level, trend and yearly cycle plus noise"""
+    rng = np.random.default_rng(0)
+    t = np.arange(n_periods)
+    level = rng.uniform(1_000, 50_000, (n_series, 1))
+    trend = rng.normal(0, 0.002, (n_series, 1)) * level
+    cycle = rng.uniform(0.05, 0.3, (n_series, 1)) * level * np.sin(2 * np.pi * (t + rng.integers(0, season_length, (n_series, 1))) / season_length)
+    return level + trend * t + cycle + rng.normal(0, 0.02, (n_series, n_periods)) * level
+
+
+def main():
+    n_periods, season_length, horizon = 120, 12, 12
+    print(f"{'meters':>7} {'periods':>8} {'model':>14} {'fit s':>7} {'cached s':>9} {'predict s':>10} {'holdout MAPE':>13}")
+    for n_series in [1_000, 5_000]:
+        values = make_series(n_series, n_periods + horizon, season_length)
+        history, holdout = values[:, :n_periods], values[:, n_periods:]
+        keys = [(f"meter-{i}", 'usage') for i in range(n_series)]
+
+        for label, model, season in [
+            ('seasonal ETS', 'ets', season_length),
+            ('Holt ETS', 'ets', None),
+            ('ARIMA', 'arima', None)
+        ]:
+            engine = ForecastEngine()
+            start = time.perf_counter()
+            fits = engine.fit(keys, history, 'v1', model, season)
+            fit_time = time.perf_counter() - start
+
+            # A second request for the same data version is served from the cache
+            start = time.perf_counter()
+            engine.fit(keys, history, 'v1', model, season)
+            cached_time = time.perf_counter() - start
+            assert engine.fits == n_series
+
+            start = time.perf_counter()
+            means = np.array([fit.predict(horizon)[0] for fit in fits])
+            predict_time = time.perf_counter() - start
+
+            # The seasonal model must follow the yearly cycle into the held-out year
+            mape = np.mean(np.abs(means - holdout) / holdout) * 100
+            assert season is None or mape < 5, mape
+            print(f"{n_series:>7,} {n_periods:>8} {label:>14} {fit_time:>7.2f} {cached_time:>9.3f} {predict_time:>10.2f} {mape:>12.1f}%")
+
+
+if __name__ == "__main__":
+    main()
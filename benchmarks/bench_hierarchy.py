@@ -0,0 +1,98 @@
+"""Time meter hierarchy rollups and incremental updates on synthetic meter -> building -> campus -> portfolio trees.
+
+Run from the repository root:
+
+    python benchmarks/bench_hierarchy.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hierarchy import Hierarchy, Rollup
+from portfolio import PortfolioData
+
+
+def make_tree(n_campuses, buildings_per_campus, meters_per_building):
+    """A portfolio root over campuses over buildings over meters"""
+    nodes, parents = ['portfolio'], [-1]
+    for c in range(n_campuses):
+        campus = len(nodes)
+        nodes.append(f"campus-{c}")
+        parents.append(0)
+        for b in range(buildings_per_campus):
+            building = len(nodes)
+            nodes.append(f"building-{c}-{b}")
+            parents.append(campus)
+            for m in range(meters_per_building):
+                nodes.append(f"meter-{c}-{b}-{m}")
+                parents.append(building)
+    return Hierarchy(nodes, parents)
+
+
+def make_portfolio(hierarchy, years, seed=0):
+    """Yearly usage and cost for every meter, plus directly billed charges for every building"""
+    rng = np.random.default_rng(seed)
+    sites = sorted(node for node in hierarchy.nodes if node.startswith(('meter', 'building')))
+    n = len(sites) * years
+    usage = rng.uniform(1e4, 1e6, n)
+    cost = usage * rng.uniform(0.05, 0.12, n)
+    offsets = np.arange(len(sites) + 1, dtype=np.int64) * years
+    return PortfolioData(sites, offsets, np.tile(np.arange(2000, 2000 + years), len(sites)), usage, cost, cost / usage)
+
+
+def changed(data, n_changed, seed):
+    """Copy of a portfolio with the usage and cost of n_changed random sites scaled"""
+    rng = np.random.default_rng(seed)
+    usage, cost = data.usage.copy(), data.cost.copy()
+    for i in rng.choice(len(data.sites), n_changed, replace=False):
+        rows = slice(data.offsets[i], data.offsets[i + 1])
+        scale = rng.uniform(0.5, 2.0)
+        usage[rows] *= scale
+        cost[rows] *= scale
+    return PortfolioData(data.sites, data.offsets, data.years, usage, cost, cost / usage)
+
+
+def main():
+    years = 10
+    print(f"{'nodes':>9} {'pairs':>10} {'step':>26} {'ms':>9}")
+    for shape in [(5, 20, 10), (20, 50, 50), (50, 100, 50)]:
+        steps = []
+
+        start = time.perf_counter()
+        hierarchy = make_tree(*shape)
+        steps.append(('parent index + pairs', time.perf_counter() - start))
+        data = make_portfolio(hierarchy, years)
+
+        start = time.perf_counter()
+        rollup = Rollup(hierarchy, data)
+        steps.append(('full rollup', time.perf_counter() - start))
+        assert np.isclose(rollup.totals[0, :, 0].sum(), data.usage.sum())
+
+        # Propagate 10 changed sites up their ancestor paths (into a copy, as the engine does) and compare with a full rebuild
+        new_data = changed(data, 10, seed=len(hierarchy))
+        start = time.perf_counter()
+        previous, rollup = rollup, rollup.updated(new_data)
+        steps.append(('update 10 changed sites', time.perf_counter() - start))
+        assert np.isclose(previous.totals[0, :, 0].sum(), data.usage.sum())
+
+        start = time.perf_counter()
+        rebuilt = Rollup(hierarchy, new_data)
+        steps.append(('full rebuild', time.perf_counter() - start))
+        assert np.allclose(rollup.totals, rebuilt.totals)
+
+        start = time.perf_counter()
+        allocated = rollup.allocated_cost()
+        steps.append(('allocated cost', time.perf_counter() - start))
+        campuses = hierarchy.children('portfolio')
+        assert np.allclose(allocated[campuses].sum(axis=0), rollup.totals[0, :, 1])
+
+        for step, seconds in steps:
+            print(f"{len(hierarchy):>9,} {len(hierarchy.pair_nodes):>10,} {step:>26} {seconds * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Time site leaderboard metrics, top-N ranking and incremental updates on synthetic portfolios.
+
+Run from the repository root:
+
+    python benchmarks/bench_portfolio.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import portfolio
+from portfolio import LEADERBOARD_METRICS, Leaderboard, PortfolioData, site_metrics
+
+
+def make_portfolio(n_sites, years, seed=0):
+    """Yearly usage and cost for n_sites sites over the same years"""
+    rng = np.random.default_rng(seed)
+    n = n_sites * years
+    usage = rng.uniform(1e5, 1e7, n_sites).repeat(years) * rng.uniform(0.8, 1.2, n)
+    cost = usage * rng.uniform(0.05, 0.12, n)
+    offsets = np.arange(n_sites + 1, dtype=np.int64) * years
+    return PortfolioData([f"site-{i}" for i in range(n_sites)], offsets, np.tile(np.arange(1998, 1998 + years), n_sites), usage, cost, cost / usage)
+
+
+def changed(data, n_changed, seed):
+    """Copy of a portfolio with the costs of n_changed random sites scaled"""
+    rng = np.random.default_rng(seed)
+    cost = data.cost.copy()
+    for i in rng.choice(len(data.sites), n_changed, replace=False):
+        cost[data.offsets[i]:data.offsets[i + 1]] *= rng.uniform(0.5, 2.0)
+    return PortfolioData(data.sites, data.offsets, data.years, data.usage, cost, cost / data.usage)
+
+
+def timed(func, repeat=3):
+    """Best wall time of a few calls, plus the last result"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    years, year_range = 23, (2005, 2015)
+    print(f"{'sites':>8} {'rows':>11} {'step':>24} {'ms':>9}")
+    for n_sites in [1_000, 10_000, 100_000]:
+        data = make_portfolio(n_sites, years)
+        steps = []
+
+        portfolio.PARALLEL_MIN_ROWS = float('inf')
+        serial, expected = timed(lambda: site_metrics(data, year_range))
+        steps.append(('metrics (1 thread)', serial))
+        portfolio.PARALLEL_MIN_ROWS = 0
+        parallel, result = timed(lambda: site_metrics(data, year_range))
+        steps.append(('metrics (worker threads)', parallel))
+        for metric in LEADERBOARD_METRICS:
+            assert np.allclose(result.values[metric], expected.values[metric], equal_nan=True)
+
+        board = Leaderboard(data, year_range)
+
+        def rank_all():
+            board.top_index.clear()
+            return [board.top(metric, 10) for metric in LEADERBOARD_METRICS]
+
+        ranking, _ = timed(rank_all)
+        steps.append(('top-10 of every metric', ranking))
+
+        # Patch the leaderboard for 10 changed sites (into a copy, as the engine does) and compare with a full rebuild
+        new_data = changed(data, 10, seed=n_sites)
+        start = time.perf_counter()
+        board = board.updated(new_data)
+        top = {metric: board.top(metric, 10) for metric in LEADERBOARD_METRICS}
+        steps.append(('update 10 changed sites', time.perf_counter() - start))
+
+        rebuild, rebuilt = timed(lambda: Leaderboard(new_data, year_range), repeat=1)
+        steps.append(('full rebuild', rebuild))
+        for metric in LEADERBOARD_METRICS:
+            assert np.array_equal(top[metric], rebuilt.top(metric, 10))
+
+        for step, seconds in steps:
+            print(f"{n_sites:>8,} {len(data):>11,} {step:>24} {seconds * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Load-test the query service: requests per second and p50/p99 latency over kept-alive connections.
+
+Run from the repository root:
+
+    python benchmarks/bench_query_service.py
+"""
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics import USAGE_DATA, UsageAnalytics, complete_rows
+from query_service import QueryService, make_server
+from results_store import ResultsStore
+
+import pandas as pd
+
+
+def make_sites(n_sites):
+    """The built-in site plus n_sites synthetic sites that scale its usage and cost"""
+    rng = np.random.default_rng(0)
+    store = ResultsStore(':memory:')
+    base = UsageAnalytics(results_store=store)
+    sites = {base.site: base}
+    frame = pd.DataFrame(USAGE_DATA)[['year', 'totalUsage', 'totalCost']]
+    for i in range(n_sites):
+        df = frame.copy()
+        df['totalUsage'] = (df['totalUsage'] * rng.uniform(0.2, 2.0, len(df))).round()
+        df['totalCost'] = (df['totalCost'] * rng.uniform(0.2, 2.0, len(df))).round(2)
+        site = f"site-{i}"
+        sites[site] = UsageAnalytics(complete_rows(df).to_dict('records'), site, store, base.anomaly_engine, base.kpi_engine)
+    return sites
+
+
+def run(port, requests, n_clients):
+    """Send the requests from n_clients threads (one connection each), returning (seconds, latencies)"""
+    latencies = [[] for _ in range(n_clients)]
+
+    def client(i):
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        for method, path, body, headers in requests[i::n_clients]:
+            start = time.perf_counter()
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            latencies[i].append(time.perf_counter() - start)
+        connection.close()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(n_clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, np.concatenate([np.asarray(l) for l in latencies])
+
+
+def main():
+    n_sites, n_requests, n_clients = 200, 2_000, 8
+    sites = make_sites(n_sites)
+    service = QueryService(sites)
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    rng = np.random.default_rng(1)
+    names = list(sites)
+    ranges = [(int(start), int(start) + int(length)) for start, length in zip(rng.integers(1998, 2015, n_requests), rng.integers(2, 8, n_requests))]
+    varied = [
+        ('GET', f"/sites/{names[rng.integers(len(names))]}?start={start}&end={end}", None, {})
+        for start, end in ranges
+    ]
+    repeated = [('GET', '/sites/main?start=2005&end=2015', None, {})] * n_requests
+
+    # The ETag of the repeated request, sent back for conditional requests
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    connection.request('GET', repeated[0][1])
+    response = connection.getresponse()
+    response.read()
+    etag = response.getheader('ETag')
+    conditional = [('GET', repeated[0][1], None, {'If-None-Match': etag})] * n_requests
+
+    batch = json.dumps({'sites': names[:50], 'start': 2010, 'end': 2020, 'fields': ['stats', 'kpis', 'yoy']})
+    batched = [('POST', '/query', batch, {'Content-Type': 'application/json'})] * (n_requests // 10)
+
+    print(f"{'workload':>20} {'requests':>9} {'req/s':>8} {'p50 ms':>7} {'p99 ms':>7}")
+    for name, requests in [
+        ('varied (computed)', varied),
+        ('varied (cached)', varied),
+        ('repeated', repeated),
+        ('conditional (304)', conditional),
+        ('batched 50 sites', batched)
+    ]:
+        seconds, latencies = run(port, requests, n_clients)
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        print(f"{name:>20} {len(requests):>9,} {len(requests) / seconds:>8.0f} {p50:>7.2f} {p99:>7.2f}")
+
+    print(f"response cache: {service.hits:,} hits, {service.misses:,} misses")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
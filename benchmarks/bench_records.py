@@ -0,0 +1,75 @@
+"""Compare memory per row and latest/previous/first lookups for the yearly data containers.
+
+Run from the repository root:
+
+    python benchmarks/bench_records.py
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from records import FIELDS, YearlyRecords
+
+
+def make_rows(n):
+    """Synthetic yearly rows with the same keys as ElectricUsageDashboard.data"""
+    rng = np.random.default_rng(0)
+    usage = rng.integers(4_000_000, 9_000_000, n)
+    rate = np.round(rng.uniform(0.05, 0.1, n), 5)
+    return [
+        {
+            "year": 1000 + i,
+            "totalUsage": int(usage[i]),
+            "totalCost": round(float(usage[i] * rate[i]), 2),
+            "costPerKwh": float(rate[i]),
+            "usageChange": round(float(rng.normal(0, 5)), 1),
+            "costChange": round(float(rng.normal(0, 5)), 1),
+            "rateChange": round(float(rng.normal(0, 5)), 1),
+        }
+        for i in range(n)
+    ]
+
+
+def traced_bytes(build):
+    """Bytes allocated (and still alive) while building a container"""
+    tracemalloc.start()
+    container = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return container, current
+
+
+def lookup_ns(statement, namespace, number=20_000):
+    """Mean time of one latest/previous/first lookup round, in nanoseconds"""
+    return min(timeit.repeat(statement, globals=namespace, number=number, repeat=5)) / number * 1e9
+
+
+def main():
+    for n in [23, 100_000]:
+        # Build the dicts under the tracer so their value objects are counted too
+        rows, dict_bytes = traced_bytes(lambda: make_rows(n))
+        df = pd.DataFrame(rows)
+        frame_bytes = df.memory_usage(deep=True, index=True).sum()
+        records = YearlyRecords.from_dicts(rows)
+
+        namespace = {'rows': rows, 'df': df, 'records': records}
+        timings = {
+            'list of dicts': lookup_ns("rows[-1]['totalUsage'], rows[-2]['totalUsage'], rows[0]['totalUsage']", namespace),
+            'DataFrame.iloc': lookup_ns("df.iloc[-1]['totalUsage'], df.iloc[-2]['totalUsage'], df.iloc[0]['totalUsage']", namespace, 2_000),
+            'YearlyRecords': lookup_ns("records.latest['totalUsage'], records.previous['totalUsage'], records.first['totalUsage']", namespace),
+        }
+
+        print(f"\n{n:,} rows ({len(FIELDS)} fields)")
+        print(f"{'container':>16} {'bytes/row':>10} {'lookup ns':>10}")
+        for name, size in [('list of dicts', dict_bytes), ('DataFrame.iloc', frame_bytes), ('YearlyRecords', records.nbytes)]:
+            print(f"{name:>16} {size / n:>10.1f} {timings[name]:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Time snapshot commits and measure how much a new version of a large dataset stores.
+
+Run from the repository root:
+
+    python benchmarks/bench_snapshots.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from snapshots import SnapshotStore
+
+
+def main():
+    rng = np.random.default_rng(0)
+    rows = 2_000_000
+    df = pd.DataFrame({
+        'year': np.repeat(np.arange(2000, 2020), rows // 20),
+        'totalUsage': rng.uniform(1e5, 1e7, rows),
+        'totalCost': rng.uniform(1e4, 1e6, rows),
+    })
+    df['costPerKwh'] = df['totalCost'] / df['totalUsage']
+
+    with tempfile.TemporaryDirectory() as path:
+        store = SnapshotStore(path)
+        print(f"{'step':>34} {'seconds':>8} {'stored MB':>10} {'as copies MB':>13}")
+
+        def report(step, func):
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+            logical, stored = store.footprint()
+            print(f"{step:>34} {elapsed:>8.2f} {stored / 1e6:>10.1f} {logical / 1e6:>13.1f}")
+            return result
+
+        first = report('first snapshot', lambda: store.commit(df, 'initial'))
+
+        # Correct the costs of 100 rows in one place: only those chunks are new
+        corrected = df.copy()
+        corrected.loc[500_000:500_099, 'totalCost'] *= 1.1
+        corrected['costPerKwh'] = corrected['totalCost'] / corrected['totalUsage']
+        second = report('corrected 100 rows', lambda: store.commit(corrected, 'corrected'))
+        report('unchanged reload', lambda: store.commit(corrected, 'reload'))
+        report('rollback to the first', lambda: store.rollback(first.version))
+        report('read a version', lambda: store.frame(second.version))
+        print(f"changed columns: {store.changed_columns(first.version, second.version)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Time the load-time validation and repair stage on large multi-site yearly tables.
+
+Run from the repository root:
+
+    python benchmarks/bench_validation.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from validation import validate_yearly
+
+
+def make_rows(n_sites, years, seed=0):
+    """Shuffled yearly rows with a few duplicates, missing values, rate typos and unit errors mixed in"""
+    rng = np.random.default_rng(seed)
+    n = n_sites * years
+    df = pd.DataFrame({
+        'site': np.repeat(np.array([f"site-{i}" for i in range(n_sites)]), years),
+        'year': np.tile(np.arange(2021 - years, 2021), n_sites),
+        'totalUsage': rng.uniform(1e5, 1e7, n_sites).repeat(years) * rng.uniform(0.8, 1.2, n),
+    })
+    df['totalCost'] = df['totalUsage'] * rng.uniform(0.06, 0.1, n)
+    df['costPerKwh'] = (df['totalCost'] / df['totalUsage']).round(5)
+
+    bad = rng.choice(n, n // 1000, replace=False)
+    df.loc[bad[0::4], 'totalUsage'] = np.nan
+    df.loc[bad[1::4], 'costPerKwh'] *= 10
+    df.loc[bad[2::4], 'totalUsage'] /= 1000
+    df = pd.concat([df, df.iloc[bad[3::4]]], ignore_index=True)
+    return df.sample(frac=1, random_state=seed, ignore_index=True)
+
+
+def main():
+    years = 20
+    print(f"{'sites':>8} {'rows':>11} {'seconds':>8}  findings")
+    for n_sites in [10_000, 100_000, 250_000]:
+        df = make_rows(n_sites, years)
+        start = time.perf_counter()
+        clean, report = validate_yearly(df)
+        elapsed = time.perf_counter() - start
+        findings = ', '.join(f"{check} {count:,}" for check, count in report.counts.items() if count)
+        print(f"{n_sites:>8,} {len(df):>11,} {elapsed:>8.2f}  {findings}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Time the degree-day join and the batched usage ~ HDD + CDD fits (daily and annual) across many sites.
+
+Run from the repository root:
+
+    python benchmarks/bench_weather.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from weather import DegreeDays, WeatherEngine, fit_degree_day_models
+
+
+def make_weather(days):
+    """One shared daily degree-day series starting on 2000-01-01"""
+    rng = np.random.default_rng(0)
+    day_values = np.arange(days, dtype=np.int64) + np.datetime64('2000-01-01', 'D').astype(np.int64)
+    temperature = 55 - 25 * np.cos(2 * np.pi * (np.arange(days) - 15) / 365) + rng.normal(0, 6, days)
+    return DegreeDays([''], [0, days], day_values, np.maximum(65 - temperature, 0), np.maximum(temperature - 65, 0))
+
+
+def make_models(n_sites):
+    """True (base, per HDD, per CDD) daily model of each site"""
+    rng = np.random.default_rng(1)
+    return np.column_stack([rng.uniform(500, 5000, n_sites), rng.uniform(5, 50, n_sites), rng.uniform(10, 80, n_sites)])
+
+
+def make_sites(n_sites, days):
+    """Daily usage for n_sites sites that each follow their own degree-day model, plus one shared weather series"""
+    rng = np.random.default_rng(2)
+    weather = make_weather(days)
+    codes = np.repeat(np.arange(n_sites), days)
+    day_index = np.tile(np.arange(days), n_sites)
+    true = make_models(n_sites)
+    usage = true[codes, 0] + true[codes, 1] * weather.hdd[day_index] + true[codes, 2] * weather.cdd[day_index]
+    usage += rng.normal(0, 50, len(usage))
+    return weather, codes, np.tile(weather.days, n_sites), usage, true
+
+
+def make_annual(n_sites, years):
+    """(site, year) usage matrix of n_sites sites following their own model on annual degree-day totals"""
+    rng = np.random.default_rng(3)
+    weather = make_weather(years * 365)
+    first, hdd, cdd = weather.annual_totals()
+    complete = np.flatnonzero(np.isfinite(hdd[0]))
+    true = make_models(n_sites)
+    usage = true[:, :1] * 365 + true[:, 1:2] * hdd[0, complete] + true[:, 2:] * cdd[0, complete]
+    return weather, first + complete, usage + rng.normal(0, 50, usage.shape), true
+
+
+def main():
+    days = 3 * 365
+    print(f"{'sites':>7} {'site-days':>12} {'join s':>8} {'fit s':>8} {'max coef err':>13}")
+    for n_sites in [100, 1_000, 5_000]:
+        weather, codes, day_values, usage, true = make_sites(n_sites, days)
+        sites = [f"site-{i}" for i in range(n_sites)]
+
+        start = time.perf_counter()
+        hdd, cdd = weather.join(sites, codes, day_values)
+        join_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        fit = fit_degree_day_models(codes, usage, hdd, cdd, n_sites, normal_groups=(day_values - day_values[0]) % 365)
+        fit_time = time.perf_counter() - start
+
+        error = np.max(np.abs(fit.coefficients[:, 1:] - true[:, 1:]) / true[:, 1:])
+        print(f"{n_sites:>7,} {len(usage):>12,} {join_time:>8.2f} {fit_time:>8.2f} {error:>13.2%}")
+
+    # Annual totals of every site, joined to the degree days and fitted in one call
+    print(f"\n{'sites':>7} {'site-years':>12} {'annual s':>9} {'max coef err':>13}")
+    for n_sites in [1_000, 10_000, 100_000]:
+        weather, years, usage, true = make_annual(n_sites, 20)
+        sites = [f"site-{i}" for i in range(n_sites)]
+
+        start = time.perf_counter()
+        _, fit = WeatherEngine().normalize_annual(sites, years, usage, 'v1', weather)
+        annual_time = time.perf_counter() - start
+
+        error = np.max(np.abs(fit.coefficients[:, 1:] - true[:, 1:]) / true[:, 1:])
+        print(f"{n_sites:>7,} {usage.size:>12,} {annual_time:>9.2f} {error:>13.2%}")
+
+
+if __name__ == "__main__":
+    main()
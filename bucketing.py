@@ -0,0 +1,196 @@
+import os
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from core import DATA_DIR, array_version
+from intervals import NS_PER_HOUR
+
+# Optional meter-read dates per site that close each billing cycle, with the billed amount if known
+BILLING_CYCLES_FILE = os.path.join(DATA_DIR, 'billing_cycles.csv')
+
+# First month of the fiscal year (July: FY2021 runs from July 2020 to June 2021)
+FISCAL_YEAR_START_MONTH = 7
+
+# Periods with readings for less than this share of their hours are left out of the period rows
+MIN_COVERAGE = 0.9
+
+
+class Buckets(NamedTuple):
+    """A set of consecutive periods given by sorted wall-clock boundaries"""
+    name: str
+    edges: np.ndarray   # (n + 1,) int64 ns, local wall-clock time; period i is [edges[i], edges[i + 1])
+    keys: np.ndarray    # (n,) integer period key used as the 'year' of the period rows
+    labels: list        # (n,) display labels
+    version: str
+
+
+def make_buckets(name, edges, keys, labels):
+    edges = np.asarray(edges, dtype='datetime64[ns]').view(np.int64)
+    if np.any(np.diff(edges) <= 0):
+        raise ValueError("Period boundaries must be strictly increasing")
+    keys = np.asarray(keys, dtype=np.int64)
+    return Buckets(name, edges, keys, list(labels), array_version(edges, keys))
+
+
+def calendar_years(first_year, last_year):
+    """January-December years"""
+    years = np.arange(first_year, last_year + 1)
+    edges = np.arange(first_year, last_year + 2).astype(str).astype('datetime64[Y]')
+    return make_buckets('calendar', edges, years, [str(year) for year in years])
+
+
+def fiscal_years(first_year, last_year, start_month=FISCAL_YEAR_START_MONTH):
+    """Fiscal years named by the calendar year they end in (FY2021 = July 2020 - June 2021 for a July start)"""
+    years = np.arange(first_year, last_year + 1)
+    offset = 1 if start_month > 1 else 0
+    edges = (np.arange(first_year, last_year + 2) - offset - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (start_month - 1)
+    first_month = pd.Timestamp(2000, start_month, 1)
+    last_month = pd.Timestamp(2000, (start_month - 2) % 12 + 1, 1)
+    labels = [f"FY{year} ({first_month:%b} {year - offset}-{last_month:%b} {year})" for year in years]
+    return make_buckets('fiscal', edges, years, labels)
+
+
+def billing_cycles(read_dates):
+    """Billing cycles between consecutive meter reads; each cycle ends at midnight starting its read date"""
+    reads = np.unique(np.asarray(read_dates, dtype='datetime64[D]'))
+    starts, ends = reads[:-1], reads[1:]
+    labels = [f"{pd.Timestamp(start):%b %d %Y} - {pd.Timestamp(end - 1):%b %d %Y}" for start, end in zip(starts, ends)]
+    return make_buckets('billing', reads, np.arange(1, len(starts) + 1), labels)
+
+
+def wall_to_utc(wall, timezone):
+    """UTC instants (int64 ns) of local wall-clock times in a time zone
+
+    Times skipped by a spring-forward change move forward to the first valid time; repeated
+    fall-back times are taken as the first (daylight) occurrence.
+    """
+    local = pd.DatetimeIndex(np.asarray(wall, dtype=np.int64).view('datetime64[ns]'))
+    localized = local.tz_localize(timezone, ambiguous=np.ones(len(local), dtype=bool), nonexistent='shift_forward')
+    return localized.tz_convert('UTC').tz_localize(None).to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+
+def bucket_hours(buckets, timezone=None):
+    """Elapsed hours of each period; with a time zone, periods containing a DST change are an hour shorter or longer"""
+    edges = buckets.edges if timezone is None else wall_to_utc(buckets.edges, timezone)
+    return np.diff(edges) / NS_PER_HOUR
+
+
+def assign(timestamps, buckets, timezone=None, utc=False):
+    """Period index of each timestamp (-1 outside every period), by binary search over the boundaries
+
+    Wall-clock timestamps are compared with the wall-clock boundaries directly. UTC timestamps
+    (utc=True) are compared with the boundaries' instants in the time zone, so a boundary at local
+    midnight falls on a different UTC hour in summer and winter.
+    """
+    edges = buckets.edges if not utc or timezone is None else wall_to_utc(buckets.edges, timezone)
+    index = np.searchsorted(edges, timestamps, side='right') - 1
+    index[(index < 0) | (index >= len(edges) - 1)] = -1
+    return index
+
+
+def yearly_rates(years, rates, reading_years):
+    """Rate of each reading's year, or of the nearest year in the table for years outside it"""
+    order = np.argsort(years)
+    position = np.clip(np.searchsorted(years[order], reading_years), 0, len(years) - 1)
+    below = np.maximum(position - 1, 0)
+    nearer = np.abs(years[order][below] - reading_years) < np.abs(years[order][position] - reading_years)
+    return rates[order][np.where(nearer, below, position)].astype(np.float64)
+
+
+def load_billing_reads(path=BILLING_CYCLES_FILE):
+    """Read meter-read dates per site from a CSV file ({site: (read dates, billed amounts)}), or None without a file
+
+    Rows without a site apply to every site that has no rows of its own. The `amount` column is optional;
+    each amount is the bill for the cycle ending at its read date.
+    """
+    if not os.path.exists(path):
+        return None
+    df = pd.read_csv(path)
+    if 'read_date' not in df.columns:
+        raise ValueError("Missing billing cycle column: read_date")
+    sites = df['site'].fillna('').astype(str) if 'site' in df.columns else pd.Series('', index=df.index)
+    amounts = df['amount'] if 'amount' in df.columns else pd.Series(np.nan, index=df.index)
+    df = pd.DataFrame({'site': sites, 'read_date': pd.to_datetime(df['read_date']).dt.normalize(), 'amount': amounts})
+    df = df.drop_duplicates(['site', 'read_date'], keep='last').sort_values(['site', 'read_date'])
+    return {
+        site: (rows['read_date'].to_numpy(dtype='datetime64[D]'), rows['amount'].to_numpy(dtype=np.float64))
+        for site, rows in df.groupby('site', sort=True)
+    }
+
+
+class BucketEngine:
+    """Re-buckets interval readings into periods and builds yearly-style rows, caching assignments per boundary set"""
+
+    def __init__(self):
+        # (interval version, bucket version, time zone) -> period index of every reading
+        self.assignments = {}
+        # (interval version, bucket version, rates version, site, time zone) -> period rows
+        self.rows_cache = {}
+
+    def assignment(self, intervals, buckets, timezone=None):
+        """Period index of every interval reading"""
+        cache_key = (intervals.version, buckets.version, timezone)
+        index = self.assignments.get(cache_key)
+        if index is None:
+            index = self.assignments[cache_key] = assign(intervals.timestamps, buckets, timezone)
+        return index
+
+    def reading_rates(self, intervals, site, years, rates, bills=None, timezone=None):
+        """Cost per kWh of each of a site's readings
+
+        Readings inside a billed cycle get the cycle's billed amount / kWh; the others get the yearly
+        average rate of their calendar year (the nearest year outside the table).
+        """
+        start, end = intervals.offsets[intervals.positions[site]], intervals.offsets[intervals.positions[site] + 1]
+        timestamps, kwh = intervals.timestamps[start:end], intervals.values[start:end]
+
+        reading_years = timestamps.view('datetime64[ns]').astype('datetime64[Y]').astype(np.int64) + 1970
+        result = yearly_rates(years, rates, reading_years)
+
+        if bills is not None:
+            read_dates, amounts = bills
+            if len(read_dates) > 1 and np.isfinite(amounts[1:]).any():
+                cycles = billing_cycles(read_dates)
+                index = self.assignment(intervals, cycles, timezone)[start:end]
+                inside = index >= 0
+                cycle_kwh = np.bincount(index[inside], weights=kwh[inside], minlength=len(cycles.keys))
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    cycle_rates = amounts[1:] / cycle_kwh
+                billed = inside & np.isfinite(cycle_rates[np.maximum(index, 0)])
+                result[billed] = cycle_rates[index[billed]]
+        return result
+
+    def period_rows(self, intervals, site, buckets, years, rates, bills=None, timezone=None):
+        """Yearly-style rows (year = period key) of one site's usage and cost per period
+
+        Returns (rows of the periods with enough readings, coverage of every period). The rows have the
+        same columns as the yearly data, so they can feed the same views and statistics.
+        """
+        cache_key = (intervals.version, buckets.version, array_version(years, rates), bills is not None and array_version(*bills), site, timezone)
+        result = self.rows_cache.get(cache_key)
+        if result is None:
+            i = intervals.positions[site]
+            start, end = intervals.offsets[i], intervals.offsets[i + 1]
+            index = self.assignment(intervals, buckets, timezone)[start:end]
+            kwh = intervals.values[start:end]
+            cost = kwh * self.reading_rates(intervals, site, np.asarray(years), np.asarray(rates), bills, timezone)
+
+            # One bincount per column over the readings that fall in a period
+            inside = index >= 0
+            n = len(buckets.keys)
+            usage = np.bincount(index[inside], weights=kwh[inside], minlength=n)
+            total_cost = np.bincount(index[inside], weights=cost[inside], minlength=n)
+            readings = np.bincount(index[inside], minlength=n)
+            coverage = readings * intervals.hours_per_interval / bucket_hours(buckets, timezone)
+
+            complete = coverage >= MIN_COVERAGE
+            rows = pd.DataFrame({
+                'year': buckets.keys[complete],
+                'totalUsage': usage[complete],
+                'totalCost': total_cost[complete].round(2)
+            })
+            result = (rows, coverage)
+            self.rows_cache[cache_key] = result
+        return result
@@ -0,0 +1,276 @@
+import os
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from bucketing import MIN_COVERAGE, yearly_rates
+from core import DATA_DIR, array_version
+
+# Optional budgets: one row per site and year (a whole-year budget) or per site, year and month
+BUDGETS_FILE = os.path.join(DATA_DIR, 'budgets.csv')
+BUDGET_COLUMNS = ['site', 'year', 'budget']
+
+# Days per month of a non-leap year, used to spread budgets of sites without a full year of readings
+MONTH_DAYS = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype=np.float64)
+
+
+class Budgets:
+    """Budget amounts per site, year and month (0 for a whole-year amount), sorted by site in compressed-row form"""
+
+    __slots__ = ('sites', 'positions', 'offsets', 'years', 'months', 'amounts', 'version')
+
+    def __init__(self, sites, offsets, years, months, amounts):
+        self.sites = list(sites)
+        self.positions = {site: i for i, site in enumerate(self.sites)}
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.years = np.asarray(years, dtype=np.int64)
+        self.months = np.asarray(months, dtype=np.int64)
+        self.amounts = np.asarray(amounts, dtype=np.float64)
+        self.version = array_version(self.offsets, self.years, self.months, self.amounts)
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build from a frame with site, year and budget columns (and an optional month column, 1-12)"""
+        missing = [col for col in BUDGET_COLUMNS if col not in df.columns]
+        if missing:
+            raise ValueError(f"Missing budget columns: {missing}")
+
+        # Rows without a site apply to every site that has no rows of its own
+        codes, names = pd.factorize(df['site'].fillna('').astype(str), sort=True)
+        years = df['year'].to_numpy(dtype=np.int64)
+        months = pd.to_numeric(df['month'], errors='coerce').fillna(0).to_numpy(dtype=np.int64) if 'month' in df.columns else np.zeros(len(df), dtype=np.int64)
+        if np.any((months < 0) | (months > 12)):
+            raise ValueError("Budget months must be between 1 and 12")
+        amounts = pd.to_numeric(df['budget'], errors='coerce').to_numpy(dtype=np.float64)
+
+        order = np.lexsort((months, years, codes))
+        order = order[np.isfinite(amounts[order])]
+        offsets = np.searchsorted(codes[order], np.arange(len(names) + 1))
+        return cls(names, offsets, years[order], months[order], amounts[order])
+
+    def budget_index(self, site):
+        """Index of the budget rows used for a site (its own, else the shared ones, else None)"""
+        for name in (site, ''):
+            if name in self.positions:
+                return self.positions[name]
+        return None
+
+    def has_budget(self, site):
+        return self.budget_index(site) is not None
+
+    def yearly(self, site):
+        """Years with a budget for a site and each year's total (whole-year plus monthly amounts)"""
+        position = self.budget_index(site)
+        if position is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        rows = slice(self.offsets[position], self.offsets[position + 1])
+        years, index = np.unique(self.years[rows], return_inverse=True)
+        return years, np.bincount(index, weights=self.amounts[rows], minlength=len(years))
+
+    def monthly(self, site, first_year, n_years, shares):
+        """(year, month) budget of a site; whole-year amounts are spread over the months by the given shares"""
+        result = np.zeros((n_years, 12))
+        position = self.budget_index(site)
+        if position is None:
+            return result
+        rows = slice(self.offsets[position], self.offsets[position + 1])
+        years, months, amounts = self.years[rows] - first_year, self.months[rows], self.amounts[rows]
+        inside = (years >= 0) & (years < n_years)
+        whole = inside & (months == 0)
+        np.add.at(result, (years[inside & ~whole], months[inside & ~whole] - 1), amounts[inside & ~whole])
+        np.add.at(result, years[whole], amounts[whole, None] * shares)
+        return result
+
+
+def load_budgets(path=BUDGETS_FILE):
+    """Read budgets from a CSV file, or return None if there is no file"""
+    if not os.path.exists(path):
+        return None
+    return Budgets.from_frame(pd.read_csv(path, dtype={'site': str}))
+
+
+def yearly_variance(sites, codes, years, actual, budgets):
+    """Budget against actual cost for yearly rows of many sites at once (row i belongs to sites[codes[i]])
+
+    Every row's (site, year) is looked up in one binary search over the budgets' (budget index, year)
+    totals. Returns the rows that have a budget, with budget, actual, variance and variancePct.
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    years = np.asarray(years, dtype=np.int64)
+    site_budgets = [budgets.budget_index(site) for site in sites]
+    row_budgets = np.array([-1 if budget is None else budget for budget in site_budgets], dtype=np.int64)[codes]
+
+    # Yearly totals of every site's budget rows, keyed by budget index * span + year offset
+    budget_of_row = np.repeat(np.arange(len(budgets.sites)), np.diff(budgets.offsets))
+    low = min(budgets.years.min(initial=0), years.min(initial=0))
+    span = max(budgets.years.max(initial=0), years.max(initial=0)) - low + 1
+    keys, index = np.unique(budget_of_row * span + (budgets.years - low), return_inverse=True)
+    totals = np.bincount(index, weights=budgets.amounts, minlength=len(keys))
+
+    lookup = row_budgets * span + (years - low)
+    found = np.zeros(len(years), dtype=np.int64)
+    match = np.zeros(len(years), dtype=bool)
+    if len(keys):
+        found = np.minimum(np.searchsorted(keys, lookup), len(keys) - 1)
+        match = (row_budgets >= 0) & (keys[found] == lookup)
+
+    budget = totals[found[match]]
+    spent = np.asarray(actual, dtype=np.float64)[match]
+    return pd.DataFrame({
+        'site': np.array(sites, dtype=object)[codes[match]],
+        'year': years[match],
+        'budget': budget,
+        'actual': spent,
+        'variance': spent - budget,
+        'variancePct': np.round((spent / budget - 1) * 100, 1)
+    })
+
+
+def portfolio_variance(portfolio, budgets):
+    """Budget against actual cost for every site and year of the portfolio that has a budget"""
+    codes = np.repeat(np.arange(len(portfolio.sites)), np.diff(portfolio.offsets))
+    return yearly_variance(portfolio.sites, codes, portfolio.years, portfolio.cost, budgets)
+
+
+class BudgetTracking(NamedTuple):
+    """Monthly actual and budgeted cost of every interval site, with prefix sums and year-end projections
+
+    Arrays are (site, year, month); cumulative sums restart every January.
+    """
+    sites: list
+    first_year: int
+    actual: np.ndarray          # cost of the readings in each month
+    coverage: np.ndarray        # share of each month's hours with readings
+    budget: np.ndarray          # budgeted cost of each month
+    shares: np.ndarray          # (site, month) seasonal share of the yearly cost
+    cum_actual: np.ndarray      # year-to-date actual cost at the end of each month
+    cum_budget: np.ndarray      # year-to-date budget at the end of each month
+    projected: np.ndarray       # year-end cost projected from each month's year-to-date cost and the seasonal shares
+    run_rate: np.ndarray        # year-end cost projected at the year-to-date average cost per day
+    version: str
+
+
+class BudgetStatus(NamedTuple):
+    """Where a site stands against its budget as of one month"""
+    site: str
+    year: int
+    month: int
+    actual_to_date: float
+    budget_to_date: float
+    variance: float
+    variance_pct: float
+    annual_budget: float
+    projected: float
+    run_rate: float
+    projected_variance_pct: float
+
+
+def monthly_costs(intervals, years, rates):
+    """(site, year, month) cost, usage-hour coverage and the first year, from one bincount over all readings"""
+    months = intervals.timestamps.view('datetime64[ns]').astype('datetime64[M]').astype(np.int64)
+    first_year = int(months.min() // 12) + 1970
+    n_years = int(months.max() // 12) + 1970 - first_year + 1
+    cells = intervals.site_codes() * (n_years * 12) + (months - (first_year - 1970) * 12)
+    size = len(intervals.sites) * n_years * 12
+
+    # Each reading is priced at the average cost per kWh of its year
+    rates = yearly_rates(np.asarray(years), np.asarray(rates), months // 12 + 1970)
+    cost = np.bincount(cells, weights=intervals.values * rates, minlength=size).reshape(-1, n_years, 12)
+    readings = np.bincount(cells, minlength=size).reshape(-1, n_years, 12)
+
+    month_starts = (np.arange(n_years * 12) + (first_year - 1970) * 12).astype('datetime64[M]')
+    hours = ((month_starts + 1).astype('datetime64[D]') - month_starts.astype('datetime64[D]')).astype(np.int64).reshape(n_years, 12) * 24
+    coverage = readings * (intervals.interval_minutes / 60) / hours
+    return cost, coverage, first_year
+
+
+def seasonal_shares(cost, coverage):
+    """(site, month) share of the yearly cost, averaged over each site's fully covered years
+
+    Sites without a fully covered year get shares by the number of days in each month.
+    """
+    complete = (coverage >= MIN_COVERAGE).all(axis=2)
+    totals = np.where(complete[..., None], cost, 0).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shares = totals / totals.sum(axis=1, keepdims=True)
+    fallback = ~np.isfinite(shares).all(axis=1)
+    shares[fallback] = MONTH_DAYS / MONTH_DAYS.sum()
+    return shares
+
+
+class BudgetEngine:
+    """Tracks sites against their budgets: yearly variance and monthly tracking built once per data version, statuses cached per site and month"""
+
+    def __init__(self):
+        # (interval version, rates version, budget version) -> BudgetTracking
+        self.trackings = {}
+        # (tracking version, site, year, month) -> BudgetStatus
+        self.statuses = {}
+        # (portfolio version, budget version) -> yearly variance rows of every site
+        self.variances = {}
+
+    def portfolio_variance(self, portfolio, budgets):
+        """Yearly budget variance of every portfolio site"""
+        cache_key = (portfolio.version, budgets.version)
+        result = self.variances.get(cache_key)
+        if result is None:
+            result = self.variances[cache_key] = portfolio_variance(portfolio, budgets)
+        return result
+
+    def tracking(self, intervals, years, rates, budgets):
+        """Monthly budget tracking of every interval site at once"""
+        cache_key = (intervals.version, array_version(np.asarray(years), np.asarray(rates)), budgets.version)
+        result = self.trackings.get(cache_key)
+        if result is None:
+            cost, coverage, first_year = monthly_costs(intervals, years, rates)
+            shares = seasonal_shares(cost, coverage)
+            budget = np.stack([budgets.monthly(site, first_year, cost.shape[1], shares[i]) for i, site in enumerate(intervals.sites)])
+
+            # Year-to-date sums are prefix sums along the month axis
+            cum_actual = np.cumsum(cost, axis=2)
+            cum_budget = np.cumsum(budget, axis=2)
+
+            # Share of the year's cost (seasonal) and of its days (run rate) that the readings so far cover
+            covered = np.minimum(coverage, 1)
+            seasonal_elapsed = np.cumsum(covered * shares[:, None, :], axis=2)
+            days_elapsed = np.cumsum(covered * (MONTH_DAYS / MONTH_DAYS.sum()), axis=2)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                projected = np.where(seasonal_elapsed > 0, cum_actual / seasonal_elapsed, np.nan)
+                run_rate = np.where(days_elapsed > 0, cum_actual / days_elapsed, np.nan)
+
+            result = BudgetTracking(
+                intervals.sites, first_year, cost, coverage, budget, shares, cum_actual, cum_budget,
+                projected, run_rate, array_version(cum_actual, cum_budget, projected)
+            )
+            self.trackings[cache_key] = result
+        return result
+
+    def status(self, tracking, site, year, month=None):
+        """Budget status of a site as of a month (by default the last month of the year with readings), or None"""
+        i = tracking.sites.index(site)
+        y = year - tracking.first_year
+        if not 0 <= y < tracking.actual.shape[1]:
+            return None
+        if month is None:
+            with_data = np.flatnonzero(tracking.coverage[i, y] > 0)
+            if len(with_data) == 0:
+                return None
+            month = int(with_data[-1]) + 1
+
+        cache_key = (tracking.version, site, year, month)
+        result = self.statuses.get(cache_key)
+        if result is None:
+            m = month - 1
+            actual, budget = tracking.cum_actual[i, y, m], tracking.cum_budget[i, y, m]
+            annual = tracking.cum_budget[i, y, 11]
+            projected = tracking.projected[i, y, m]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result = BudgetStatus(
+                    site, year, month, float(actual), float(budget), float(actual - budget),
+                    float((actual / budget - 1) * 100) if budget > 0 else np.nan,
+                    float(annual), float(projected), float(tracking.run_rate[i, y, m]),
+                    float((projected / annual - 1) * 100) if annual > 0 else np.nan
+                )
+            self.statuses[cache_key] = result
+        return result
@@ -0,0 +1,229 @@
+import base64
+import filecmp
+import hashlib
+import json
+import os
+import re
+import shutil
+from typing import NamedTuple
+
+import numpy as np
+import plotly
+from plotly.utils import PlotlyJSONEncoder
+
+# plotly.js bundle of the installed plotly package, the version its figure JSON is written for
+PLOTLY_JS = os.path.join(os.path.dirname(plotly.__file__), 'package_data', 'plotly.min.js')
+
+# Narrowest integer dtypes tried for integral data, with their plotly.js typed-array codes
+INTEGER_DTYPES = [(np.int8, 'i1'), (np.int16, 'i2'), (np.int32, 'i4')]
+
+# Placeholder left in the serialized skeleton where an encoded array goes
+PLACEHOLDER = re.compile(r'"__payload_(\d+)__"')
+
+# Arrays shorter than this are left as plain JSON lists (the base64 envelope isn't worth it)
+MIN_ENCODED_LENGTH = 8
+
+# Start positions tried when looking for one array inside another
+MAX_WINDOW_CANDIDATES = 16
+
+
+def _object_json(parts):
+    """JSON object text from already-serialized member values"""
+    return '{' + ','.join(json.dumps(name) + ':' + text for name, text in parts.items()) + '}'
+
+
+def install_plotly_js(directory):
+    """Copy the installed plotly package's plotly.js next to a chart component, unless it is there already"""
+    target = os.path.join(directory, 'plotly.min.js')
+    if os.path.exists(target) and filecmp.cmp(PLOTLY_JS, target):
+        return target
+    try:
+        shutil.copy2(PLOTLY_JS, target)
+    except OSError:
+        # A read-only install keeps the copy it has, if any
+        if not os.path.exists(target):
+            raise
+    return target
+
+
+def find_window(old, new):
+    """How a new 1-D array relates to the one the browser has: ('slice', start, stop) if it is a contiguous
+    part of it, ('extend', start, stop) if it contains it at new[start:stop], else None"""
+    if not isinstance(old, np.ndarray) or old.ndim != 1 or new.ndim != 1 or old.dtype != new.dtype or not len(old) or not len(new):
+        return None
+    short, long = (new, old) if len(new) <= len(old) else (old, new)
+    candidates = np.flatnonzero(long[:len(long) - len(short) + 1] == short[0])[:MAX_WINDOW_CANDIDATES]
+    for start in candidates.tolist():
+        if np.array_equal(long[start:start + len(short)], short):
+            return ('slice' if short is new else 'extend', start, start + len(short))
+    return None
+
+
+class ChartState(NamedTuple):
+    """What the browser holds of a chart after an update"""
+    rev: int
+    layout: dict        # layout key -> JSON text
+    data: list          # per trace: attribute -> JSON text
+    arrays: list        # per trace: attribute -> 1-D NumPy array, for attributes that are plain arrays
+    full_size: int      # length of the figure sent in full
+
+
+def encode_array(values):
+    """Encode a numeric array as a plotly.js typed-array spec using the narrowest lossless dtype"""
+    values = np.ascontiguousarray(values)
+
+    if values.dtype.kind == 'b':
+        values = values.astype(np.uint8)
+        code = 'u1'
+    elif values.dtype.kind in 'iu' or (values.dtype.kind == 'f' and np.isfinite(values).all() and np.array_equal(values, np.round(values))):
+        # Integral data goes into the smallest integer type that holds its range
+        low, high = (values.min(), values.max()) if values.size else (0, 0)
+        for dtype, code in INTEGER_DTYPES:
+            info = np.iinfo(dtype)
+            if info.min <= low and high <= info.max:
+                values = values.astype(dtype)
+                break
+        else:
+            values = values.astype(np.float64)
+            code = 'f8'
+    else:
+        # Floats drop to 32 bits only when that loses nothing
+        values = values.astype(np.float64)
+        narrow = values.astype(np.float32)
+        if np.array_equal(narrow.astype(np.float64), values, equal_nan=True):
+            values, code = narrow, 'f4'
+        else:
+            code = 'f8'
+
+    spec = {'dtype': code, 'bdata': base64.b64encode(values.tobytes()).decode('ascii')}
+    if values.ndim > 1:
+        spec['shape'] = ','.join(str(n) for n in values.shape)
+    return spec
+
+
+class PayloadCache:
+    """Pre-serialized typed-array payloads, keyed by content so repeated data is never re-encoded"""
+
+    def __init__(self, max_entries=2048):
+        self.entries = {}
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def encode(self, values):
+        """Return the JSON text of the typed-array spec for `values`, reusing earlier encodings"""
+        values = np.ascontiguousarray(values)
+        digest = hashlib.blake2b(values.view(np.uint8).ravel(), digest_size=16).digest()
+        key = (values.dtype.str, values.shape, digest)
+
+        fragment = self.entries.get(key)
+        if fragment is None:
+            self.misses += 1
+            fragment = json.dumps(encode_array(values), separators=(',', ':'))
+            if len(self.entries) >= self.max_entries:
+                # Drop the oldest entry (dicts keep insertion order)
+                self.entries.pop(next(iter(self.entries)))
+            self.entries[key] = fragment
+        else:
+            self.hits += 1
+        return fragment
+
+    def _extract_arrays(self, trace, fragments):
+        """Swap numeric arrays in a trace dict for placeholders, collecting their encoded fragments"""
+        skeleton = {}
+        for name, value in trace.items():
+            if isinstance(value, dict):
+                skeleton[name] = self._extract_arrays(value, fragments)
+            elif isinstance(value, np.ndarray) and value.dtype.kind in 'biuf' and value.size >= MIN_ENCODED_LENGTH:
+                skeleton[name] = f"__payload_{len(fragments)}__"
+                fragments.append(self.encode(value))
+            else:
+                skeleton[name] = value
+        return skeleton
+
+    def figure_json(self, fig):
+        """Serialize a figure with its trace data as base64 typed arrays"""
+        figure = fig.to_plotly_json()
+
+        # Only the small non-array remainder goes through the JSON encoder
+        fragments = []
+        skeleton = {
+            'data': [self._extract_arrays(trace, fragments) for trace in figure.get('data', [])],
+            'layout': figure.get('layout', {})
+        }
+        text = json.dumps(skeleton, cls=PlotlyJSONEncoder, separators=(',', ':'))
+
+        # Splice the cached array fragments back in with a single pass over the text
+        return PLACEHOLDER.sub(lambda match: fragments[int(match.group(1))], text)
+
+    def _part_json(self, value):
+        """JSON text of one trace attribute or layout key, with numeric arrays as cached typed-array fragments"""
+        if isinstance(value, np.ndarray) and value.dtype.kind in 'biuf' and value.size >= MIN_ENCODED_LENGTH:
+            return self.encode(value)
+        fragments = []
+        skeleton = self._extract_arrays(value, fragments) if isinstance(value, dict) else value
+        text = json.dumps(skeleton, cls=PlotlyJSONEncoder, separators=(',', ':'))
+        return PLACEHOLDER.sub(lambda match: fragments[int(match.group(1))], text) if fragments else text
+
+    def _array_patch(self, old, new):
+        """Patch text sending a plain array as a window of (or around) the one the browser has, or None"""
+        window = find_window(old, new)
+        if window is None:
+            return None
+        kind, start, stop = window
+        if kind == 'slice':
+            return f'{{"__slice__":[{start},{stop}]}}'
+        return f'{{"__extend__":[{self._part_json(new[:start])},{self._part_json(new[stop:])}]}}'
+
+    def figure_update(self, fig, previous=None, full=False, resend=False):
+        """Serialize a figure as an update of what the browser already has; returns (update text, new state)
+
+        An unchanged figure is sent as just its revision, which the browser already has, so there is
+        nothing to redraw (with `resend` it is sent in full anyway, for a browser that lost it). Without a
+        previous state, or with `full`, the figure is sent in full, numbered after the previous revision
+        so the browser never takes it for one it already drew. Otherwise only the layout keys and trace
+        attributes whose JSON changed are sent (null for removed ones), and a plain array that is a
+        window of the previous one (a narrower year range) or contains it (a wider one) is sent as a
+        slice of it or the values around it.
+        """
+        figure = fig.to_plotly_json()
+        layout = {name: self._part_json(value) for name, value in figure.get('layout', {}).items()}
+        traces = figure.get('data', [])
+        data = [{name: self._part_json(value) for name, value in trace.items()} for trace in traces]
+        arrays = [{name: value for name, value in trace.items() if isinstance(value, np.ndarray) and value.ndim == 1} for trace in traces]
+        figure_text = '"data":[' + ','.join(_object_json(trace) for trace in data) + '],"layout":' + _object_json(layout)
+
+        if previous is not None and not resend and layout == previous.layout and data == previous.data:
+            return f'{{"rev":{previous.rev},"base":{previous.rev}}}', previous._replace(arrays=arrays)
+
+        if previous is None or full or resend:
+            rev = 1 if previous is None else previous.rev + 1
+            text = f'{{"rev":{rev},"base":null,{figure_text}}}'
+            return text, ChartState(rev, layout, data, arrays, len(text))
+
+        # Changed and removed layout keys
+        layout_patch = {name: text for name, text in layout.items() if previous.layout.get(name) != text}
+        layout_patch.update((name, 'null') for name in previous.layout if name not in layout)
+
+        # Changed and removed attributes of each trace
+        trace_patches = {}
+        for i, trace in enumerate(data):
+            old = previous.data[i] if i < len(previous.data) else {}
+            old_arrays = previous.arrays[i] if i < len(previous.arrays) else {}
+            patch = {}
+            for name, text in trace.items():
+                if old.get(name) == text:
+                    continue
+                window = self._array_patch(old_arrays.get(name), arrays[i][name]) if name in arrays[i] and name in old else None
+                patch[name] = text if window is None or len(window) >= len(text) else window
+            patch.update((name, 'null') for name in old if name not in trace)
+            if patch:
+                trace_patches[str(i)] = _object_json(patch)
+
+        rev = previous.rev + 1
+        text = (
+            f'{{"rev":{rev},"base":{previous.rev},"length":{len(data)},'
+            f'"data":{_object_json(trace_patches)},"layout":{_object_json(layout_patch)}}}'
+        )
+        return text, ChartState(rev, layout, data, arrays, len(f'{{"rev":{rev},"base":null,{figure_text}}}'))
+
@@ -0,0 +1,290 @@
+import argparse
+import os
+
+import numpy as np
+
+from core import DATA_DIR
+from intervals import INTERVALS_FILE, IntervalData, load_intervals
+
+# Compressed interval readings (written from the CSV file with `python compression.py`)
+INTERVALS_STORE = os.path.join(DATA_DIR, 'intervals.npz')
+
+# Readings per chunk; chunks never span sites, and range queries decode only the chunks they overlap
+CHUNK_READINGS = 4096
+
+# Most decimal places tried when storing values as scaled integers; other values are XOR-encoded
+MAX_DECIMALS = 6
+
+# Value encodings
+SCALED, XOR = 0, 1
+
+# Largest integer a float64 holds exactly
+MAX_EXACT = 2**53
+
+
+def zigzag(values):
+    """Map signed integers to unsigned ones so small negative numbers stay small (0, -1, 1, -2 -> 0, 1, 2, 3)"""
+    values = np.asarray(values, dtype=np.int64)
+    return ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+
+def unzigzag(values):
+    values = np.asarray(values, dtype=np.uint64)
+    return (values >> np.uint64(1)).view(np.int64) ^ -(values & np.uint64(1)).view(np.int64)
+
+
+def byte_width(values):
+    """Bytes needed for the largest of some unsigned integers (0 when they are all zero)"""
+    if len(values) == 0:
+        return 0
+    largest = int(values.max())
+    return (largest.bit_length() + 7) // 8
+
+
+def pack(values, width):
+    """The low `width` bytes of each unsigned integer, little-endian, as one byte string"""
+    if width == 0:
+        return np.zeros(0, dtype=np.uint8)
+    return np.ascontiguousarray(values.astype('<u8').view(np.uint8).reshape(-1, 8)[:, :width]).ravel()
+
+
+def unpack(data, count, width):
+    """Inverse of pack: `count` unsigned integers from `width` bytes each"""
+    if width == 0:
+        return np.zeros(count, dtype=np.uint64)
+    if width in (1, 2, 4, 8):
+        return data.view(f'<u{width}').astype(np.uint64)
+    padded = np.zeros((count, 8), dtype=np.uint8)
+    padded[:, :width] = data.reshape(count, width)
+    return padded.view('<u8').ravel().astype(np.uint64)
+
+
+def encode_timestamps(timestamps):
+    """Delta-of-delta encoding: (first timestamp, first step, byte width, packed zigzag second differences)
+
+    Regular readings have second differences of zero, which take no bytes at all.
+    """
+    first = int(timestamps[0])
+    step = int(timestamps[1] - timestamps[0]) if len(timestamps) > 1 else 0
+    dod = zigzag(np.diff(timestamps, n=2)) if len(timestamps) > 2 else np.zeros(0, dtype=np.uint64)
+    width = byte_width(dod)
+    return first, step, width, pack(dod, width)
+
+
+def scale_decimals(values):
+    """Fewest decimal places (up to MAX_DECIMALS) that store every value exactly as a scaled integer, or None"""
+    if not np.isfinite(values).all():
+        return None
+    for decimals in range(MAX_DECIMALS + 1):
+        scaled = np.round(values * 10.0**decimals)
+        if np.abs(scaled).max(initial=0) >= MAX_EXACT:
+            return None
+        if np.array_equal(scaled / 10.0**decimals, values):
+            return decimals
+    return None
+
+
+def encode_values(values):
+    """(encoding, parameter, base, byte width, packed bytes) of a chunk of float64 values
+
+    Values with few decimals (meter kWh) become integers stored as zigzag deltas from the previous
+    value; anything else is XOR-ed with the previous value's bits, with the trailing zero bits the
+    whole chunk shares shifted away.
+    """
+    decimals = scale_decimals(values)
+    if decimals is not None:
+        scaled = np.round(values * 10.0**decimals).astype(np.int64)
+        deltas = zigzag(np.diff(scaled))
+        width = byte_width(deltas)
+        return SCALED, decimals, int(scaled[0]), width, pack(deltas, width)
+
+    bits = values.view(np.uint64)
+    xor = bits ^ np.concatenate([np.zeros(1, dtype=np.uint64), bits[:-1]])
+    nonzero = xor[xor != 0]
+    lowest = nonzero & (~nonzero + np.uint64(1))
+    shift = int(np.log2(lowest.astype(np.float64)).min()) if len(nonzero) else 0
+    xor = xor >> np.uint64(shift)
+    width = byte_width(xor)
+    return XOR, shift, 0, width, pack(xor, width)
+
+
+def decode_timestamps(first, step, width, data, out):
+    """Decode one chunk of timestamps into `out`"""
+    count = len(out)
+    if width == 0:
+        # Evenly spaced readings: no second differences were stored
+        np.multiply(np.arange(count, dtype=np.int64), step, out=out)
+        out += first
+        return out
+    steps = np.empty(count, dtype=np.int64)
+    steps[0] = first
+    steps[1:2] = step
+    steps[2:] = unzigzag(unpack(data, count - 2, width))
+    np.cumsum(steps[1:], out=steps[1:])
+    return np.cumsum(steps, out=out)
+
+
+def decode_values(encoding, parameter, base, width, data, out):
+    """Decode one chunk of values into `out`"""
+    count = len(out)
+    if encoding == SCALED:
+        scaled = np.empty(count, dtype=np.int64)
+        scaled[0] = base
+        scaled[1:] = unzigzag(unpack(data, count - 1, width))
+        np.cumsum(scaled, out=scaled)
+        # The same division as when the decimals were chosen, so every value comes back bit for bit
+        return np.divide(scaled, 10.0**parameter, out=out)
+    xor = unpack(data, count, width) << np.uint64(parameter)
+    return np.bitwise_xor.accumulate(xor, out=out.view(np.uint64)).view(np.float64)
+
+
+class CompressedIntervals:
+    """Interval readings in compressed chunks: delta-of-delta timestamps and scaled-integer or XOR kWh
+
+    Every chunk holds up to CHUNK_READINGS consecutive readings of one site, with its first and last
+    timestamps in the chunk table, so a query for some sites and years decodes only their chunks.
+    """
+
+    __slots__ = ('sites', 'interval_minutes', 'chunk_sites', 'chunk_counts', 'chunk_first', 'chunk_last',
+                 'time_meta', 'time_offsets', 'time_data', 'value_meta', 'value_offsets', 'value_data')
+
+    def __init__(self, sites, interval_minutes, chunk_sites, chunk_counts, chunk_first, chunk_last,
+                 time_meta, time_offsets, time_data, value_meta, value_offsets, value_data):
+        self.sites = list(sites)
+        self.interval_minutes = int(interval_minutes)
+        self.chunk_sites = np.asarray(chunk_sites, dtype=np.int64)
+        self.chunk_counts = np.asarray(chunk_counts, dtype=np.int64)
+        self.chunk_first = np.asarray(chunk_first, dtype=np.int64)
+        self.chunk_last = np.asarray(chunk_last, dtype=np.int64)
+        # (chunk, [first timestamp, first step, byte width]) and (chunk, [encoding, parameter, base, byte width])
+        self.time_meta = np.asarray(time_meta, dtype=np.int64).reshape(-1, 3)
+        self.value_meta = np.asarray(value_meta, dtype=np.int64).reshape(-1, 4)
+        # Byte ranges of each chunk in the packed buffers
+        self.time_offsets = np.asarray(time_offsets, dtype=np.int64)
+        self.time_data = np.asarray(time_data, dtype=np.uint8)
+        self.value_offsets = np.asarray(value_offsets, dtype=np.int64)
+        self.value_data = np.asarray(value_data, dtype=np.uint8)
+
+    @classmethod
+    def from_intervals(cls, intervals, chunk_readings=CHUNK_READINGS):
+        """Compress interval readings chunk by chunk"""
+        chunk_sites, chunk_counts, chunk_first, chunk_last = [], [], [], []
+        time_meta, time_chunks, value_meta, value_chunks = [], [], [], []
+        for i in range(len(intervals.sites)):
+            site_start, site_end = intervals.offsets[i], intervals.offsets[i + 1]
+            for start in range(site_start, site_end, chunk_readings):
+                end = min(start + chunk_readings, site_end)
+                timestamps, values = intervals.timestamps[start:end], intervals.values[start:end]
+                first, step, width, data = encode_timestamps(timestamps)
+                encoding, parameter, base, value_width, value_data = encode_values(values)
+
+                chunk_sites.append(i)
+                chunk_counts.append(end - start)
+                chunk_first.append(timestamps[0])
+                chunk_last.append(timestamps[-1])
+                time_meta.append((first, step, width))
+                time_chunks.append(data)
+                value_meta.append((encoding, parameter, base, value_width))
+                value_chunks.append(value_data)
+
+        def concatenate(chunks):
+            offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(chunk) for chunk in chunks])
+            return offsets, np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.uint8)
+
+        time_offsets, time_data = concatenate(time_chunks)
+        value_offsets, value_data = concatenate(value_chunks)
+        return cls(intervals.sites, intervals.interval_minutes, chunk_sites, chunk_counts, chunk_first, chunk_last,
+                   time_meta, time_offsets, time_data, value_meta, value_offsets, value_data)
+
+    def __len__(self):
+        return int(self.chunk_counts.sum())
+
+    @property
+    def nbytes(self):
+        """Bytes held by the compressed chunks and the chunk table"""
+        return sum(getattr(self, name).nbytes for name in self.__slots__[2:])
+
+    def chunks(self, year_range=None, sites=None):
+        """Indexes of the chunks holding readings of some sites (all by default) in a year range (inclusive)"""
+        selected = np.ones(len(self.chunk_counts), dtype=bool)
+        if sites is not None:
+            positions = [self.sites.index(site) for site in sites]
+            selected &= np.isin(self.chunk_sites, positions)
+        if year_range is not None:
+            start, end = year_bounds(year_range)
+            selected &= (self.chunk_last >= start) & (self.chunk_first < end)
+        return np.flatnonzero(selected)
+
+    def read(self, year_range=None, sites=None):
+        """Decode the readings of some sites (all by default) in a year range as IntervalData"""
+        wanted = None if sites is None else set(sites)
+        names = [site for site in self.sites if wanted is None or site in wanted]
+        chunks = self.chunks(year_range, names)
+        counts = self.chunk_counts[chunks]
+        ends = np.cumsum(counts)
+        timestamps = np.empty(int(ends[-1]) if len(ends) else 0, dtype=np.int64)
+        values = np.empty(len(timestamps))
+
+        # Each chunk decodes straight into its slice of the output, while its few KB are still in cache
+        for chunk, end, count in zip(chunks.tolist(), ends.tolist(), counts.tolist()):
+            start = end - count
+            first, step, width = self.time_meta[chunk].tolist()
+            decode_timestamps(first, step, width, self.time_data[self.time_offsets[chunk]:self.time_offsets[chunk + 1]], timestamps[start:end])
+            encoding, parameter, base, width = self.value_meta[chunk].tolist()
+            decode_values(encoding, parameter, base, width, self.value_data[self.value_offsets[chunk]:self.value_offsets[chunk + 1]], values[start:end])
+        codes = np.repeat(self.chunk_sites[chunks], counts)
+
+        # Chunks at the ends of the range can hold readings outside it
+        if year_range is not None:
+            start, end = year_bounds(year_range)
+            inside = (timestamps >= start) & (timestamps < end)
+            timestamps, values, codes = timestamps[inside], values[inside], codes[inside]
+
+        # Chunks are stored in site order, so each selected site's readings are one slice
+        positions = [self.sites.index(site) for site in names]
+        offsets = np.append(np.searchsorted(codes, positions), len(codes))
+        return IntervalData(names, offsets, timestamps, values, self.interval_minutes)
+
+    def save(self, path=INTERVALS_STORE):
+        """Write the chunks and the chunk table to one .npz file"""
+        arrays = {name: getattr(self, name) for name in self.__slots__[2:]}
+        np.savez(path, sites=np.array(self.sites, dtype=str), interval_minutes=self.interval_minutes, **arrays)
+
+    @classmethod
+    def load(cls, path=INTERVALS_STORE):
+        with np.load(path) as f:
+            return cls(f['sites'].tolist(), int(f['interval_minutes']), *(f[name] for name in cls.__slots__[2:]))
+
+
+def year_bounds(year_range):
+    """[start, end) of a year range as int64 nanoseconds"""
+    start = np.datetime64(f"{int(year_range[0])}-01-01", 'ns').astype(np.int64)
+    end = np.datetime64(f"{int(year_range[1]) + 1}-01-01", 'ns').astype(np.int64)
+    return start, end
+
+
+def load_compressed_intervals(path=INTERVALS_STORE):
+    """Read compressed interval readings, or return None if there is no file"""
+    if not os.path.exists(path):
+        return None
+    return CompressedIntervals.load(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compress interval readings from a CSV file")
+    parser.add_argument('source', nargs='?', default=INTERVALS_FILE, help="CSV file with site, timestamp and kwh columns")
+    parser.add_argument('target', nargs='?', default=INTERVALS_STORE, help="compressed .npz file to write")
+    args = parser.parse_args()
+
+    intervals = load_intervals(args.source)
+    if intervals is None:
+        parser.error(f"No such file: {args.source}")
+    store = CompressedIntervals.from_intervals(intervals)
+    store.save(args.target)
+    raw = intervals.timestamps.nbytes + intervals.values.nbytes
+    print(f"{len(intervals):,} readings: {raw / 1e6:,.1f} MB -> {store.nbytes / 1e6:,.2f} MB ({raw / max(store.nbytes, 1):,.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+# Identifier used for the dashboard's built-in single-site dataset
+DEFAULT_SITE = "main"
+
+# Optional local data files (interval readings, weather, ...) are read from here
+DATA_DIR = os.environ.get('ELECTRIC_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+
+# Time zone of the interval timestamps' wall clock (e.g. America/New_York), used for DST-aware period lengths;
+# without one every day counts as 24 hours
+TIMEZONE = os.environ.get('ELECTRIC_TIMEZONE') or None
+
+# Base columns that every engine reads from the yearly data
+BASE_COLUMNS = ['year', 'totalUsage', 'totalCost', 'costPerKwh']
+
+
+def data_version(df, columns=None):
+    """Return a short content hash identifying a version of the data"""
+    columns = columns or [col for col in BASE_COLUMNS if col in df.columns]
+
+    # Hash the column values only, so reordering the index doesn't change the version
+    row_hashes = pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+    return hashlib.sha1(row_hashes.tobytes()).hexdigest()[:16]
+
+
+def base_arrays(df):
+    """Extract the base columns of a yearly frame as float64 NumPy arrays"""
+    return {col: df[col].to_numpy(dtype=np.float64) for col in BASE_COLUMNS}
+
+
+def array_version(*arrays):
+    """Return a short content hash identifying a set of NumPy arrays"""
+    digest = hashlib.sha1()
+    for values in arrays:
+        values = np.ascontiguousarray(values)
+        digest.update(values.dtype.str.encode())
+        digest.update(values.view(np.uint8).ravel())
+    return digest.hexdigest()[:16]
+
+
+def file_modified(path):
+    """Modification time of a data file (None if it doesn't exist), used to key load caches"""
+    return os.path.getmtime(path) if os.path.exists(path) else None
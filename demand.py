@@ -0,0 +1,185 @@
+import numpy as np
+
+from intervals import NS_PER_MINUTE
+
+# Demand windows offered in the dashboard (minutes)
+DEMAND_WINDOWS = (15, 30)
+
+# Periods that peaks are reported for, as NumPy datetime units
+PERIODS = {'month': 'M', 'year': 'Y'}
+
+# Number of highest demands kept per site and period
+TOP_K = 3
+
+# Points on a load-duration curve (0%, 1%, ..., 100% of the time)
+LOAD_DURATION_POINTS = 101
+
+# Rows of the padded (group x reading) matrix handled per argpartition call, to bound memory
+PEAK_CHUNK_ROWS = 1024
+
+
+def rolling_demand(intervals, window_minutes):
+    """Average kW over a trailing window ending at each reading (NaN where the window isn't complete)"""
+    steps = max(1, int(round(window_minutes / intervals.interval_minutes)))
+    values = intervals.values
+    n = len(values)
+    demand = np.full(n, np.nan)
+    if n < steps:
+        return demand
+
+    # Trailing window sums from one prefix sum over all sites, written straight into the result
+    # (missing kWh count as zero here, so they can't spread into later windows or sites)
+    prefix = np.empty(n + 1)
+    prefix[0] = 0.0
+    missing = np.isnan(values)
+    has_missing = missing.any()
+    np.cumsum(np.where(missing, 0.0, values) if has_missing else values, out=prefix[1:])
+    windows = demand[steps - 1:]
+    np.subtract(prefix[steps:], prefix[:n - steps + 1], out=windows)
+    windows /= steps * intervals.interval_minutes / 60
+
+    # Windows holding a missing kWh value have no demand (a second prefix sum counts them)
+    if has_missing:
+        np.cumsum(missing, out=prefix[1:])
+        windows[prefix[steps:] != prefix[:n - steps + 1]] = np.nan
+    del prefix
+
+    # A window counts only if it has no gaps in its timestamps...
+    span = intervals.timestamps[steps - 1:] - intervals.timestamps[:n - steps + 1]
+    windows[span != (steps - 1) * intervals.interval_minutes * NS_PER_MINUTE] = np.nan
+
+    # ...and doesn't reach back into the previous site's readings
+    incomplete = (intervals.offsets[:-1, None] + np.arange(steps - 1)).ravel()
+    demand[incomplete[incomplete < n]] = np.nan
+    return demand
+
+
+def period_codes(timestamps, period='month'):
+    """Integer period index (months or years since 1970) of int64 nanosecond timestamps"""
+    return timestamps.view('datetime64[ns]').astype(f'datetime64[{PERIODS[period]}]').astype(np.int64)
+
+
+class PeakTable:
+    """Top-k demands of every (site, period) group, grouped by site in compressed-row form"""
+
+    __slots__ = ('sites', 'positions', 'offsets', 'periods', 'values', 'timestamps', 'period')
+
+    def __init__(self, sites, offsets, periods, values, timestamps, period):
+        self.sites = list(sites)
+        self.positions = {site: i for i, site in enumerate(self.sites)}
+        self.offsets = offsets
+        self.periods = periods
+        self.values = values
+        self.timestamps = timestamps
+        self.period = period
+
+    def lookup(self, site):
+        """Return period starts (datetime64), top-k kW (highest first) and their timestamps for one site"""
+        i = self.positions[site]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        starts = self.periods[start:end].astype(f'datetime64[{PERIODS[self.period]}]')
+        return starts, self.values[start:end], self.timestamps[start:end]
+
+
+def period_peaks(intervals, demand, period='month', k=TOP_K, chunk_rows=PEAK_CHUNK_ROWS):
+    """Find the k highest demands of every site and period with argpartition (no full sort)"""
+    periods = period_codes(intervals.timestamps, period)
+
+    # Readings are sorted by site then time, so each (site, period) group is a contiguous run
+    n = len(demand)
+    breaks = np.flatnonzero(np.diff(periods) != 0) + 1
+    starts = np.union1d(np.concatenate([[0], breaks]), intervals.offsets[:-1])
+    starts = starts[starts < n]
+    lengths = np.diff(np.append(starts, n))
+    n_groups = len(starts)
+
+    top_values = np.full((n_groups, k), np.nan)
+    top_positions = np.full((n_groups, k), -1, dtype=np.int64)
+
+    for first in range(0, n_groups, chunk_rows):
+        last = min(first + chunk_rows, n_groups)
+        lo, hi = starts[first], starts[last] if last < n_groups else n
+        chunk_lengths = lengths[first:last]
+        width = int(chunk_lengths.max())
+        kk = min(k, width)
+
+        # Pad the chunk's groups into a (group x slot) matrix and partition every row at once
+        rows = np.repeat(np.arange(last - first), chunk_lengths)
+        slots = np.arange(lo, hi) - np.repeat(starts[first:last], chunk_lengths)
+        padded = np.full((last - first, width), -np.inf)
+        padded[rows, slots] = demand[lo:hi]
+        padded[np.isnan(padded)] = -np.inf
+        top = np.argpartition(padded, width - kk, axis=1)[:, width - kk:]
+        values = np.take_along_axis(padded, top, axis=1)
+
+        # Order just the k survivors, highest first
+        order = np.argsort(-values, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        values = np.take_along_axis(values, order, axis=1)
+
+        found = np.isfinite(values)
+        top_values[first:last, :kk] = np.where(found, values, np.nan)
+        top_positions[first:last, :kk] = np.where(found, starts[first:last, None] + top, -1)
+
+    top_timestamps = np.where(top_positions >= 0, intervals.timestamps[np.maximum(top_positions, 0)], 0)
+    site_offsets = np.searchsorted(starts, intervals.offsets)
+    return PeakTable(intervals.sites, site_offsets, periods[starts], top_values, top_timestamps.view('datetime64[ns]'), period)
+
+
+def load_duration_curve(demand, points=LOAD_DURATION_POINTS):
+    """Demand exceeded for each share of the time (0-100%), from one partial sort at the curve points"""
+    values = demand[~np.isnan(demand)]
+    share = np.linspace(0, 100, points)
+    if len(values) == 0:
+        return share, np.full(points, np.nan)
+
+    # Position of each curve point in a descending order, mapped onto an ascending partition
+    ranks = np.round(share / 100 * (len(values) - 1)).astype(np.int64)
+    kth = len(values) - 1 - ranks
+    partitioned = np.partition(values, np.unique(kth))
+    return share, partitioned[kth]
+
+
+class DemandEngine:
+    """Computes demand series, period peaks and load-duration curves, caching each result"""
+
+    def __init__(self):
+        # (interval version, window) -> kW array aligned with the readings
+        self.demand_cache = {}
+        # (interval version, window, period, k) -> PeakTable
+        self.peak_cache = {}
+        # (interval version, site, window, year) -> (share, kW)
+        self.curve_cache = {}
+
+    def demand(self, intervals, window_minutes):
+        """Return the rolling demand of every reading for a window length"""
+        cache_key = (intervals.version, window_minutes)
+        demand = self.demand_cache.get(cache_key)
+        if demand is None:
+            demand = rolling_demand(intervals, window_minutes)
+            demand.flags.writeable = False
+            self.demand_cache[cache_key] = demand
+        return demand
+
+    def peaks(self, intervals, window_minutes, period='month', k=TOP_K):
+        """Return the top-k peak table for all sites"""
+        cache_key = (intervals.version, window_minutes, period, k)
+        table = self.peak_cache.get(cache_key)
+        if table is None:
+            table = period_peaks(intervals, self.demand(intervals, window_minutes), period, k)
+            self.peak_cache[cache_key] = table
+        return table
+
+    def load_duration(self, intervals, site, window_minutes, year=None):
+        """Return the load-duration curve of one site, optionally limited to a calendar year"""
+        cache_key = (intervals.version, site, window_minutes, year)
+        curve = self.curve_cache.get(cache_key)
+        if curve is None:
+            i = intervals.positions[site]
+            start, end = intervals.offsets[i], intervals.offsets[i + 1]
+            demand = self.demand(intervals, window_minutes)[start:end]
+            if year is not None:
+                demand = demand[period_codes(intervals.timestamps[start:end], 'year') == year - 1970]
+            curve = load_duration_curve(demand)
+            self.curve_cache[cache_key] = curve
+        return curve
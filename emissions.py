@@ -0,0 +1,234 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from core import DATA_DIR, array_version
+from intervals import NS_PER_HOUR
+
+# Hourly grid carbon intensity (g CO2e per kWh): one row per hour, optionally per site; CSV or Parquet
+GRID_INTENSITY_FILE = os.path.join(DATA_DIR, 'grid_intensity.csv')
+GRID_INTENSITY_PARQUET = os.path.join(DATA_DIR, 'grid_intensity.parquet')
+INTENSITY_COLUMNS = ['timestamp', 'intensity']
+
+# A reading takes the intensity of the latest hour at or before it, if that hour is at most this many hours back
+MAX_GAP_HOURS = 3
+
+# Years with fewer hours of intensity data have no yearly average intensity
+MIN_YEAR_HOURS = 24 * 300
+
+
+class GridIntensity:
+    """Hourly carbon intensity per grid site, sorted by site then hour in compressed-row form"""
+
+    __slots__ = ('sites', 'positions', 'offsets', 'hours', 'values', 'version', 'averages')
+
+    def __init__(self, sites, offsets, hours, values):
+        self.sites = list(sites)
+        self.positions = {site: i for i, site in enumerate(self.sites)}
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        # Hours since 1970-01-01 00:00 (wall clock, like the interval timestamps)
+        self.hours = np.asarray(hours, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.version = array_version(self.offsets, self.hours, self.values)
+        # (first year, (station, year) average intensity), built on first use
+        self.averages = None
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build from a frame with timestamp and intensity columns (and an optional site column)"""
+        missing = [col for col in INTENSITY_COLUMNS if col not in df.columns]
+        if missing:
+            raise ValueError(f"Missing grid intensity columns: {missing}")
+
+        # Rows without a site are shared by every site that has no rows of its own
+        sites = df['site'].fillna('').astype(str) if 'site' in df.columns else pd.Series('', index=df.index)
+        codes, names = pd.factorize(sites, sort=True)
+        hours = pd.to_datetime(df['timestamp']).to_numpy(dtype='datetime64[ns]').view(np.int64) // NS_PER_HOUR
+        values = pd.to_numeric(df['intensity'], errors='coerce').to_numpy(dtype=np.float64)
+
+        # Sort by (site, hour), drop missing values and keep the last row of any repeated hour
+        order = np.lexsort((hours, codes))
+        order = order[np.isfinite(values[order])]
+        codes, hours = codes[order], hours[order]
+        last = np.append((np.diff(codes) != 0) | (np.diff(hours) != 0), True)
+        order, codes, hours = order[last], codes[last], hours[last]
+
+        offsets = np.searchsorted(codes, np.arange(len(names) + 1))
+        return cls(names, offsets, hours, values[order])
+
+    def station(self, site):
+        """Index of the intensity series used for a site (its own, else the shared one, else None)"""
+        for name in (site, ''):
+            if name in self.positions:
+                return self.positions[name]
+        return None
+
+    def stations(self, sites):
+        """Intensity series index of each site (-1 where a site has none)"""
+        site_stations = [self.station(site) for site in sites]
+        return np.array([-1 if station is None else station for station in site_stations], dtype=np.int64)
+
+    def join(self, sites, codes, timestamps):
+        """Intensity for each (site code, timestamp) pair, NaN where there is no recent enough hour
+
+        Both sides are sorted by (site, time), so one binary search over a combined (station, hour)
+        key finds the latest intensity hour at or before every reading of every site at once.
+        """
+        codes = np.asarray(codes, dtype=np.intp)
+        hours = np.asarray(timestamps, dtype=np.int64) // NS_PER_HOUR
+        result = np.full(len(hours), np.nan)
+        if len(self.hours) == 0 or len(hours) == 0:
+            return result
+
+        # Intensity station of every reading (-1 where the site has none)
+        stations = self.stations(sites)[codes]
+
+        low = min(self.hours.min(), hours.min())
+        span = max(self.hours.max(), hours.max()) - low + 1
+        table_stations = np.repeat(np.arange(len(self.sites)), np.diff(self.offsets))
+        table = table_stations * span + (self.hours - low)
+        keys = stations * span + (hours - low)
+        found = np.searchsorted(table, keys, side='right') - 1
+        valid = found >= 0
+        found = np.maximum(found, 0)
+        match = valid & (stations >= 0) & (table_stations[found] == stations) & (keys - table[found] <= MAX_GAP_HOURS)
+
+        result[match] = self.values[found[match]]
+        return result
+
+    def yearly_averages(self):
+        """First year and the (station, year) matrix of average hourly intensity, NaN for years with too few hours"""
+        if self.averages is None:
+            years = (self.hours * NS_PER_HOUR).view('datetime64[ns]').astype('datetime64[Y]').astype(np.int64) + 1970
+            first = int(years.min()) if len(years) else 0
+            n_years = int(years.max()) - first + 1 if len(years) else 0
+
+            # One bincount over (station, year) cells for every station at once
+            cells = np.repeat(np.arange(len(self.sites)), np.diff(self.offsets)) * n_years + (years - first)
+            size = len(self.sites) * n_years
+            counts = np.bincount(cells, minlength=size)
+            totals = np.bincount(cells, weights=self.values, minlength=size)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                averages = np.where(counts >= MIN_YEAR_HOURS, totals / counts, np.nan)
+            self.averages = (first, averages.reshape(len(self.sites), n_years))
+        return self.averages
+
+    def yearly_average(self, site):
+        """Years with (nearly) complete data for a site's station, with their average hourly intensity"""
+        station = self.station(site)
+        if station is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        first, averages = self.yearly_averages()
+        complete = np.flatnonzero(np.isfinite(averages[station]))
+        return complete + first, averages[station, complete]
+
+
+def load_grid_intensity(path=GRID_INTENSITY_FILE, parquet_path=GRID_INTENSITY_PARQUET):
+    """Read hourly grid intensity from a CSV file (or else a Parquet file), or return None if there is neither"""
+    if os.path.exists(path):
+        return GridIntensity.from_frame(pd.read_csv(path))
+    if os.path.exists(parquet_path):
+        return GridIntensity.from_frame(pd.read_parquet(parquet_path))
+    return None
+
+
+def add_emissions(df, years, factors):
+    """Add totalEmissions (t CO2e), emissionsPerKwh (kg CO2e) and emissionsChange (%) to yearly rows
+
+    Like costPerKwh, the rate is total emissions / total usage; each year's emissions are its usage
+    times the year's emission factor (kg CO2e per kWh), NaN for years without one.
+    """
+    row_years = df['year'].to_numpy()
+    rate = np.full(len(df), np.nan)
+    if len(years):
+        found = np.minimum(np.searchsorted(years, row_years), len(years) - 1)
+        match = years[found] == row_years
+        rate[match] = factors[found[match]]
+    emissions = df['totalUsage'].to_numpy(dtype=np.float64) * rate / 1000
+    result = df.assign(totalEmissions=emissions, emissionsPerKwh=np.round(rate, 4))
+    result['emissionsChange'] = (result['totalEmissions'].pct_change(fill_method=None) * 100).round(1).fillna(0)
+    return result
+
+
+class EmissionsEngine:
+    """Joins interval readings with hourly grid intensity and caches the joined and yearly results"""
+
+    def __init__(self):
+        # (interval version, intensity version) -> intensity of every reading (g CO2e per kWh)
+        self.joins = {}
+        # (interval version, intensity version, site) -> (years, emission factors in kg CO2e per kWh)
+        self.factors_cache = {}
+
+    def reading_intensity(self, intervals, intensity):
+        """Intensity of every interval reading, falling back to the year's average where hours are missing"""
+        cache_key = (intervals.version, intensity.version)
+        result = self.joins.get(cache_key)
+        if result is None:
+            codes = intervals.site_codes()
+            result = intensity.join(intervals.sites, codes, intervals.timestamps)
+
+            # Fill readings without a recent hour from the yearly average of their station, looked up
+            # for all sites at once in the (station, year) matrix
+            missing = np.flatnonzero(np.isnan(result))
+            if len(missing):
+                first, averages = intensity.yearly_averages()
+                stations = intensity.stations(intervals.sites)[codes[missing]]
+                years = intervals.timestamps[missing].view('datetime64[ns]').astype('datetime64[Y]').astype(np.int64) + 1970 - first
+                known = (stations >= 0) & (years >= 0) & (years < averages.shape[1])
+                result[missing[known]] = averages[stations[known], years[known]]
+            self.joins[cache_key] = result
+        return result
+
+    def site_years(self, intervals, intensity):
+        """Usage, emissions and emissions per kWh of every interval site and calendar year"""
+        grams = self.reading_intensity(intervals, intensity)
+        codes = intervals.site_codes()
+        years = intervals.timestamps.view('datetime64[ns]').astype('datetime64[Y]').astype(np.int64) + 1970
+        first = int(years.min()) if len(years) else 0
+        n_years = int(years.max()) - first + 1 if len(years) else 0
+
+        # One bincount per column over (site, year) cells of the readings with an intensity
+        known = np.isfinite(grams)
+        cells = codes * n_years + (years - first)
+        size = len(intervals.sites) * n_years
+        usage = np.bincount(cells, weights=intervals.values, minlength=size)
+        emissions = np.bincount(cells[known], weights=intervals.values[known] * grams[known], minlength=size) / 1e6
+        covered = np.bincount(cells[known], weights=intervals.values[known], minlength=size)
+
+        rows = pd.DataFrame({
+            'site': np.repeat(np.array(intervals.sites, dtype=object), n_years),
+            'year': np.tile(np.arange(first, first + n_years), len(intervals.sites)),
+            'totalUsage': usage,
+            'totalEmissions': emissions,
+            'coverage': covered
+        })
+        rows = rows[rows['coverage'] > 0].reset_index(drop=True)
+        # Usage without any intensity is counted at the average rate of the rest of its year
+        rows['totalEmissions'] *= rows['totalUsage'] / rows['coverage']
+        rows['emissionsPerKwh'] = rows['totalEmissions'] * 1000 / rows['totalUsage']
+        rows['coverage'] = rows['coverage'] / rows['totalUsage']
+        return rows[['site', 'year', 'totalUsage', 'totalEmissions', 'emissionsPerKwh', 'coverage']]
+
+    def yearly_factors(self, site, intensity, intervals=None, sites=None):
+        """Emission factor (kg CO2e per kWh) of each year for a site's yearly data
+
+        Years with interval readings use the usage-weighted intensity of the interval sites (all of
+        them, or only those in `sites`), since the hour of use matters; other years use the plain
+        average of the year's hourly intensity.
+        """
+        cache_key = (intervals.version if intervals is not None else None, intensity.version, site, None if sites is None else tuple(sites))
+        result = self.factors_cache.get(cache_key)
+        if result is None:
+            years, averages = intensity.yearly_average(site)
+            factors = dict(zip(years.tolist(), (averages / 1000).tolist()))
+            if intervals is not None:
+                rows = self.site_years(intervals, intensity)
+                if sites is not None:
+                    rows = rows[rows['site'].isin(sites)]
+                totals = rows.assign(grams=rows['totalEmissions'] * 1e6).groupby('year')[['grams', 'totalUsage']].sum()
+                factors.update((totals['grams'] / totals['totalUsage'] / 1000).to_dict())
+            years = np.array(sorted(factors), dtype=np.int64)
+            result = (years, np.array([factors[year] for year in years.tolist()], dtype=np.float64))
+            self.factors_cache[cache_key] = result
+        return result
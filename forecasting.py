@@ -0,0 +1,256 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Forecasting models the engine can fit
+MODELS = {
+    'ets': "Exponential smoothing",
+    'arima': "ARIMA baseline"
+}
+
+# Smoothing parameter grids, searched for every series at once when fitting
+ALPHA_GRID = np.linspace(0.05, 0.95, 10)
+BETA_GRID = np.array([0.0, 0.05, 0.1, 0.2, 0.3, 0.5])
+GAMMA_GRID = np.array([0.0, 0.1, 0.3, 0.5])
+
+# Two-sided normal quantiles for the supported band widths
+Z_SCORES = {0.8: 1.2816, 0.9: 1.6449, 0.95: 1.9600}
+
+# Fit entries that describe the whole batch rather than one value per series
+BATCH_KEYS = ('model', 'season_length', 'n_periods', 'order')
+
+# Shortest history the models can be fitted to
+MIN_PERIODS = 3
+
+
+def _first_valid(values):
+    """Index of the first non-NaN value in each row"""
+    return np.argmax(~np.isnan(values), axis=1)
+
+
+def fit_exponential_smoothing(values, season_length=None):
+    """Fit additive Holt (or Holt-Winters when seasonal) smoothing to every row at once"""
+    values = np.asarray(values, dtype=np.float64)
+    n_series, n_periods = values.shape
+    rows = np.arange(n_series)
+
+    # Seasonality needs at least two full cycles to initialize
+    seasonal = bool(season_length) and season_length > 1 and n_periods >= 2 * season_length
+    m = season_length if seasonal else 1
+    gammas = GAMMA_GRID if seasonal else np.array([0.0])
+
+    # Flatten the parameter grid so each series is fitted against every combination in one pass
+    alpha, beta, gamma = (grid.ravel() for grid in np.meshgrid(ALPHA_GRID, BETA_GRID, gammas, indexing='ij'))
+    n_grid = alpha.size
+
+    # Initial states taken from the first valid observations of each row
+    first = _first_valid(values)
+    if seasonal:
+        window = np.minimum(first[:, None] + np.arange(2 * m), n_periods - 1)
+        cycles = values[rows[:, None], window]
+        first_mean = np.nanmean(cycles[:, :m], axis=1)
+        second_mean = np.nanmean(cycles[:, m:], axis=1)
+        trend0 = np.nan_to_num((second_mean - first_mean) / m)
+        level0 = first_mean + trend0 * (m - 1) / 2
+        season0 = np.zeros((n_series, m))
+        season0[rows[:, None], (first[:, None] + np.arange(m)) % m] = np.nan_to_num(cycles[:, :m] - first_mean[:, None])
+        start = first + m
+    else:
+        level0 = values[rows, first]
+        second = np.minimum(first + 1, n_periods - 1)
+        trend0 = np.nan_to_num(values[rows, second] - level0)
+        season0 = np.zeros((n_series, 1))
+        start = first + 1
+
+    level = np.repeat(level0[:, None], n_grid, axis=1)
+    trend = np.repeat(trend0[:, None], n_grid, axis=1)
+    # Seasonal states are stored season-major so each step updates one contiguous block
+    season = np.repeat(season0.T[:, :, None], n_grid, axis=2)
+    sse = np.zeros((n_series, n_grid))
+    count = np.zeros(n_series)
+
+    # The recursion runs over time only; series and parameter combinations are vectorized
+    for t in range(n_periods):
+        y = values[:, t][:, None]
+        active = (t >= start)[:, None]
+        observed = active & ~np.isnan(y)
+
+        s_idx = t % m
+        s_prev = season[s_idx]
+        projected = level + trend
+        error = np.where(observed, y - projected - s_prev, 0.0)
+        sse += error ** 2
+        count += observed[:, 0]
+
+        # Missing periods advance the state along the trend without an update
+        new_level = np.where(observed, projected + alpha * error, np.where(active, projected, level))
+        trend = np.where(observed, trend + beta * (new_level - projected), trend)
+        if seasonal:
+            season[s_idx] = np.where(observed, gamma * (y - new_level) + (1 - gamma) * s_prev, s_prev)
+        level = new_level
+
+    # Pick the parameter combination with the lowest in-sample error for each series
+    best = np.argmin(sse, axis=1)
+    sigma = np.sqrt(sse[rows, best] / np.maximum(count, 1))
+
+    return {
+        'model': 'ets',
+        'alpha': alpha[best],
+        'beta': beta[best],
+        'gamma': gamma[best],
+        'level': level[rows, best],
+        'trend': trend[rows, best],
+        'season': season[:, rows, best].T,
+        'season_length': m,
+        'n_periods': n_periods,
+        'sigma': sigma,
+    }
+
+
+def forecast_exponential_smoothing(fit, horizon):
+    """Point forecasts and forecast standard errors for fitted smoothing models"""
+    steps = np.arange(1, horizon + 1)
+    m = fit['season_length']
+
+    season_idx = (fit['n_periods'] - 1 + steps) % m
+    mean = fit['level'][:, None] + fit['trend'][:, None] * steps + fit['season'][:, season_idx]
+
+    # Additive Holt-Winters variance: sigma^2 * (1 + sum_j (alpha + alpha*beta*j + gamma*[j % m == 0])^2)
+    j = np.arange(1, horizon)
+    seasonal_hit = (j % m == 0) if m > 1 else np.zeros_like(j, dtype=bool)
+    c = fit['alpha'][:, None] * (1 + fit['beta'][:, None] * j) + fit['gamma'][:, None] * seasonal_hit
+    cumulative = np.concatenate([np.zeros((len(mean), 1)), np.cumsum(c ** 2, axis=1)], axis=1)
+    std_error = fit['sigma'][:, None] * np.sqrt(1 + cumulative)
+
+    return mean, std_error
+
+
+def fit_arima(values, order=2):
+    """Fit an ARIMA(p, 1, 0) model with drift to every row using one batched least-squares solve"""
+    values = np.asarray(values, dtype=np.float64)
+    n_series, n_periods = values.shape
+    diffs = np.diff(values, axis=1)
+
+    # Keep at least three observations per coefficient on short histories
+    order = int(max(0, min(order, (n_periods - 1) // 3 - 1)))
+
+    # Lagged design matrix: [1, d(t-1), ..., d(t-p)] -> d(t)
+    windows = sliding_window_view(diffs, order + 1, axis=1)
+    target = windows[..., -1]
+    lags = windows[..., :-1][..., ::-1]
+    design = np.concatenate([np.ones(target.shape + (1,)), lags], axis=2)
+
+    # Rows touching missing values are zeroed out of the normal equations
+    usable = ~np.isnan(target) & ~np.isnan(lags).any(axis=2)
+    design = np.where(usable[..., None], design, 0.0)
+    target = np.where(usable, target, 0.0)
+
+    xtx = np.einsum('snk,snl->skl', design, design)
+    xty = np.einsum('snk,sn->sk', design, target)
+
+    # A tiny ridge keeps rank-deficient (very short or constant) series solvable
+    ridge = 1e-9 * (np.trace(xtx, axis1=1, axis2=2)[:, None, None] + 1.0) * np.eye(order + 1)
+    coefficients = np.linalg.solve(xtx + ridge, xty[..., None])[..., 0]
+
+    residuals = np.where(usable, target - np.einsum('snk,sk->sn', design, coefficients), 0.0)
+    dof = np.maximum(usable.sum(axis=1) - (order + 1), 1)
+    sigma = np.sqrt((residuals ** 2).sum(axis=1) / dof)
+
+    # Forecasting starts from the most recent level and the last `order` differences
+    rows = np.arange(n_series)
+    last = n_periods - 1 - np.argmax(~np.isnan(values[:, ::-1]), axis=1)
+    last_level = values[rows, last]
+    recent = np.nan_to_num(diffs[:, diffs.shape[1] - order:][:, ::-1]) if order else np.zeros((n_series, 0))
+
+    return {
+        'model': 'arima',
+        'order': order,
+        'drift': coefficients[:, 0],
+        'phi': coefficients[:, 1:],
+        'level': last_level,
+        'recent': recent,
+        'sigma': sigma,
+    }
+
+
+def forecast_arima(fit, horizon):
+    """Point forecasts and forecast standard errors for fitted ARIMA models"""
+    order = fit['order']
+    phi = fit['phi']
+    n_series = len(fit['level'])
+
+    # Roll the difference recursion forward, then integrate back to levels
+    history = fit['recent'].copy()
+    steps = np.empty((n_series, horizon))
+    for h in range(horizon):
+        step = fit['drift'] + (phi * history).sum(axis=1) if order else fit['drift'].copy()
+        steps[:, h] = step
+        if order:
+            history = np.concatenate([step[:, None], history[:, :-1]], axis=1)
+    mean = fit['level'][:, None] + np.cumsum(steps, axis=1)
+
+    # Psi weights of the differenced process, accumulated for the integrated level
+    psi = np.zeros((n_series, horizon))
+    psi[:, 0] = 1.0
+    for j in range(1, horizon):
+        k = min(order, j)
+        if k:
+            psi[:, j] = (phi[:, :k] * psi[:, j - 1::-1][:, :k]).sum(axis=1)
+    level_psi = np.cumsum(psi, axis=1)
+    std_error = fit['sigma'][:, None] * np.sqrt(np.cumsum(level_psi ** 2, axis=1))
+
+    return mean, std_error
+
+
+class FittedForecast:
+    """Fitted parameters for one series, sliced out of a batched fit"""
+
+    __slots__ = ('model', 'params')
+
+    def __init__(self, model, params):
+        self.model = model
+        self.params = params
+
+    def predict(self, horizon, interval=0.9):
+        """Return (mean, lower, upper) arrays for the next `horizon` periods"""
+        params = {key: value if key in BATCH_KEYS else np.asarray(value)[None] for key, value in self.params.items()}
+        if self.model == 'ets':
+            mean, std_error = forecast_exponential_smoothing(params, horizon)
+        else:
+            mean, std_error = forecast_arima(params, horizon)
+
+        z = Z_SCORES[interval]
+        return mean[0], mean[0] - z * std_error[0], mean[0] + z * std_error[0]
+
+
+class ForecastEngine:
+    """Fits forecasting models in batches and caches them per (site, metric, data version)"""
+
+    def __init__(self):
+        # (site, metric, data version, model, season length) -> FittedForecast
+        self.cache = {}
+        self.fits = 0
+
+    def fit(self, keys, values, version, model='ets', season_length=None):
+        """Return fitted models for each (site, metric) row, fitting only the uncached rows in one batch"""
+        if model not in MODELS:
+            raise ValueError(f"Unknown forecasting model '{model}', expected one of {list(MODELS)}")
+
+        values = np.asarray(values, dtype=np.float64)
+        if values.shape[1] < MIN_PERIODS:
+            raise ValueError(f"At least {MIN_PERIODS} periods are needed to fit a forecast")
+        cache_keys = [(site, metric, version, model, season_length) for site, metric in keys]
+        pending = [i for i, key in enumerate(cache_keys) if key not in self.cache]
+
+        if pending:
+            if model == 'ets':
+                batch = fit_exponential_smoothing(values[pending], season_length)
+            else:
+                batch = fit_arima(values[pending])
+
+            # Slice the batched parameters back into per-series fits
+            for row, i in enumerate(pending):
+                params = {key: value if key in BATCH_KEYS else value[row] for key, value in batch.items()}
+                self.cache[cache_keys[i]] = FittedForecast(model, params)
+            self.fits += len(pending)
+
+        return [self.cache[key] for key in cache_keys]
@@ -0,0 +1,297 @@
+import copy
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from core import DATA_DIR, array_version
+
+# Optional meter hierarchy: one row per node with its parent (empty at the top), e.g. meter -> building -> campus -> portfolio
+HIERARCHY_FILE = os.path.join(DATA_DIR, 'hierarchy.csv')
+HIERARCHY_COLUMNS = ['node', 'parent']
+
+# Rollup quantities, in the order of the last axis of the (node, year, quantity) matrices
+QUANTITIES = ('usage', 'cost', 'rows')
+
+# Nodes of a cycle named in the error message
+MAX_CYCLE_SHOWN = 8
+
+
+def find_cycle(parents):
+    """Indices of the nodes on one cycle of a parent-index array (child to parent), or None if it has none
+
+    Pointer doubling jumps every node 2, 4, 8, ... steps up at once; after n steps only nodes on or
+    below a cycle haven't reached the top, and where they land is on the cycle.
+    """
+    n = len(parents)
+    # Index n stands for "above the top", its own parent
+    jumps = np.append(np.where(parents >= 0, parents, n), n)
+    for _ in range(max(1, int(n).bit_length())):
+        jumps = jumps[jumps]
+    stuck = np.flatnonzero(jumps[:n] != n)
+    if len(stuck) == 0:
+        return None
+    start = cycle_node = int(jumps[stuck[0]])
+    cycle = []
+    while True:
+        cycle.append(cycle_node)
+        cycle_node = int(parents[cycle_node])
+        if cycle_node == start:
+            return cycle
+
+
+class Hierarchy:
+    """A forest of meters and groups stored as a parent-index array, with every (node, ancestor) pair precomputed"""
+
+    __slots__ = ('nodes', 'positions', 'parents', 'levels', 'depths', 'pair_nodes', 'pair_ancestors', 'version')
+
+    def __init__(self, nodes, parents, levels=None):
+        self.nodes = list(nodes)
+        self.positions = {node: i for i, node in enumerate(self.nodes)}
+        # Index of each node's parent, -1 for top-level nodes
+        self.parents = np.asarray(parents, dtype=np.int64)
+        n = len(self.nodes)
+
+        cycle = find_cycle(self.parents)
+        if cycle is not None:
+            path = ' -> '.join(self.nodes[i] for i in (cycle + cycle[:1] if len(cycle) <= MAX_CYCLE_SHOWN else cycle[:MAX_CYCLE_SHOWN]))
+            more = '' if len(cycle) <= MAX_CYCLE_SHOWN else f" -> ... ({len(cycle):,} nodes)"
+            raise ValueError(f"The meter hierarchy has a cycle: {path}{more}")
+
+        # Walk every node's parent chain one step at a time, all nodes at once; each step adds a (node, ancestor) pair
+        pair_nodes, pair_ancestors = [np.arange(n)], [np.arange(n)]
+        self.depths = np.zeros(n, dtype=np.int64)
+        current = self.parents.copy()
+        above = np.flatnonzero(current >= 0)
+        while len(above):
+            self.depths[above] += 1
+            pair_nodes.append(above)
+            pair_ancestors.append(current[above])
+            current[above] = self.parents[current[above]]
+            above = above[current[above] >= 0]
+        self.pair_nodes = np.concatenate(pair_nodes)
+        self.pair_ancestors = np.concatenate(pair_ancestors)
+
+        self.levels = [f"Level {depth}" for depth in self.depths] if levels is None else list(levels)
+        self.version = array_version(np.array(self.nodes, dtype=str), self.parents, np.array(self.levels, dtype=str))
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build from a frame with node and parent columns (and an optional level column)"""
+        missing = [col for col in HIERARCHY_COLUMNS if col not in df.columns]
+        if missing:
+            raise ValueError(f"Missing hierarchy columns: {missing}")
+
+        # The last row of a repeated node wins; parents that aren't listed become top-level nodes
+        df = df.assign(node=df['node'].astype(str)).drop_duplicates('node', keep='last')
+        parent_names = [None if pd.isna(parent) or parent == '' else str(parent) for parent in df['parent']]
+        listed = set(df['node'])
+        nodes = df['node'].tolist() + sorted({parent for parent in parent_names if parent is not None and parent not in listed})
+        positions = {node: i for i, node in enumerate(nodes)}
+        parents = [-1 if parent is None else positions[parent] for parent in parent_names] + [-1] * (len(nodes) - len(df))
+
+        levels = None
+        if 'level' in df.columns:
+            levels = [str(level) if not pd.isna(level) else '' for level in df['level']] + [''] * (len(nodes) - len(df))
+        hierarchy = cls(nodes, parents)
+        if levels is not None:
+            hierarchy.levels = [level or default for level, default in zip(levels, hierarchy.levels)]
+        return hierarchy
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def children(self, node):
+        """Indices of a node's direct children"""
+        return np.flatnonzero(self.parents == self.positions[node])
+
+    def descendants(self, node):
+        """Indices of a node and every node below it"""
+        return self.pair_nodes[self.pair_ancestors == self.positions[node]]
+
+    def ancestors(self, node):
+        """Indices of a node's ancestors, top-level first (not including the node)"""
+        i = self.positions[node]
+        found = self.pair_ancestors[(self.pair_nodes == i) & (self.pair_ancestors != i)]
+        return found[np.argsort(self.depths[found])]
+
+    def tree_order(self):
+        """Node indices in depth-first order, children in file order"""
+        children = {}
+        for i, parent in enumerate(self.parents.tolist()):
+            children.setdefault(parent, []).append(i)
+        order, stack = [], list(reversed(children.get(-1, [])))
+        while stack:
+            i = stack.pop()
+            order.append(i)
+            stack.extend(reversed(children.get(i, [])))
+        return order
+
+
+def load_hierarchy(path=HIERARCHY_FILE):
+    """Read the meter hierarchy from a CSV file, or return None if there is no file"""
+    if not os.path.exists(path):
+        return None
+    return Hierarchy.from_frame(pd.read_csv(path, dtype=str))
+
+
+class Rollup:
+    """Usage and cost of every node and year: its own rows plus those of all its descendants
+
+    Nodes take the yearly rows of the portfolio site with the same name; a group node can have rows
+    of its own as well (charges billed to the building or campus rather than to a meter).
+    """
+
+    def __init__(self, hierarchy, portfolio):
+        self.hierarchy = hierarchy
+        self.portfolio = portfolio
+        self.years = np.unique(portfolio.years)
+        # Portfolio site of each node (-1 for nodes without rows of their own)
+        self.node_sites = np.array([portfolio.positions.get(node, -1) for node in hierarchy.nodes], dtype=np.int64)
+        # (node, year, quantity) matrices
+        self.own = self._own_rows(np.arange(len(hierarchy)))
+        self.totals = np.zeros_like(self.own)
+        # Every node's rows are added to itself and all its ancestors in one reduction over the (node, ancestor) pairs
+        np.add.at(self.totals, hierarchy.pair_ancestors, self.own[hierarchy.pair_nodes])
+        self.version = array_version(self.totals)
+        self.allocated = None
+
+    def _own_rows(self, nodes):
+        """(node, year, quantity) matrix of some nodes' own portfolio rows"""
+        sites = self.node_sites[nodes]
+        has_rows = np.flatnonzero(sites >= 0)
+        offsets = self.portfolio.offsets
+        counts = offsets[sites[has_rows] + 1] - offsets[sites[has_rows]]
+        rows = np.repeat(offsets[sites[has_rows]] - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+
+        # One bincount per quantity over (node, year) cells
+        cells = np.repeat(has_rows, counts) * len(self.years) + np.searchsorted(self.years, self.portfolio.years[rows])
+        size = len(nodes) * len(self.years)
+        own = np.stack([
+            np.bincount(cells, weights=self.portfolio.usage[rows], minlength=size),
+            np.bincount(cells, weights=self.portfolio.cost[rows], minlength=size),
+            np.bincount(cells, minlength=size).astype(np.float64)
+        ], axis=-1)
+        return own.reshape(len(nodes), len(self.years), len(QUANTITIES))
+
+    def update(self, portfolio):
+        """Move to a new version of the portfolio, propagating only the changed sites' rows up their ancestor paths
+
+        Returns the number of changed nodes. A changed set of sites or years rebuilds everything.
+        """
+        if portfolio.sites != self.portfolio.sites or not np.isin(portfolio.years, self.years).all():
+            self.__init__(self.hierarchy, portfolio)
+            return len(self.hierarchy)
+
+        changed_sites = portfolio.changed_sites(self.portfolio)
+        self.portfolio = portfolio
+        changed = np.flatnonzero(np.isin(self.node_sites, changed_sites))
+        if len(changed) == 0:
+            return 0
+
+        # Add the difference of each changed node's rows to the node and its ancestors
+        fresh = self._own_rows(changed)
+        delta = fresh - self.own[changed]
+        self.own[changed] = fresh
+        pairs = np.flatnonzero(np.isin(self.hierarchy.pair_nodes, changed))
+        source = np.searchsorted(changed, self.hierarchy.pair_nodes[pairs])
+        np.add.at(self.totals, self.hierarchy.pair_ancestors[pairs], delta[source])
+        self.version = array_version(self.totals)
+        self.allocated = None
+        return len(changed)
+
+    def updated(self, portfolio):
+        """A copy of the rollup moved to a new version of the portfolio (see update), leaving this one as it is"""
+        rollup = copy.copy(self)
+        rollup.own, rollup.totals = self.own.copy(), self.totals.copy()
+        rollup.update(portfolio)
+        return rollup
+
+    def has_data(self, node):
+        return bool(self.totals[self.hierarchy.positions[node], :, 2].any())
+
+    def frame(self, node):
+        """Yearly rows of one node's rollup (the years with any rows below it), in the yearly data's schema"""
+        i = self.hierarchy.positions[node]
+        present = self.totals[i, :, 2] > 0
+        return pd.DataFrame({
+            'year': self.years[present],
+            'totalUsage': self.totals[i, present, 0],
+            'totalCost': self.totals[i, present, 1]
+        })
+
+    def allocated_cost(self):
+        """(node, year) cost including a share of the charges billed directly to each of its ancestors
+
+        A group's own charges are split over everything below it in proportion to usage, so the
+        allocated costs of a group's children add up to the group's total cost.
+        """
+        if self.allocated is None:
+            usage, own_usage, own_cost = self.totals[..., 0], self.own[..., 0], self.own[..., 1]
+            below = usage - own_usage
+            nodes, ancestors = self.hierarchy.pair_nodes, self.hierarchy.pair_ancestors
+            strict = nodes != ancestors
+            nodes, ancestors = nodes[strict], ancestors[strict]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                shares = np.where(below[ancestors] > 0, usage[nodes] / below[ancestors], 0)
+            self.allocated = self.totals[..., 1].copy()
+            np.add.at(self.allocated, nodes, own_cost[ancestors] * shares)
+        return self.allocated
+
+    def breakdown(self, node, year_range):
+        """Usage, cost and allocated cost of a node's children (and its own rows) over a year range"""
+        hierarchy = self.hierarchy
+        i = hierarchy.positions[node]
+        years = (self.years >= year_range[0]) & (self.years <= year_range[1])
+        children = hierarchy.children(node)
+        allocated = self.allocated_cost()
+
+        rows = pd.DataFrame({
+            'node': [hierarchy.nodes[child] for child in children],
+            'level': [hierarchy.levels[child] for child in children],
+            'totalUsage': self.totals[children][:, years, 0].sum(axis=1),
+            'totalCost': self.totals[children][:, years, 1].sum(axis=1),
+            'allocatedCost': allocated[children][:, years].sum(axis=1)
+        })
+        if self.own[i, years, 2].any():
+            rows.loc[len(rows)] = [f"{node} (billed directly)", hierarchy.levels[i], self.own[i, years, 0].sum(), self.own[i, years, 1].sum(), 0.0]
+        total_usage = self.totals[i, years, 0].sum()
+        rows['usageShare'] = rows['totalUsage'] / total_usage * 100 if total_usage else np.nan
+        return rows
+
+    def child_years(self, node, year_range):
+        """Yearly usage and cost of each of a node's children over a year range (one row per child and year with rows)"""
+        children = self.hierarchy.children(node)
+        years = np.flatnonzero((self.years >= year_range[0]) & (self.years <= year_range[1]))
+        totals = self.totals[children][:, years]
+        present = totals[..., 2] > 0
+        return pd.DataFrame({
+            'node': np.repeat(np.array([self.hierarchy.nodes[child] for child in children], dtype=object), len(years))[present.ravel()],
+            'year': np.tile(self.years[years], len(children))[present.ravel()],
+            'totalUsage': totals[..., 0][present],
+            'totalCost': totals[..., 1][present]
+        })
+
+
+class HierarchyEngine:
+    """Keeps the rollup of each hierarchy and carries it over to new versions of the site data"""
+
+    def __init__(self):
+        # hierarchy version -> Rollup of the latest portfolio version asked for
+        self.rollups = {}
+        self.lock = threading.Lock()
+
+    def rollup(self, hierarchy, portfolio):
+        """Return the rollup of a hierarchy for the given portfolio version
+
+        A rollup is never changed once returned: another portfolio version gets an updated copy, so
+        sessions showing different versions each keep reading their own.
+        """
+        with self.lock:
+            rollup = self.rollups.get(hierarchy.version)
+            if rollup is None:
+                rollup = self.rollups[hierarchy.version] = Rollup(hierarchy, portfolio)
+            elif rollup.portfolio.version != portfolio.version:
+                rollup = self.rollups[hierarchy.version] = rollup.updated(portfolio)
+        return rollup
@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from core import DATA_DIR, array_version
+
+# Interval meter readings: one row per (site, timestamp) with the energy used in that interval
+INTERVALS_FILE = os.path.join(DATA_DIR, 'intervals.csv')
+INTERVAL_COLUMNS = ['site', 'timestamp', 'kwh']
+
+NS_PER_MINUTE = 60 * 10**9
+NS_PER_HOUR = 60 * NS_PER_MINUTE
+NS_PER_DAY = 24 * NS_PER_HOUR
+
+
+class IntervalData:
+    """Interval readings for many sites, sorted by site then time, stored in compressed-row form"""
+
+    __slots__ = ('sites', 'positions', 'offsets', 'timestamps', 'values', 'interval_minutes', 'missing', 'version')
+
+    def __init__(self, sites, offsets, timestamps, values, interval_minutes, missing=0):
+        self.sites = list(sites)
+        self.positions = {site: i for i, site in enumerate(self.sites)}
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        # Wall-clock timestamps as int64 nanoseconds (datetime64[ns] without a time zone)
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.interval_minutes = interval_minutes
+        # Readings left out when loading because they had no kWh value
+        self.missing = missing
+        self.version = array_version(self.offsets, self.timestamps, self.values)
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build from a frame with site, timestamp and kwh columns"""
+        missing = [col for col in INTERVAL_COLUMNS if col not in df.columns]
+        if missing:
+            raise ValueError(f"Missing interval columns: {missing}")
+
+        # Blank kWh cells are dropped rather than carried as NaN into every sum over the readings
+        present = df['kwh'].notna().to_numpy()
+        missing = int(len(df) - present.sum())
+        if missing:
+            df = df[present]
+
+        codes, sites = pd.factorize(df['site'].astype(str), sort=True)
+        timestamps = pd.to_datetime(df['timestamp']).to_numpy(dtype='datetime64[ns]').view(np.int64)
+        values = df['kwh'].to_numpy(dtype=np.float64)
+
+        # One stable sort by (site, time) puts every site's readings in a contiguous slice
+        order = np.lexsort((timestamps, codes))
+        codes, timestamps, values = codes[order], timestamps[order], values[order]
+        offsets = np.searchsorted(codes, np.arange(len(sites) + 1))
+
+        # The most common spacing within a site is taken as the meter interval
+        steps = np.diff(timestamps)[np.diff(codes) == 0]
+        steps = steps[steps > 0]
+        interval_minutes = int(np.bincount(steps // NS_PER_MINUTE).argmax()) if len(steps) else 60
+
+        return cls(sites, offsets, timestamps, values, interval_minutes, missing)
+
+    def __len__(self):
+        return len(self.values)
+
+    def site(self, site):
+        """Return the timestamps and kWh readings of one site (views, not copies)"""
+        i = self.positions[site]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.timestamps[start:end], self.values[start:end]
+
+    def site_codes(self):
+        """Index of each reading's site, aligned with timestamps and values"""
+        return np.repeat(np.arange(len(self.sites)), np.diff(self.offsets))
+
+    @property
+    def hours_per_interval(self):
+        return self.interval_minutes / 60
+
+
+def load_intervals(path=INTERVALS_FILE):
+    """Read interval readings from a CSV file (readings without a kWh value are dropped), or return None if there is no file"""
+    if not os.path.exists(path):
+        return None
+    df = pd.read_csv(path, usecols=INTERVAL_COLUMNS, dtype={'site': str, 'kwh': np.float64})
+    return IntervalData.from_frame(df)
+
+
+def calendar_fields(timestamps):
+    """Month (0-11), day of week (Monday=0), hour and minute of int64 nanosecond timestamps"""
+    days = timestamps // NS_PER_DAY
+    months = (timestamps.view('datetime64[ns]').astype('datetime64[M]').astype(np.int64) % 12).astype(np.intp)
+    # 1970-01-01 was a Thursday
+    weekdays = ((days + 3) % 7).astype(np.intp)
+    time_of_day = timestamps - days * NS_PER_DAY
+    hours = (time_of_day // NS_PER_HOUR).astype(np.intp)
+    minutes = ((time_of_day % NS_PER_HOUR) // NS_PER_MINUTE).astype(np.intp)
+    return months, weekdays, hours, minutes
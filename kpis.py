@@ -0,0 +1,77 @@
+from typing import NamedTuple, Tuple
+
+import numpy as np
+
+# Metrics shown on the KPI cards, in gather order
+KPI_METRICS = ('totalUsage', 'totalCost', 'costPerKwh')
+
+
+class KpiSnapshot(NamedTuple):
+    """Headline numbers for one site and year range"""
+    site: str
+    year_range: Tuple[int, int]
+    latest_year: int
+    latest_usage: float
+    latest_cost: float
+    latest_rate: float
+    usage_change: float
+    cost_change: float
+    rate_change: float
+    total_usage: float
+    avg_usage: float
+    avg_vs_latest: float
+
+    @classmethod
+    def from_dict(cls, values):
+        """Rebuild a snapshot from its _asdict() form (e.g. after a JSON round trip)"""
+        return cls(**{**values, 'year_range': tuple(values['year_range'])})
+
+
+def compute_snapshot(records, site, year_range):
+    """Gather latest/previous values and period totals for all KPI metrics at once"""
+    n = len(records)
+    if n == 0:
+        raise ValueError(f"No data for {site} in {year_range[0]}-{year_range[1]}")
+
+    # One (metric x year) matrix, then a single fancy-index gather of the latest and previous columns
+    values = np.stack([records.column(metric) for metric in KPI_METRICS])
+    latest, previous = values[:, [n - 1, max(n - 2, 0)]].T
+
+    # Percent change vs previous year (0 when there is no previous year)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        changes = np.where((n > 1) & (previous != 0), (latest - previous) / previous * 100, 0.0)
+
+    totals = values.sum(axis=1)
+    averages = totals / n
+    avg_vs_latest = (latest[0] - averages[0]) / averages[0] * 100 if averages[0] else 0.0
+
+    return KpiSnapshot(
+        site=site,
+        year_range=(int(year_range[0]), int(year_range[1])),
+        latest_year=int(records.latest['year']),
+        latest_usage=float(latest[0]),
+        latest_cost=float(latest[1]),
+        latest_rate=float(latest[2]),
+        usage_change=float(changes[0]),
+        cost_change=float(changes[1]),
+        rate_change=float(changes[2]),
+        total_usage=float(totals[0]),
+        avg_usage=float(averages[0]),
+        avg_vs_latest=float(avg_vs_latest),
+    )
+
+
+class KpiEngine:
+    """Caches KPI snapshots per (site, year range, data version)"""
+
+    def __init__(self):
+        self.cache = {}
+
+    def snapshot(self, records, site, year_range, version):
+        """Return the KPI snapshot for a year range, computing it only on first request"""
+        cache_key = (site, int(year_range[0]), int(year_range[1]), version)
+        snapshot = self.cache.get(cache_key)
+        if snapshot is None:
+            snapshot = compute_snapshot(records.between(*year_range), site, year_range)
+            self.cache[cache_key] = snapshot
+        return snapshot
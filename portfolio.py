@@ -0,0 +1,312 @@
+import copy
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from core import array_version
+from validation import validate_yearly
+
+# Metrics sites are ranked by: column -> (label, whether higher values rank first by default)
+LEADERBOARD_METRICS = {
+    'costGrowth': ("Cost growth (%)", True),
+    'rateGrowth': ("Cost per kWh change (%)", True),
+    'efficiencyChange': ("Efficiency change (%)", False),
+    'usageGrowth': ("Usage change (%)", True),
+    'costVolatility': ("Cost volatility (std dev %)", True),
+}
+
+# Longest leaderboard kept per metric and direction (larger requests fall back to a full ranking)
+MAX_TOP_N = 100
+
+# Portfolios with more readings than this are split across worker threads
+PARALLEL_MIN_ROWS = 1_000_000
+
+# Sites handled per worker task
+PARALLEL_CHUNK_SITES = 5_000
+
+
+class PortfolioData:
+    """Yearly readings of many sites, sorted by site then year in compressed-row form"""
+
+    __slots__ = ('sites', 'positions', 'offsets', 'years', 'usage', 'cost', 'rate', 'fingerprints', 'version', 'validation')
+
+    def __init__(self, sites, offsets, years, usage, cost, rate, fingerprints=None):
+        self.sites = list(sites)
+        self.positions = {site: i for i, site in enumerate(self.sites)}
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.years = np.asarray(years, dtype=np.int64)
+        self.usage = np.asarray(usage, dtype=np.float64)
+        self.cost = np.asarray(cost, dtype=np.float64)
+        self.rate = np.asarray(rate, dtype=np.float64)
+        # One content hash per site, so changed sites can be found without comparing rows
+        if fingerprints is None:
+            fingerprints = _site_fingerprints(self.offsets, self.years, self.usage, self.cost, self.rate)
+        self.fingerprints = fingerprints
+        self.version = array_version(self.offsets, self.fingerprints)
+        # ValidationReport of the rows this was loaded from, if they were validated
+        self.validation = None
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build from a frame with site, year, totalUsage and totalCost (and optionally costPerKwh) columns"""
+        missing = [col for col in ['site', 'year', 'totalUsage', 'totalCost'] if col not in df.columns]
+        if missing:
+            raise ValueError(f"Missing site data columns: {missing}")
+
+        codes, names = pd.factorize(df['site'].astype(str), sort=True)
+        years = df['year'].to_numpy(dtype=np.int64)
+        order = np.lexsort((years, codes))
+        usage = df['totalUsage'].to_numpy(dtype=np.float64)[order]
+        cost = df['totalCost'].to_numpy(dtype=np.float64)[order]
+        if 'costPerKwh' in df.columns:
+            rate = df['costPerKwh'].to_numpy(dtype=np.float64)[order]
+        else:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                rate = cost / usage
+        offsets = np.searchsorted(codes[order], np.arange(len(names) + 1))
+        return cls(names, offsets, years[order], usage, cost, rate)
+
+    def __len__(self):
+        return len(self.years)
+
+    def site(self, site):
+        """Years, usage, cost and cost per kWh of one site (views, not copies)"""
+        i = self.positions[site]
+        rows = slice(self.offsets[i], self.offsets[i + 1])
+        return self.years[rows], self.usage[rows], self.cost[rows], self.rate[rows]
+
+    def changed_sites(self, other):
+        """Indices of this portfolio's sites whose rows differ from (or are missing in) another one"""
+        if self.sites == other.sites:
+            return np.flatnonzero(self.fingerprints != other.fingerprints)
+        previous = np.array([other.positions.get(site, -1) for site in self.sites], dtype=np.int64)
+        same = previous >= 0
+        same[same] = other.fingerprints[previous[same]] == self.fingerprints[same]
+        return np.flatnonzero(~same)
+
+
+def _site_fingerprints(offsets, years, usage, cost, rate):
+    """Order-sensitive content hash of each site's rows, summed per site with one reduceat"""
+    if len(years) == 0:
+        return np.zeros(len(offsets) - 1, dtype=np.uint64)
+    rows = pd.util.hash_pandas_object(
+        pd.DataFrame({'year': years, 'usage': usage, 'cost': cost, 'rate': rate}), index=False
+    ).to_numpy()
+    # Weighting by the position within the site makes reordered rows count as a change
+    positions = np.arange(len(rows), dtype=np.int64) - np.repeat(offsets[:-1], np.diff(offsets))
+    rows = rows * (2 * positions + 1).astype(np.uint64)
+    starts = np.minimum(offsets[:-1], len(rows) - 1)
+    sums = np.add.reduceat(rows, starts)
+    sums[np.diff(offsets) == 0] = 0
+    return sums
+
+
+def load_portfolio(path, base=None):
+    """Read per-site yearly data from a CSV file plus the rows of an optional base frame (None if neither exists)"""
+    frames = [] if base is None else [base]
+    if os.path.exists(path):
+        frames.append(pd.read_csv(path, dtype={'site': str}))
+    if not frames:
+        return None
+    df, report = validate_yearly(pd.concat(frames, ignore_index=True))
+    data = PortfolioData.from_frame(df)
+    data.validation = report
+    return data
+
+
+class SiteMetrics(NamedTuple):
+    """Leaderboard metrics of every site over a year range (NaN where a site has too few years)"""
+    first_year: np.ndarray  # (site,) first year in the range, -1 if none
+    last_year: np.ndarray   # (site,) last year in the range, -1 if none
+    values: dict            # metric -> (site,) values
+
+
+def _segment_metrics(years, usage, cost, rate, offsets, year_range):
+    """Metrics of a block of sites from segment reductions over its compressed rows"""
+    n_sites = len(offsets) - 1
+    keep = np.flatnonzero((years >= year_range[0]) & (years <= year_range[1]))
+    codes = np.repeat(np.arange(n_sites), np.diff(offsets))[keep]
+
+    # First and last kept row of each site
+    bounds = np.searchsorted(codes, np.arange(n_sites + 1))
+    counts = np.diff(bounds)
+    present = counts > 0
+    first = keep[np.minimum(bounds[:-1], max(len(keep) - 1, 0))] if len(keep) else np.zeros(n_sites, dtype=np.int64)
+    last = keep[np.maximum(bounds[1:] - 1, 0)] if len(keep) else np.zeros(n_sites, dtype=np.int64)
+
+    def change(values):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = (values[last] - values[first]) / values[first] * 100
+        result[counts < 2] = np.nan
+        return result
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        efficiency = cost / usage
+
+    # Year-over-year cost changes inside the range (each site's first kept year has no previous year here)
+    follows = np.ones(len(keep), dtype=bool)
+    follows[bounds[:-1][present]] = False
+    k_codes = codes[follows]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        steps = (cost[keep[follows]] / cost[keep[follows] - 1] - 1) * 100
+    n = np.bincount(k_codes, minlength=n_sites)
+    total = np.bincount(k_codes, weights=steps, minlength=n_sites)
+    squares = np.bincount(k_codes, weights=steps ** 2, minlength=n_sites)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        volatility = np.sqrt(np.maximum(squares - total ** 2 / n, 0) / (n - 1))
+    volatility[n < 2] = np.nan
+
+    return SiteMetrics(
+        np.where(present, years[first], -1),
+        np.where(present, years[last], -1),
+        {
+            'costGrowth': change(cost),
+            'rateGrowth': change(rate),
+            # Positive means each kWh got cheaper, as in the overall efficiency insight
+            'efficiencyChange': -change(efficiency),
+            'usageGrowth': change(usage),
+            'costVolatility': volatility
+        }
+    )
+
+
+def site_metrics(portfolio, year_range, sites=None, workers=None):
+    """Leaderboard metrics of all sites (or of the given site indices) over a year range
+
+    Large portfolios are split into blocks of sites that worker threads reduce in parallel;
+    NumPy releases the GIL inside the reductions, so the blocks run concurrently.
+    """
+    offsets = portfolio.offsets
+    if sites is not None:
+        # Gather the selected sites' rows into a smaller compressed-row block
+        sites = np.asarray(sites, dtype=np.int64)
+        counts = offsets[sites + 1] - offsets[sites]
+        rows = np.repeat(offsets[sites] - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts) + np.arange(counts.sum())
+        block = (portfolio.years[rows], portfolio.usage[rows], portfolio.cost[rows], portfolio.rate[rows])
+        return _segment_metrics(*block, np.concatenate([[0], np.cumsum(counts)]), year_range)
+
+    n_sites = len(portfolio.sites)
+    if len(portfolio) < PARALLEL_MIN_ROWS or n_sites <= PARALLEL_CHUNK_SITES:
+        return _segment_metrics(portfolio.years, portfolio.usage, portfolio.cost, portfolio.rate, offsets, year_range)
+
+    def block(start):
+        end = min(start + PARALLEL_CHUNK_SITES, n_sites)
+        rows = slice(offsets[start], offsets[end])
+        return _segment_metrics(
+            portfolio.years[rows], portfolio.usage[rows], portfolio.cost[rows], portfolio.rate[rows],
+            offsets[start:end + 1] - offsets[start], year_range
+        )
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        parts = list(pool.map(block, range(0, n_sites, PARALLEL_CHUNK_SITES)))
+    return SiteMetrics(
+        np.concatenate([part.first_year for part in parts]),
+        np.concatenate([part.last_year for part in parts]),
+        {metric: np.concatenate([part.values[metric] for part in parts]) for metric in LEADERBOARD_METRICS}
+    )
+
+
+def _rank(values, candidates, n, descending):
+    """The n best candidate indices by value, best first, with NaN values left out"""
+    candidates = candidates[~np.isnan(values[candidates])]
+    keys = -values[candidates] if descending else values[candidates]
+    if len(candidates) > n:
+        best = np.argpartition(keys, n - 1)[:n]
+        candidates, keys = candidates[best], keys[best]
+    return candidates[np.lexsort((candidates, keys))]
+
+
+class Leaderboard:
+    """Site metrics over one year range with top-N indices that are patched when sites change"""
+
+    def __init__(self, portfolio, year_range, workers=None):
+        self.year_range = year_range
+        self.workers = workers
+        self.portfolio = portfolio
+        self.metrics = site_metrics(portfolio, year_range, workers=workers)
+        # (metric, descending) -> indices of the best MAX_TOP_N sites, best first
+        self.top_index = {}
+
+    def top(self, metric, n=10, descending=True):
+        """Indices of the n best sites by a metric"""
+        values = self.metrics.values[metric]
+        if n > MAX_TOP_N:
+            return _rank(values, np.arange(len(values)), n, descending)
+        key = (metric, descending)
+        if key not in self.top_index:
+            self.top_index[key] = _rank(values, np.arange(len(values)), MAX_TOP_N, descending)
+        return self.top_index[key][:n]
+
+    def update(self, portfolio):
+        """Move to a new version of the portfolio, recomputing only the sites whose rows changed
+
+        Returns the number of recomputed sites. A changed set of sites rebuilds everything.
+        """
+        if portfolio.sites != self.portfolio.sites:
+            self.__init__(portfolio, self.year_range, self.workers)
+            return len(portfolio.sites)
+
+        changed = portfolio.changed_sites(self.portfolio)
+        self.portfolio = portfolio
+        if len(changed) == 0:
+            return 0
+
+        # Patch copies of the metric arrays and swap them in whole, so a reader never sees a half-patched board
+        fresh = site_metrics(portfolio, self.year_range, sites=changed)
+        metrics = SiteMetrics(self.metrics.first_year.copy(), self.metrics.last_year.copy(), {})
+        metrics.first_year[changed] = fresh.first_year
+        metrics.last_year[changed] = fresh.last_year
+        top_index = dict(self.top_index)
+        for metric, values in fresh.values.items():
+            previous = self.metrics.values[metric][changed]
+            all_values = metrics.values[metric] = self.metrics.values[metric].copy()
+            all_values[changed] = values
+
+            for descending in (True, False):
+                top = top_index.get((metric, descending))
+                if top is None:
+                    continue
+                # A listed site that got worse may be overtaken by an unlisted one: rank everything again
+                worse = values < previous if descending else values > previous
+                if np.any(np.isin(changed[worse | np.isnan(values)], top)):
+                    del top_index[(metric, descending)]
+                    continue
+                # Otherwise only the changed sites can enter the list
+                top_index[(metric, descending)] = _rank(all_values, np.union1d(top, changed), MAX_TOP_N, descending)
+        self.metrics, self.top_index = metrics, top_index
+        return len(changed)
+
+    def updated(self, portfolio):
+        """A copy of the leaderboard moved to a new version of the portfolio (see update), leaving this one as it is"""
+        board = copy.copy(self)
+        board.update(portfolio)
+        return board
+
+
+class PortfolioEngine:
+    """Keeps a leaderboard per year range and carries it over to new versions of the site data"""
+
+    def __init__(self, workers=None):
+        self.workers = workers
+        # year range -> Leaderboard of the latest portfolio version asked for
+        self.boards = {}
+        self.lock = threading.Lock()
+
+    def leaderboard(self, portfolio, year_range):
+        """Return the leaderboard of a year range for the given portfolio version
+
+        Another portfolio version gets an updated copy, so a board returned to one session is never
+        re-ranked under it by a session showing another version.
+        """
+        year_range = (int(year_range[0]), int(year_range[1]))
+        with self.lock:
+            board = self.boards.get(year_range)
+            if board is None:
+                board = self.boards[year_range] = Leaderboard(portfolio, year_range, self.workers)
+            elif board.portfolio.version != portfolio.version:
+                board = self.boards[year_range] = board.updated(portfolio)
+        return board
@@ -0,0 +1,259 @@
+import argparse
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from analytics import UsageAnalytics, load_sites
+from anomalies import METHODS as ANOMALY_METHODS, AnomalyEngine
+from core import DEFAULT_SITE
+from kpis import KpiEngine
+from results_store import ResultsStore
+from snapshots import SnapshotStore, commit_usage
+
+# Result fields a query can ask for
+FIELDS = ('stats', 'kpis', 'yoy', 'insights')
+
+# Most sites accepted in one batched query
+MAX_BATCH_SITES = 500
+
+# Cached responses kept before the oldest is dropped
+MAX_CACHED_RESPONSES = 4096
+
+
+class QueryError(Exception):
+    """A request the service can't answer, with the HTTP status to report"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _json_default(value):
+    """Convert NumPy values that the json module can't serialize"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Cannot serialize value of type {type(value).__name__}")
+
+
+def build_sites(results_store=None, store=None):
+    """Create the analytics of the built-in site (its current version) and of every site in the optional sites file"""
+    results_store = ResultsStore() if results_store is None else results_store
+    store = SnapshotStore() if store is None else store
+    anomaly_engine, kpi_engine = AnomalyEngine(), KpiEngine()
+    usage = store.frame(commit_usage(store).version)
+    sites = {DEFAULT_SITE: UsageAnalytics(usage, DEFAULT_SITE, results_store, anomaly_engine, kpi_engine)}
+    for site, rows in load_sites().items():
+        sites[site] = UsageAnalytics(rows, site, results_store, anomaly_engine, kpi_engine)
+    return sites
+
+
+class QueryService:
+    """Answers JSON queries about one or many sites from the same analytics core as the dashboard"""
+
+    def __init__(self, sites):
+        self.sites = sites
+        # ETag (hash of the request and the data versions it read) -> encoded body
+        self.responses = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def site(self, name):
+        analytics = self.sites.get(name)
+        if analytics is None:
+            raise QueryError(f"Unknown site: {name}", status=404)
+        return analytics
+
+    def site_result(self, analytics, fields, year_range=None, method='mad', window=5):
+        """Compute the requested fields for one site"""
+        start, end = analytics.full_range if year_range is None else year_range
+        start, end = max(start, analytics.full_range[0]), min(end, analytics.full_range[1])
+        if start > end:
+            raise QueryError(f"No data for {analytics.site} in the requested years")
+
+        df, records = analytics.select((start, end))
+        result = {'site': analytics.site, 'data_version': analytics.data_version, 'year_range': [start, end]}
+        if 'stats' in fields:
+            result['stats'] = analytics.stats
+        if 'kpis' in fields:
+            result['kpis'] = analytics.get_kpis((start, end))._asdict()
+        if 'yoy' in fields:
+            result['yoy'] = analytics.get_yoy_extremes(df)
+        if 'insights' in fields:
+            anomalies = analytics.get_anomaly_index(method)
+            result['insights'] = analytics.get_insights(df, records, anomalies, window)
+        return result
+
+    def parse_options(self, options):
+        """Validate the fields, year range and insight options shared by every query"""
+        fields = options.get('fields') or list(FIELDS)
+        if isinstance(fields, str):
+            fields = fields.split(',')
+        if not isinstance(fields, list) or not all(isinstance(field, str) for field in fields):
+            raise QueryError("fields must be a list of names or a comma-separated string")
+        unknown = [field for field in fields if field not in FIELDS]
+        if unknown:
+            raise QueryError(f"Unknown fields: {unknown}")
+
+        try:
+            start, end = options.get('start'), options.get('end')
+            year_range = None if start is None and end is None else (
+                int(start) if start is not None else -10**9,
+                int(end) if end is not None else 10**9
+            )
+            window = int(options.get('window', 5))
+        except (TypeError, ValueError):
+            raise QueryError("start, end and window must be integers")
+
+        method = options.get('method', 'mad')
+        if not isinstance(method, str) or method not in ANOMALY_METHODS:
+            raise QueryError(f"Unknown anomaly method: {method}")
+        if not 2 <= window <= 10:
+            raise QueryError("window must be between 2 and 10")
+        return sorted(fields), year_range, method, window
+
+    def query(self, sites, options):
+        """Answer a batched query: {site: result} plus {site: error} for sites that couldn't be answered"""
+        fields, year_range, method, window = self.parse_options(options)
+        results, errors = {}, {}
+        for name in sites:
+            try:
+                results[name] = self.site_result(self.site(name), fields, year_range, method, window)
+            except QueryError as error:
+                errors[name] = str(error)
+        return {'results': results, 'errors': errors}
+
+    def route(self, method, path, params, body):
+        """Map a request to the sites it reads and a function producing its response"""
+        parts = [part for part in path.split('/') if part]
+        if method == 'GET' and parts == ['sites']:
+            return list(self.sites), lambda: {'sites': [
+                {
+                    'site': name,
+                    'data_version': analytics.data_version,
+                    'year_range': list(analytics.full_range),
+                    'data_checks': analytics.validation.summary()
+                }
+                for name, analytics in self.sites.items()
+            ]}
+        if method == 'GET' and len(parts) == 2 and parts[0] == 'sites':
+            analytics = self.site(parts[1])
+            return [parts[1]], lambda: self.site_result(analytics, *self.parse_options(params))
+        if method == 'POST' and parts == ['query']:
+            if not isinstance(body, dict):
+                raise QueryError("Body must be a JSON object")
+            sites = body.get('sites')
+            if not isinstance(sites, list) or not sites:
+                raise QueryError("Body must list the sites to query")
+            if not all(isinstance(name, str) for name in sites):
+                raise QueryError("Sites must be given by name")
+            if len(sites) > MAX_BATCH_SITES:
+                raise QueryError(f"At most {MAX_BATCH_SITES} sites per query")
+            return sites, lambda: self.query(sites, body)
+        raise QueryError(f"No such endpoint: {method} {path}", status=404)
+
+    def handle(self, method, path, params, body=None, if_none_match=None):
+        """Return (status, ETag, body bytes), serving cached bodies and 304s when the data hasn't changed"""
+        sites, respond = self.route(method, path, params, body or {})
+
+        # The ETag covers the request and the data version of every site it reads
+        versions = [self.sites[name].data_version if name in self.sites else '-' for name in sites]
+        request = json.dumps([method, path, params, body], sort_keys=True, separators=(',', ':'))
+        etag = '"' + hashlib.sha1(f"{request}|{','.join(versions)}".encode()).hexdigest()[:20] + '"'
+
+        if if_none_match is not None and etag in [tag.strip() for tag in if_none_match.split(',')]:
+            self.hits += 1
+            return 304, etag, b''
+
+        cached = self.responses.get(etag)
+        if cached is not None:
+            self.hits += 1
+            return 200, etag, cached
+
+        self.misses += 1
+        encoded = json.dumps(respond(), default=_json_default, separators=(',', ':')).encode()
+        with self.lock:
+            if len(self.responses) >= MAX_CACHED_RESPONSES:
+                # Drop the oldest response (dicts keep insertion order)
+                self.responses.pop(next(iter(self.responses)))
+            self.responses[etag] = encoded
+        return 200, etag, encoded
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """HTTP/1.1 front end of a QueryService (kept-alive connections, JSON bodies)"""
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; don't let them wait on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def dispatch(self, method):
+        url = urlsplit(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            body = None
+            if method == 'POST':
+                length = int(self.headers.get('Content-Length', 0))
+                try:
+                    body = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    raise QueryError("Body is not valid JSON")
+            status, etag, payload = self.server.service.handle(method, url.path, params, body, self.headers.get('If-None-Match'))
+        except QueryError as error:
+            status, etag, payload = error.status, None, json.dumps({'error': str(error)}).encode()
+
+        self.send_response(status)
+        if etag is not None:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        if status != 304:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(service, host='127.0.0.1', port=8600, verbose=False):
+    """Create (but don't start) an HTTP server for a query service"""
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.verbose = verbose
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the dashboard's statistics, KPIs and insights as JSON")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--verbose', action='store_true', help="log every request")
+    args = parser.parse_args()
+
+    server = make_server(QueryService(build_sites()), args.host, args.port, args.verbose)
+    print(f"Serving on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
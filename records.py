@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+# Schema of a yearly reading; each field is stored as its own contiguous column
+RECORD_DTYPE = np.dtype([
+    ('year', np.int32),
+    ('totalUsage', np.float64),
+    ('totalCost', np.float64),
+    ('costPerKwh', np.float64),
+    ('usageChange', np.float32),
+    ('costChange', np.float32),
+    ('rateChange', np.float32),
+])
+
+FIELDS = RECORD_DTYPE.names
+
+
+class YearlyRecord:
+    """Lightweight view of one row, read like a dict (record['totalUsage'])"""
+
+    __slots__ = ('_columns', '_index')
+
+    def __init__(self, columns, index):
+        self._columns = columns
+        self._index = index
+
+    def __getitem__(self, name):
+        return self._columns[name][self._index]
+
+    def as_dict(self):
+        """Copy the row into a plain dict of Python scalars"""
+        return {name: column[self._index].item() for name, column in self._columns.items()}
+
+    def __repr__(self):
+        return f"YearlyRecord({self.as_dict()})"
+
+
+class YearlyRecords:
+    """Columnar container of yearly readings, sorted by year"""
+
+    __slots__ = ('_columns',)
+
+    def __init__(self, columns):
+        self._columns = columns
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Build from a mapping of field name -> values, sorting by year"""
+        missing = [name for name in FIELDS if name not in columns]
+        if missing:
+            raise ValueError(f"Missing record fields: {missing}")
+
+        years = np.asarray(columns['year'])
+        order = np.argsort(years, kind='stable') if np.any(np.diff(years) < 0) else slice(None)
+        return cls({
+            name: np.ascontiguousarray(np.asarray(columns[name])[order], dtype=RECORD_DTYPE[name])
+            for name in FIELDS
+        })
+
+    @classmethod
+    def from_dicts(cls, rows):
+        """Build from a list of row dicts such as ElectricUsageDashboard.data"""
+        return cls.from_columns({name: [row[name] for row in rows] for name in FIELDS})
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build from a DataFrame with the record fields as columns"""
+        return cls.from_columns({name: df[name].to_numpy() for name in FIELDS})
+
+    def __len__(self):
+        return len(self._columns['year'])
+
+    def __getitem__(self, item):
+        # Slices share the underlying buffers instead of copying
+        if isinstance(item, slice):
+            return YearlyRecords({name: column[item] for name, column in self._columns.items()})
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("record index out of range")
+        return YearlyRecord(self._columns, item)
+
+    def column(self, name):
+        """Read-only view of one field across all rows"""
+        view = self._columns[name].view()
+        view.flags.writeable = False
+        return view
+
+    @property
+    def first(self):
+        return self[0]
+
+    @property
+    def latest(self):
+        return self[-1]
+
+    @property
+    def previous(self):
+        """The row before the latest one (the latest row itself if there is only one)"""
+        return self[-2] if len(self) > 1 else self[-1]
+
+    def between(self, start_year, end_year):
+        """Rows with start_year <= year <= end_year, as a view found by binary search"""
+        years = self._columns['year']
+        lo = np.searchsorted(years, start_year, side='left')
+        hi = np.searchsorted(years, end_year, side='right')
+        return self[lo:hi]
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self._columns.values())
+
+    def to_frame(self):
+        """Copy the records into a DataFrame"""
+        return pd.DataFrame({name: column for name, column in self._columns.items()})
@@ -0,0 +1,128 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from core import DATA_DIR
+
+# Embedded database holding computed results across restarts
+RESULTS_DB = os.path.join(DATA_DIR, 'results.sqlite3')
+
+# Version of the stored payload formats; bump it whenever a stored result changes shape or meaning, so
+# an upgraded dashboard drops the rows written by the previous version instead of reading them back
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    site TEXT NOT NULL,
+    data_version TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    start_year INTEGER NOT NULL,
+    end_year INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (site, data_version, kind, start_year, end_year)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_by_version ON results (data_version, kind);
+"""
+
+
+def _json_default(value):
+    """Convert NumPy values that the json module can't serialize"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Cannot store value of type {type(value).__name__}")
+
+
+class ResultsStore:
+    """Computed results (stats, changes, rollups, insight text) persisted per (site, year range, data version)"""
+
+    def __init__(self, path=RESULTS_DB):
+        try:
+            if path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+        except (sqlite3.OperationalError, OSError):
+            # An unwritable location still gets a working (non-persistent) store
+            self.connection = sqlite3.connect(':memory:', check_same_thread=False, isolation_level=None)
+        self.connection.executescript(SCHEMA)
+        self._check_schema_version()
+        self.path = path
+        self.lock = threading.Lock()
+
+        # Read-through copy of stored rows, filled on lookup and by warm()
+        self.memory = {}
+        self.warmed = set()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_schema_version(self):
+        """Drop the stored rows if they were written with another schema version (kept as the user_version)"""
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            if self.connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                self.connection.execute("DELETE FROM results")
+                self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _key(self, site, year_range, version, kind):
+        return (site, version, kind, int(year_range[0]), int(year_range[1]))
+
+    def get(self, site, year_range, version, kind):
+        """Return a stored result, or None if it hasn't been stored"""
+        key = self._key(site, year_range, version, kind)
+        if key in self.memory:
+            self.hits += 1
+            return self.memory[key]
+
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT payload FROM results WHERE site = ? AND data_version = ? AND kind = ? AND start_year = ? AND end_year = ?",
+                key
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        value = self.memory[key] = json.loads(row[0])
+        return value
+
+    def put(self, site, year_range, version, kind, value):
+        """Store a JSON-serializable result, replacing any earlier one with the same key"""
+        key = self._key(site, year_range, version, kind)
+        payload = json.dumps(value, default=_json_default, separators=(',', ':'))
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results (site, data_version, kind, start_year, end_year, payload, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (*key, payload, time.time())
+            )
+        # Keep the decoded form so reads match what a restarted process would get
+        self.memory[key] = json.loads(payload)
+        return self.memory[key]
+
+    def get_or_compute(self, site, year_range, version, kind, compute):
+        """Return the stored result, computing and storing it first if needed"""
+        value = self.get(site, year_range, version, kind)
+        if value is None:
+            value = self.put(site, year_range, version, kind, compute())
+        return value
+
+    def warm(self, version):
+        """Load every stored result of a data version into memory (once), returning the number of rows"""
+        if version in self.warmed:
+            return 0
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT site, data_version, kind, start_year, end_year, payload FROM results WHERE data_version = ?",
+                (version,)
+            ).fetchall()
+        for site, data_version, kind, start_year, end_year, payload in rows:
+            self.memory[(site, data_version, kind, start_year, end_year)] = json.loads(payload)
+        self.warmed.add(version)
+        return len(rows)
@@ -0,0 +1,145 @@
+import numpy as np
+
+# Rolling statistics the engine can compute
+STATISTICS = ('mean', 'std', 'min', 'max', 'sum', 'ewma')
+
+
+def _window_sums(values, window):
+    """Trailing-window sums of values, squared values and valid counts via prefix sums"""
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+
+    # Center rows first so the running sums of squares don't lose precision
+    offset = np.nanmean(values, axis=1, keepdims=True) if values.shape[1] else np.zeros((len(values), 1))
+    offset = np.nan_to_num(offset)
+    centered = np.where(valid, values - offset, 0.0)
+
+    zeros = np.zeros((len(values), 1))
+    sums = np.concatenate([zeros, np.cumsum(centered, axis=1)], axis=1)
+    squares = np.concatenate([zeros, np.cumsum(centered ** 2, axis=1)], axis=1)
+    counts = np.concatenate([zeros, np.cumsum(valid, axis=1)], axis=1)
+
+    # Window ending at t covers [t - window + 1, t]
+    end = np.arange(1, values.shape[1] + 1)
+    start = np.maximum(end - window, 0)
+    return (
+        sums[:, end] - sums[:, start],
+        squares[:, end] - squares[:, start],
+        counts[:, end] - counts[:, start],
+        offset
+    )
+
+
+def _min_periods(window, min_periods):
+    return window if min_periods is None else max(1, min(min_periods, window))
+
+
+def rolling_sum(values, window, min_periods=None):
+    """Trailing-window sum of each row"""
+    window_sum, _, n, offset = _window_sums(values, window)
+    total = window_sum + n * offset
+    return np.where(n >= _min_periods(window, min_periods), total, np.nan)
+
+
+def rolling_mean(values, window, min_periods=None):
+    """Trailing-window mean of each row"""
+    window_sum, _, n, offset = _window_sums(values, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = window_sum / n + offset
+    return np.where(n >= _min_periods(window, min_periods), mean, np.nan)
+
+
+def rolling_std(values, window, min_periods=None):
+    """Trailing-window sample standard deviation of each row"""
+    window_sum, window_squares, n, _ = _window_sums(values, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variance = (window_squares - window_sum ** 2 / n) / (n - 1)
+    std = np.sqrt(np.maximum(variance, 0.0))
+    return np.where((n >= _min_periods(window, min_periods)) & (n > 1), std, np.nan)
+
+
+def _sliding_extreme(values, window, min_periods, reduce, fill):
+    """Trailing-window max/min with the van Herk/Gil-Werman block algorithm (O(n), no per-window loop)"""
+    values = np.asarray(values, dtype=np.float64)
+    n_series, n_periods = values.shape
+    x = np.where(np.isnan(values), fill, values)
+
+    # Pad the front so every window is full, and the back to a whole number of blocks
+    length = n_periods + window - 1
+    n_blocks = -(-length // window)
+    padded = np.full((n_series, n_blocks * window), fill)
+    padded[:, window - 1:length] = x
+    blocks = padded.reshape(n_series, n_blocks, window)
+
+    # Running extremes from the left and the right of each block
+    prefix = reduce.accumulate(blocks, axis=2).reshape(n_series, -1)
+    suffix = reduce.accumulate(blocks[:, :, ::-1], axis=2)[:, :, ::-1].reshape(n_series, -1)
+
+    # Any window spans at most two blocks: the suffix of the first and the prefix of the second
+    start = np.arange(n_periods)
+    extreme = reduce(suffix[:, start], prefix[:, start + window - 1])
+
+    _, _, n, _ = _window_sums(values, window)
+    return np.where(n >= _min_periods(window, min_periods), extreme, np.nan)
+
+
+def rolling_max(values, window, min_periods=None):
+    """Trailing-window maximum of each row"""
+    return _sliding_extreme(values, window, min_periods, np.maximum, -np.inf)
+
+
+def rolling_min(values, window, min_periods=None):
+    """Trailing-window minimum of each row"""
+    return _sliding_extreme(values, window, min_periods, np.minimum, np.inf)
+
+
+def ewma(values, span):
+    """Exponentially weighted moving average of each row (missing values carry the last average)"""
+    values = np.asarray(values, dtype=np.float64)
+    alpha = 2.0 / (span + 1.0)
+
+    result = np.empty_like(values)
+    average = np.full(len(values), np.nan)
+    for t in range(values.shape[1]):
+        x = values[:, t]
+        observed = ~np.isnan(x)
+        average = np.where(observed, np.where(np.isnan(average), x, alpha * x + (1 - alpha) * average), average)
+        result[:, t] = average
+    return result
+
+
+def rolling(values, stat, window, min_periods=None):
+    """Compute a rolling statistic for every row of `values`"""
+    if stat not in STATISTICS:
+        raise ValueError(f"Unknown rolling statistic '{stat}', expected one of {STATISTICS}")
+    if window < 1:
+        raise ValueError("window must be at least 1")
+
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    if stat == 'ewma':
+        return ewma(values, window)
+    return {
+        'mean': rolling_mean,
+        'std': rolling_std,
+        'min': rolling_min,
+        'max': rolling_max,
+        'sum': rolling_sum,
+    }[stat](values, window, min_periods)
+
+
+class RollingEngine:
+    """Computes rolling statistics for many (site, metric) series and caches them per data version"""
+
+    def __init__(self):
+        # (data version, keys, stat, window, min periods) -> {key: rolling series}
+        self.cache = {}
+
+    def compute(self, keys, values, version, stat, window, min_periods=None):
+        """Return {key: rolling series} for every row, computing all rows in one pass"""
+        keys = tuple(keys)
+        cache_key = (version, keys, stat, window, min_periods)
+
+        if cache_key not in self.cache:
+            result = rolling(values, stat, window, min_periods)
+            self.cache[cache_key] = dict(zip(keys, result))
+        return self.cache[cache_key]
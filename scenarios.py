@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+from core import base_arrays, data_version
+
+# Ways a scenario can change the rate paid per kWh
+RATE_MODES = ('actual', 'fixed', 'adjust')
+
+
+class Scenario:
+    """A what-if adjustment applied to a window of the yearly data"""
+
+    def __init__(self, name, start_year, end_year, usage_pct=0.0, rate_mode='actual', rate_year=None, rate_pct=0.0):
+        if rate_mode not in RATE_MODES:
+            raise ValueError(f"Unknown rate mode '{rate_mode}', expected one of {RATE_MODES}")
+        if rate_mode == 'fixed' and rate_year is None:
+            raise ValueError("A fixed-rate scenario needs a rate_year")
+        if start_year > end_year:
+            raise ValueError("start_year must not be after end_year")
+
+        self.name = name
+        self.start_year = int(start_year)
+        self.end_year = int(end_year)
+        self.usage_pct = float(usage_pct)
+        self.rate_mode = rate_mode
+        self.rate_year = int(rate_year) if rate_mode == 'fixed' else None
+        self.rate_pct = float(rate_pct) if rate_mode == 'adjust' else 0.0
+
+    def key(self):
+        """Cache key built from the parameters only, so renaming doesn't trigger a recompute"""
+        return (self.start_year, self.end_year, self.usage_pct, self.rate_mode, self.rate_year, self.rate_pct)
+
+    def describe(self):
+        """Short human-readable summary of the scenario"""
+        parts = []
+        if self.usage_pct:
+            parts.append(f"usage {self.usage_pct:+.1f}%")
+        if self.rate_mode == 'fixed':
+            parts.append(f"{self.rate_year} rates")
+        elif self.rate_mode == 'adjust' and self.rate_pct:
+            parts.append(f"rate {self.rate_pct:+.1f}%")
+        changes = ", ".join(parts) if parts else "no changes"
+        return f"{self.start_year}-{self.end_year}: {changes}"
+
+
+class ScenarioEngine:
+    """Evaluates scenarios against the base data and caches the results"""
+
+    def __init__(self):
+        # (data version, scenario key) -> evaluated DataFrame
+        self.cache = {}
+        self.evaluations = 0
+
+    def evaluate(self, df, scenarios):
+        """Return one result frame per scenario, computing only the ones not cached yet"""
+        version = data_version(df)
+
+        # Collect unique uncached scenarios so they can be evaluated in a single batch
+        pending = {}
+        for scenario in scenarios:
+            cache_key = (version, scenario.key())
+            if cache_key not in self.cache and cache_key not in pending:
+                pending[cache_key] = scenario
+
+        if pending:
+            results = self.evaluate_batch(base_arrays(df), list(pending.values()))
+            for cache_key, result in zip(pending, results):
+                self.cache[cache_key] = result
+            self.evaluations += len(pending)
+
+        return [self.cache[(version, scenario.key())] for scenario in scenarios]
+
+    @staticmethod
+    def evaluate_batch(base, scenarios):
+        """Evaluate several scenarios at once over the base columns"""
+        years = base['year']
+        usage = base['totalUsage']
+        cost = base['totalCost']
+        rate = base['costPerKwh']
+
+        # Scenario parameters as column vectors so they broadcast against the years
+        starts = np.array([s.start_year for s in scenarios], dtype=np.float64)[:, None]
+        ends = np.array([s.end_year for s in scenarios], dtype=np.float64)[:, None]
+        usage_pct = np.array([s.usage_pct for s in scenarios])[:, None]
+        rate_pct = np.array([s.rate_pct for s in scenarios])[:, None]
+        modes = np.array([s.rate_mode for s in scenarios])[:, None]
+
+        # Look up the reference rate for fixed-rate scenarios (NaN if the year is missing)
+        rate_by_year = dict(zip(years.astype(int), rate))
+        fixed_rates = np.array([rate_by_year.get(s.rate_year, np.nan) if s.rate_year else np.nan for s in scenarios])[:, None]
+
+        in_window = (years >= starts) & (years <= ends)
+
+        usage_factor = np.where(in_window, 1 + usage_pct / 100, 1.0)
+
+        # Fixed-year rates replace the actual rate, percentage adjustments scale it
+        rate_factor = np.ones_like(usage_factor)
+        fixed = in_window & (modes == 'fixed') & ~np.isnan(fixed_rates)
+        rate_factor = np.where(fixed, fixed_rates / rate, rate_factor)
+        adjusted = in_window & (modes == 'adjust')
+        rate_factor = np.where(adjusted, 1 + rate_pct / 100, rate_factor)
+
+        # Scale the actual cost so years outside the window keep their billed amounts
+        scenario_usage = usage * usage_factor
+        scenario_rate = rate * rate_factor
+        scenario_cost = cost * usage_factor * rate_factor
+
+        return [
+            pd.DataFrame({
+                'year': years.astype(int),
+                'totalUsage': scenario_usage[i],
+                'totalCost': scenario_cost[i],
+                'costPerKwh': scenario_rate[i],
+            })
+            for i in range(len(scenarios))
+        ]
@@ -0,0 +1,101 @@
+from typing import NamedTuple
+
+import numpy as np
+
+from intervals import calendar_fields
+
+# Number of highest-load hours of the day reported as peak hours
+PEAK_HOURS = 3
+
+
+class SeasonalProfile(NamedTuple):
+    """Average load shapes of one site (all loads in kW)"""
+    site: str
+    heatmap: np.ndarray             # month x hour of day, NaN where there are no readings
+    weekday: np.ndarray             # average load by hour, Monday-Friday
+    weekend: np.ndarray             # average load by hour, Saturday-Sunday
+    peak_hours: np.ndarray          # hours of day with the highest average load, highest first
+    monthly_peak_hours: np.ndarray  # hour of highest average load in each month (-1 without readings)
+    peak_timestamp: int             # start of the single highest-load interval (ns)
+    peak_kw: float
+
+
+def _cell_means(cells, weights, shape):
+    """Mean of `weights` in each cell of a flattened grid, plus the reading counts"""
+    size = int(np.prod(shape))
+    sums = np.bincount(cells, weights=weights, minlength=size).reshape(shape)
+    counts = np.bincount(cells, minlength=size).reshape(shape)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts, sums, counts
+
+
+def seasonal_profiles(intervals, top_hours=PEAK_HOURS):
+    """Compute the seasonal profiles of every site in one pass over the interval arrays"""
+    n_sites = len(intervals.sites)
+    codes = intervals.site_codes()
+    months, weekdays, hours, _ = calendar_fields(intervals.timestamps)
+
+    # Energy per interval -> average demand over the interval
+    demand = intervals.values / intervals.hours_per_interval
+
+    # (site, month, hour) cells for every reading, aggregated with a single bincount
+    heatmaps, sums, counts = _cell_means((codes * 12 + months) * 24 + hours, demand, (n_sites, 12, 24))
+
+    # (site, weekend?, hour) cells for the day-type profiles
+    is_weekend = (weekdays >= 5).astype(np.intp)
+    day_profiles, _, _ = _cell_means((codes * 2 + is_weekend) * 24 + hours, demand, (n_sites, 2, 24))
+
+    # Peak hours from the all-year hourly profile, and the peak hour of each month
+    with np.errstate(invalid='ignore', divide='ignore'):
+        hourly = sums.sum(axis=1) / counts.sum(axis=1)
+    peak_hours = np.argsort(-np.nan_to_num(hourly, nan=-np.inf), axis=1, kind='stable')[:, :top_hours]
+    monthly_peak_hours = np.where(
+        counts.sum(axis=2) > 0,
+        np.argmax(np.nan_to_num(heatmaps, nan=-np.inf), axis=2),
+        -1
+    )
+
+    # Highest single interval per site: segment maxima, then the first reading that reaches it
+    # (missing readings rank lowest, so every site has a peak position even if all of them are missing)
+    starts = intervals.offsets[:-1]
+    ranked = np.where(np.isnan(demand), -np.inf, demand)
+    peak_kw = np.maximum.reduceat(ranked, starts) if len(demand) else np.zeros(n_sites)
+    at_peak = np.flatnonzero(ranked == peak_kw[codes])
+    _, first = np.unique(codes[at_peak], return_index=True)
+    peak_positions = at_peak[first]
+    peak_kw[np.isneginf(peak_kw)] = np.nan
+
+    return {
+        site: SeasonalProfile(
+            site=site,
+            heatmap=heatmaps[i],
+            weekday=day_profiles[i, 0],
+            weekend=day_profiles[i, 1],
+            peak_hours=peak_hours[i],
+            monthly_peak_hours=monthly_peak_hours[i],
+            peak_timestamp=int(intervals.timestamps[peak_positions[i]]),
+            peak_kw=float(peak_kw[i])
+        )
+        for i, site in enumerate(intervals.sites)
+    }
+
+
+class SeasonalEngine:
+    """Precomputes seasonal profiles for all sites and caches them per data version"""
+
+    def __init__(self):
+        # (interval data version, peak hours) -> {site: SeasonalProfile}
+        self.cache = {}
+
+    def profiles(self, intervals, top_hours=PEAK_HOURS):
+        """Return {site: SeasonalProfile}, computing every site on the first request"""
+        cache_key = (intervals.version, top_hours)
+        profiles = self.cache.get(cache_key)
+        if profiles is None:
+            profiles = seasonal_profiles(intervals, top_hours)
+            self.cache[cache_key] = profiles
+        return profiles
+
+    def profile(self, intervals, site, top_hours=PEAK_HOURS):
+        """Return the seasonal profile of one site"""
+        return self.profiles(intervals, top_hours)[site]
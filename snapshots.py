@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from analytics import USAGE_FILE, load_usage
+from core import DATA_DIR
+from validation import validate_yearly
+
+# Folder holding the snapshot manifest and the column chunks shared between snapshots
+SNAPSHOTS_DIR = os.path.join(DATA_DIR, 'snapshots')
+MANIFEST_FILE = os.path.join(SNAPSHOTS_DIR, 'manifest.json')
+
+# Rows per column chunk; a new snapshot stores only the chunks that differ from stored ones
+CHUNK_ROWS = 4096
+
+
+class Snapshot(NamedTuple):
+    """One version of a dataset: per column, the hashes of the chunks it is made of"""
+    version: str    # content hash of the whole dataset
+    number: int     # 1, 2, ... in commit order
+    label: str
+    created_at: float
+    rows: int
+    columns: dict   # column -> (dtype, [chunk hash, ...])
+
+    @property
+    def name(self):
+        return f"v{self.number}"
+
+
+def _chunk_hash(values):
+    digest = hashlib.sha1(values.dtype.str.encode())
+    digest.update(np.ascontiguousarray(values).view(np.uint8).ravel())
+    return digest.hexdigest()[:20]
+
+
+class SnapshotStore:
+    """Versioned column store where snapshots share unchanged, read-only chunks (copy-on-write)
+
+    Chunks are written once to `<path>/chunks` and memory-mapped when read, so every version of a
+    dataset costs only the chunks it changed. Rolling back adds a snapshot that points at the old
+    chunks; nothing is copied.
+    """
+
+    def __init__(self, path=SNAPSHOTS_DIR):
+        self.path = path
+        self.lock = threading.Lock()
+        # chunk hash -> read-only array (loaded lazily from disk)
+        self.chunks = {}
+        self.snapshots = []
+        # source name -> version last committed from it (see commit)
+        self.sources = {}
+        self.persistent = True
+        try:
+            os.makedirs(os.path.join(path, 'chunks'), exist_ok=True)
+            manifest = os.path.join(path, 'manifest.json')
+            if os.path.exists(manifest):
+                with open(manifest) as f:
+                    entries = json.load(f)
+                # Older manifests are a bare list of snapshots
+                if isinstance(entries, list):
+                    entries = {'snapshots': entries}
+                self.snapshots = [Snapshot(**entry) for entry in entries['snapshots']]
+                self.sources = dict(entries.get('sources', {}))
+        except (OSError, ValueError, TypeError, KeyError):
+            # An unwritable or damaged folder still gets a working (in-memory) store
+            self.persistent = False
+            self.snapshots = []
+            self.sources = {}
+
+    def _chunk_file(self, key):
+        return os.path.join(self.path, 'chunks', f"{key}.npy")
+
+    def _load_chunk(self, key):
+        values = self.chunks.get(key)
+        if values is None:
+            values = self.chunks[key] = np.load(self._chunk_file(key), mmap_mode='r')
+        return values
+
+    def _save_manifest(self):
+        if not self.persistent:
+            return
+        try:
+            manifest = os.path.join(self.path, 'manifest.json')
+            with open(manifest + '.tmp', 'w') as f:
+                json.dump({'snapshots': [snapshot._asdict() for snapshot in self.snapshots], 'sources': self.sources}, f)
+            os.replace(manifest + '.tmp', manifest)
+        except OSError:
+            self.persistent = False
+
+    @property
+    def latest(self):
+        return self.snapshots[-1] if self.snapshots else None
+
+    def get(self, version):
+        """Latest snapshot with the given version (or name, such as 'v2'), or None"""
+        for snapshot in reversed(self.snapshots):
+            if version in (snapshot.version, snapshot.name):
+                return snapshot
+        return None
+
+    def commit(self, df, label='', source=None):
+        """Store a frame as the newest snapshot, returning it (the latest one if nothing changed)
+
+        With a `source` (such as a file name), rows already committed from that source don't make a
+        new snapshot even if the latest one differs, so a rollback lasts until the source changes.
+        """
+        columns = {col: df[col].to_numpy() for col in df.columns}
+        hashes = {col: [_chunk_hash(values[i:i + CHUNK_ROWS]) for i in range(0, len(values), CHUNK_ROWS)] for col, values in columns.items()}
+        version = hashlib.sha1(json.dumps(hashes, sort_keys=True).encode()).hexdigest()[:16]
+
+        with self.lock:
+            if self.latest is not None and source is not None and self.sources.get(source) == version:
+                return self.latest
+            if source is not None:
+                self.sources[source] = version
+            if self.latest is not None and self.latest.version == version:
+                if source is not None:
+                    self._save_manifest()
+                return self.latest
+
+            # Only chunks that no earlier snapshot has are stored
+            for col, values in columns.items():
+                for i, key in zip(range(0, len(values), CHUNK_ROWS), hashes[col]):
+                    if key in self.chunks or (self.persistent and os.path.exists(self._chunk_file(key))):
+                        continue
+                    chunk = np.array(values[i:i + CHUNK_ROWS])
+                    chunk.flags.writeable = False
+                    self.chunks[key] = chunk
+                    if self.persistent:
+                        try:
+                            np.save(self._chunk_file(key), chunk)
+                        except OSError:
+                            self.persistent = False
+
+            snapshot = Snapshot(
+                version, len(self.snapshots) + 1, label, time.time(), len(df),
+                {col: (values.dtype.str, hashes[col]) for col, values in columns.items()}
+            )
+            self.snapshots.append(snapshot)
+            self._save_manifest()
+        return snapshot
+
+    def rollback(self, version, label=None):
+        """Make an earlier snapshot the newest one again (it shares all of its chunks)"""
+        snapshot = self.get(version)
+        if snapshot is None:
+            raise KeyError(f"Unknown snapshot: {version}")
+        with self.lock:
+            restored = snapshot._replace(
+                number=len(self.snapshots) + 1,
+                label=label or f"rollback to {snapshot.name}",
+                created_at=time.time()
+            )
+            self.snapshots.append(restored)
+            self._save_manifest()
+        return restored
+
+    def frame(self, version):
+        """The rows of a snapshot as a DataFrame"""
+        snapshot = self.get(version)
+        if snapshot is None:
+            raise KeyError(f"Unknown snapshot: {version}")
+        data = {}
+        for col, (dtype, keys) in snapshot.columns.items():
+            chunks = [self._load_chunk(key) for key in keys]
+            data[col] = np.concatenate(chunks) if chunks else np.zeros(0, dtype=dtype)
+        return pd.DataFrame(data)
+
+    def changed_columns(self, old, new):
+        """Columns whose chunks differ between two snapshots (found without reading any values)"""
+        old, new = self.get(old), self.get(new)
+        return [col for col in new.columns if old.columns.get(col, (None, None))[1] != new.columns[col][1]]
+
+    def diff(self, old, new, key='year'):
+        """Cells that differ between two snapshots, as rows of (key, column, old value, new value)
+
+        Columns that share all their chunks are skipped without being read.
+        """
+        columns = [col for col in self.changed_columns(old, new) if col != key]
+        if not columns:
+            return pd.DataFrame(columns=[key, 'column', 'old', 'new'])
+        old_df = self.frame(old).set_index(key)
+        new_df = self.frame(new).set_index(key)
+        keys = old_df.index.union(new_df.index)
+        old_df, new_df = old_df.reindex(keys), new_df.reindex(keys)
+
+        changes = []
+        for col in columns:
+            before = old_df[col].to_numpy(dtype=np.float64) if col in old_df else np.full(len(keys), np.nan)
+            after = new_df[col].to_numpy(dtype=np.float64)
+            changed = ~((before == after) | (np.isnan(before) & np.isnan(after)))
+            if changed.any():
+                changes.append(pd.DataFrame({key: keys[changed], 'column': col, 'old': before[changed], 'new': after[changed]}))
+        if not changes:
+            return pd.DataFrame(columns=[key, 'column', 'old', 'new'])
+        return pd.concat(changes, ignore_index=True).sort_values([key, 'column'], ignore_index=True)
+
+    def footprint(self):
+        """(bytes the snapshots would take as full copies, bytes actually stored in chunks)"""
+        sizes = {}
+        logical = 0
+        for snapshot in self.snapshots:
+            for dtype, keys in snapshot.columns.values():
+                for i, key in enumerate(keys):
+                    rows = min(CHUNK_ROWS, snapshot.rows - i * CHUNK_ROWS)
+                    size = rows * np.dtype(dtype).itemsize
+                    sizes[key] = size
+                    logical += size
+        return logical, sum(sizes.values())
+
+
+def commit_usage(store, path=USAGE_FILE):
+    """Snapshot the dashboard site's yearly data file if its rows changed since it was last committed,
+    returning the current version (after a rollback, the restored one until the file changes)"""
+    df, _ = validate_yearly(load_usage(path))
+    label = os.path.basename(path) if os.path.exists(path) else "built-in data"
+    return store.commit(df, label, source=os.path.basename(path))
@@ -0,0 +1,198 @@
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from anomalies import MAD_SCALE
+from records import FIELDS
+
+# Checks run at load time, with what is done about rows that fail them
+CHECKS = {
+    'invalid': "Missing, zero or negative values (quarantined)",
+    'unsorted': "Rows out of year order (sorted)",
+    'duplicate': "Repeated years (merged: usage and cost summed)",
+    'rate_mismatch': "Cost per kWh inconsistent with cost / usage (recomputed)",
+    'outlier': "Cost per kWh far from the site's typical rate (quarantined)",
+    'gap': "Missing years between the first and last year (reported)",
+}
+
+# Difference between costPerKwh and totalCost / totalUsage that counts as inconsistent: relative, plus
+# half a unit in the last decimal place the rate was stored with, so rates quoted in whole cents (0.05)
+# still match while a rate stored to five places (0.08878) gets no more than the relative slack
+RATE_TOLERANCE = 0.005
+RATE_DECIMALS = (2, 6)
+
+# Robust z-score of a year's cost per kWh above which the year is quarantined
+OUTLIER_THRESHOLD = 10.0
+
+# Sites need this many years before outliers are screened
+OUTLIER_MIN_YEARS = 5
+
+# Smallest spread (MAD relative to the median rate) used for scoring, so a few near-identical years
+# don't make ordinary rate changes look extreme
+OUTLIER_MIN_SPREAD = 0.05
+
+# Example (site, year) pairs kept per check in the report
+MAX_EXAMPLES = 5
+
+# Year-over-year change columns and the columns they are derived from
+CHANGE_COLUMNS = {'usageChange': 'totalUsage', 'costChange': 'totalCost', 'rateChange': 'costPerKwh'}
+
+
+class ValidationReport(NamedTuple):
+    """Compact summary of what the load-time checks found and repaired"""
+    rows: int              # rows read
+    kept: int              # rows after merging and quarantine
+    counts: dict           # check -> number of affected rows (missing years for 'gap')
+    examples: dict         # check -> up to MAX_EXAMPLES (site, year) pairs
+    quarantine: pd.DataFrame  # rows removed by the 'invalid' and 'outlier' checks
+
+    @property
+    def ok(self):
+        return not any(self.counts.values())
+
+    def summary(self):
+        """One line per failed check, e.g. 'Repeated years (merged: ...): 3 (north 2012, ...)'"""
+        lines = []
+        for check, count in self.counts.items():
+            if count:
+                examples = ', '.join(f"{site} {year}" if site else str(year) for site, year in self.examples[check])
+                lines.append(f"{CHECKS[check]}: {count:,} ({examples}{', ...' if count > len(self.examples[check]) else ''})")
+        return lines
+
+
+def _site_medians(codes, values, offsets):
+    """Median of each site's values, sorting by value and then stably by site (a radix sort of integers)"""
+    order = np.argsort(values)
+    order = order[np.argsort(codes[order], kind='stable')]
+    ordered = values[order]
+    counts = np.diff(offsets)
+    low = offsets[:-1] + np.maximum(counts - 1, 0) // 2
+    high = offsets[:-1] + counts // 2
+    if len(ordered) == 0:
+        return np.zeros(len(counts))
+    return (ordered[np.minimum(low, len(ordered) - 1)] + ordered[np.minimum(high, len(ordered) - 1)]) / 2
+
+
+def _rate_rounding(rate):
+    """Half a unit in the last decimal place of each rate (at least cents, at most RATE_DECIMALS[1] places)"""
+    decimals = np.full(len(rate), RATE_DECIMALS[1])
+    # The fewest places that hold the rate exactly (up to float noise), tried from the most down
+    for places in range(RATE_DECIMALS[1] - 1, RATE_DECIMALS[0] - 1, -1):
+        scaled = rate * 10.0 ** places
+        decimals[np.abs(scaled - np.round(scaled)) < 1e-6] = places
+    return 0.5 * 10.0 ** -decimals
+
+
+def validate_yearly(df, site_column='site'):
+    """Check and repair yearly rows, returning (clean frame, ValidationReport)
+
+    Every check is a mask over whole columns, so the cost grows linearly with the number of rows
+    whatever the number of sites. A frame that passes every check is returned unchanged (same
+    values and dtypes), so its data version stays the same.
+    """
+    has_sites = site_column in df.columns
+    n = len(df)
+    if has_sites:
+        codes, names = pd.factorize(df[site_column].astype(str), sort=True)
+    else:
+        codes, names = np.zeros(n, dtype=np.int64), np.array([''])
+    codes = codes.astype(np.int64)
+    years = pd.to_numeric(df['year'], errors='coerce').to_numpy(dtype=np.float64)
+    usage = pd.to_numeric(df['totalUsage'], errors='coerce').to_numpy(dtype=np.float64)
+    cost = pd.to_numeric(df['totalCost'], errors='coerce').to_numpy(dtype=np.float64)
+    if 'costPerKwh' in df.columns:
+        rate = pd.to_numeric(df['costPerKwh'], errors='coerce').to_numpy(dtype=np.float64)
+    else:
+        rate = np.full(n, np.nan)
+
+    counts, examples = {}, {}
+    rows = np.arange(n)
+
+    def record(check, mask, count=None):
+        hits = np.flatnonzero(mask)
+        counts[check] = int(len(hits) if count is None else count)
+        examples[check] = [(str(names[codes[i]]), int(years[i])) for i in hits[:MAX_EXAMPLES]]
+
+    # Rows that can't be used at all
+    invalid = ~(np.isfinite(years) & np.isfinite(usage) & np.isfinite(cost)) | (usage <= 0) | (cost <= 0)
+    counts['invalid'] = int(invalid.sum())
+    examples['invalid'] = [(str(names[codes[i]]), int(years[i]) if np.isfinite(years[i]) else -1) for i in np.flatnonzero(invalid)[:MAX_EXAMPLES]]
+    quarantined = [rows[invalid]]
+    valid = ~invalid
+    codes, years, usage, cost, rate, rows = codes[valid], years[valid], usage[valid], cost[valid], rate[valid], rows[valid]
+
+    # Sort by (site, year), keeping the given order of equal keys; sites may be listed in any order, but
+    # a row is out of order if the sort moves it before a row of the same site that was given earlier
+    if ((np.diff(codes) < 0) | ((np.diff(codes) == 0) & (np.diff(years) < 0))).any():
+        # One integer key per row sorts by site and year together
+        low = years.min()
+        order = np.argsort(codes * int(years.max() - low + 1) + (years - low).astype(np.int64), kind='stable')
+        codes, years, usage, cost, rate, rows = codes[order], years[order], usage[order], cost[order], rate[order], rows[order]
+    unsorted = (np.diff(codes) == 0) & (np.diff(rows) < 0)
+    record('unsorted', np.append(False, unsorted))
+
+    # Merge repeated (site, year) rows by summing usage and cost
+    repeated = np.append(False, (np.diff(codes) == 0) & (np.diff(years) == 0))
+    record('duplicate', repeated)
+    merged = np.zeros(len(codes), dtype=bool)
+    if repeated.any():
+        starts = np.flatnonzero(~repeated)
+        usage, cost = np.add.reduceat(usage, starts), np.add.reduceat(cost, starts)
+        codes, years, rate, rows = codes[starts], years[starts], rate[starts], rows[starts]
+        merged = np.diff(np.append(starts, len(repeated))) > 1
+
+    # A given rate must match cost / usage (missing rates and merged rows are simply derived)
+    implied = cost / usage
+    mismatch = np.abs(rate - implied) > RATE_TOLERANCE * implied + _rate_rounding(rate)
+    record('rate_mismatch', mismatch & ~merged)
+    rate = np.where(mismatch | merged | np.isnan(rate), np.round(implied, 5), rate)
+
+    # Quarantine years whose cost per kWh is far from the site's median (unit mix-ups, typos)
+    offsets = np.searchsorted(codes, np.arange(len(names) + 1))
+    median = _site_medians(codes, implied, offsets)
+    deviation = np.abs(implied - median[codes])
+    mad = _site_medians(codes, deviation, offsets)
+    floor = OUTLIER_MIN_SPREAD * np.abs(median)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scores = MAD_SCALE * deviation / np.maximum(mad, floor)[codes]
+    screened = (np.diff(offsets) >= OUTLIER_MIN_YEARS)[codes]
+    outlier = screened & (scores > OUTLIER_THRESHOLD)
+    record('outlier', outlier)
+    quarantined.append(rows[outlier])
+    keep = ~outlier
+    codes, years, usage, cost, rate, rows = codes[keep], years[keep], usage[keep], cost[keep], rate[keep], rows[keep]
+
+    # Report missing years inside each site's span
+    steps = np.diff(years)
+    same_site = np.diff(codes) == 0
+    gaps = np.append(same_site & (steps > 1), False)
+    record('gap', gaps, count=int(((steps - 1) * (same_site & (steps > 1))).sum()))
+    examples['gap'] = [(site, year + 1) for site, year in examples['gap']]
+
+    quarantine = df.iloc[np.sort(np.concatenate(quarantined))]
+    output = ([site_column] if has_sites else []) + list(FIELDS)
+    repaired = any(counts[check] for check in ('invalid', 'unsorted', 'duplicate', 'rate_mismatch', 'outlier'))
+    if not repaired and all(col in df.columns and df[col].notna().all() for col in FIELDS):
+        clean = df[output].reset_index(drop=True)
+        return clean, ValidationReport(n, len(clean), counts, examples, quarantine)
+
+    # Rebuild the columns; year-over-year changes are derived again wherever rows were repaired or they are missing
+    clean = pd.DataFrame({'year': years.astype(np.int64), 'totalUsage': usage, 'totalCost': cost, 'costPerKwh': rate})
+    if has_sites:
+        clean.insert(0, site_column, names[codes])
+    first = np.append(True, np.diff(codes) != 0)
+    for column, base in CHANGE_COLUMNS.items():
+        values = clean[base].to_numpy()
+        change = np.zeros(len(values))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            change[1:] = (values[1:] / values[:-1] - 1) * 100
+        # Same convention as the built-in data: percent, one decimal, 0 for each site's first year
+        change[first] = 0
+        change = np.round(change, 1)
+        if column in df.columns and not repaired:
+            # Rows weren't touched, so given changes are kept where there are any
+            given = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64)[rows]
+            change = np.where(np.isnan(given), change, given)
+        clean[column] = change
+    return clean[output], ValidationReport(n, len(clean), counts, examples, quarantine)
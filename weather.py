@@ -0,0 +1,251 @@
+import os
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from core import DATA_DIR, array_version
+from intervals import NS_PER_DAY
+
+# Daily heating/cooling degree days: one row per date, optionally per site
+DEGREE_DAYS_FILE = os.path.join(DATA_DIR, 'degree_days.csv')
+DEGREE_DAY_COLUMNS = ['date', 'hdd', 'cdd']
+
+# Years with fewer days of degree-day data are left out of annual joins
+MIN_YEAR_DAYS = 360
+
+# Fewer observations than this leave a site's model unfitted
+MIN_OBSERVATIONS = 4
+
+# Relative ridge term added to the normal equations so sites without heating or cooling stay solvable
+RIDGE = 1e-9
+
+
+class DegreeDays:
+    """Daily degree days per weather site, sorted by site then date in compressed-row form"""
+
+    __slots__ = ('sites', 'positions', 'offsets', 'days', 'hdd', 'cdd', 'version', 'totals')
+
+    def __init__(self, sites, offsets, days, hdd, cdd):
+        self.sites = list(sites)
+        self.positions = {site: i for i, site in enumerate(self.sites)}
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        # Days since 1970-01-01
+        self.days = np.asarray(days, dtype=np.int64)
+        self.hdd = np.asarray(hdd, dtype=np.float64)
+        self.cdd = np.asarray(cdd, dtype=np.float64)
+        self.version = array_version(self.offsets, self.days, self.hdd, self.cdd)
+        # (first year, (station, year) HDD totals, (station, year) CDD totals), built on first use
+        self.totals = None
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build from a frame with date, hdd and cdd columns (and an optional site column)"""
+        missing = [col for col in DEGREE_DAY_COLUMNS if col not in df.columns]
+        if missing:
+            raise ValueError(f"Missing degree-day columns: {missing}")
+
+        # Rows without a site are shared by every site that has no rows of its own
+        sites = df['site'].fillna('').astype(str) if 'site' in df.columns else pd.Series('', index=df.index)
+        codes, names = pd.factorize(sites, sort=True)
+        days = pd.to_datetime(df['date']).to_numpy(dtype='datetime64[D]').astype(np.int64)
+
+        # Sort by (site, day) and keep the last row of any repeated date
+        order = np.lexsort((days, codes))
+        codes, days = codes[order], days[order]
+        last = np.append((np.diff(codes) != 0) | (np.diff(days) != 0), True)
+        order, codes, days = order[last], codes[last], days[last]
+
+        offsets = np.searchsorted(codes, np.arange(len(names) + 1))
+        return cls(names, offsets, days, df['hdd'].to_numpy(dtype=np.float64)[order], df['cdd'].to_numpy(dtype=np.float64)[order])
+
+    def station(self, site):
+        """Index of the degree-day series used for a site (its own, else the shared one, else None)"""
+        for name in (site, ''):
+            if name in self.positions:
+                return self.positions[name]
+        return None
+
+    def stations(self, sites):
+        """Degree-day series index of each site (-1 where a site has none)"""
+        site_stations = [self.station(site) for site in sites]
+        return np.array([-1 if station is None else station for station in site_stations], dtype=np.int64)
+
+    def join(self, sites, codes, days):
+        """Heating and cooling degree days for each (site code, day) pair, NaN where there is no data"""
+        codes, days = np.asarray(codes, dtype=np.intp), np.asarray(days, dtype=np.int64)
+        hdd = np.full(len(days), np.nan)
+        cdd = np.full(len(days), np.nan)
+        if len(self.days) == 0 or len(days) == 0:
+            return hdd, cdd
+
+        # Degree-day station of every reading (-1 where the site has none)
+        stations = self.stations(sites)[codes]
+
+        # Rows are sorted by (station, day), so one combined key searches every station at once
+        low = min(self.days.min(), days.min())
+        span = max(self.days.max(), days.max()) - low + 1
+        table = np.repeat(np.arange(len(self.sites)), np.diff(self.offsets)) * span + (self.days - low)
+        keys = stations * span + (days - low)
+        found = np.minimum(np.searchsorted(table, keys), len(table) - 1)
+        match = (stations >= 0) & (table[found] == keys)
+
+        hdd[match] = self.hdd[found[match]]
+        cdd[match] = self.cdd[found[match]]
+        return hdd, cdd
+
+    def annual_totals(self):
+        """First year and (station, year) HDD and CDD totals, NaN for years with too few days"""
+        if self.totals is None:
+            years = self.days.astype('datetime64[D]').astype('datetime64[Y]').astype(np.int64) + 1970
+            first = int(years.min()) if len(years) else 0
+            n_years = int(years.max()) - first + 1 if len(years) else 0
+
+            # One bincount per quantity over (station, year) cells for every station at once
+            cells = np.repeat(np.arange(len(self.sites)), np.diff(self.offsets)) * n_years + (years - first)
+            size = len(self.sites) * n_years
+            complete = np.bincount(cells, minlength=size) >= MIN_YEAR_DAYS
+            hdd, cdd = (np.where(complete, np.bincount(cells, weights=values, minlength=size), np.nan).reshape(len(self.sites), n_years)
+                        for values in (self.hdd, self.cdd))
+            self.totals = (first, hdd, cdd)
+        return self.totals
+
+    def annual(self, site):
+        """Years with (nearly) complete data for a site's station, with their HDD and CDD totals"""
+        station = self.station(site)
+        if station is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+        first, hdd, cdd = self.annual_totals()
+        complete = np.flatnonzero(np.isfinite(hdd[station]))
+        return complete + first, hdd[station, complete], cdd[station, complete]
+
+
+def load_degree_days(path=DEGREE_DAYS_FILE):
+    """Read daily degree days from a CSV file, or return None if there is no file"""
+    if not os.path.exists(path):
+        return None
+    return DegreeDays.from_frame(pd.read_csv(path))
+
+
+class WeatherFit(NamedTuple):
+    """Per-site usage ~ HDD + CDD regressions and the weather-normalized usage"""
+    coefficients: np.ndarray  # (site, [base, per HDD, per CDD])
+    r_squared: np.ndarray     # (site,)
+    observations: np.ndarray  # (site,)
+    normalized: np.ndarray    # aligned with the input usage, NaN where there was no weather data
+
+
+def fit_degree_day_models(codes, usage, hdd, cdd, n_sites, normal_groups=None):
+    """Fit usage = base + a*HDD + b*CDD for every site in one batched solve and normalize the usage
+
+    Normalized usage replaces each observation's degree days with the site's normal (average) degree
+    days for the same group, such as the same day of the year, or over all observations if no groups
+    are given.
+    """
+    codes = np.asarray(codes, dtype=np.intp)
+    keep = np.isfinite(usage) & np.isfinite(hdd) & np.isfinite(cdd)
+    k_codes, y = codes[keep], usage[keep]
+    X = np.column_stack([np.ones(len(y)), hdd[keep], cdd[keep]])
+
+    # Normal equations of every site at once: sum x_i x_j and sum x_i y per site
+    xtx = np.empty((n_sites, 3, 3))
+    for i in range(3):
+        for j in range(i, 3):
+            xtx[:, i, j] = xtx[:, j, i] = np.bincount(k_codes, weights=X[:, i] * X[:, j], minlength=n_sites)
+    xty = np.stack([np.bincount(k_codes, weights=X[:, i] * y, minlength=n_sites) for i in range(3)], axis=1)
+    observations = xtx[:, 0, 0].astype(np.int64)
+
+    scale = np.maximum(np.diagonal(xtx, axis1=1, axis2=2), 1.0)
+    xtx[:, [1, 2], [1, 2]] += RIDGE * scale[:, 1:] + RIDGE
+    xtx[observations < MIN_OBSERVATIONS] = np.eye(3)
+    coefficients = np.linalg.solve(xtx, xty[..., None])[..., 0]
+    coefficients[observations < MIN_OBSERVATIONS] = np.nan
+
+    # Goodness of fit per site
+    residuals = y - np.einsum('ij,ij->i', X, coefficients[k_codes])
+    mean_usage = xty[:, 0] / np.maximum(observations, 1)
+    ss_res = np.bincount(k_codes, weights=residuals ** 2, minlength=n_sites)
+    ss_tot = np.bincount(k_codes, weights=(y - mean_usage[k_codes]) ** 2, minlength=n_sites)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r_squared = np.where(ss_tot > 0, 1 - ss_res / ss_tot, np.nan)
+
+    # Normal degree days per (site, group), averaged over the fitted observations
+    groups = np.zeros(len(codes), dtype=np.intp) if normal_groups is None else np.asarray(normal_groups, dtype=np.intp)
+    n_groups = int(groups.max()) + 1 if len(groups) else 1
+    cells = codes * n_groups + groups
+    k_cells = cells[keep]
+    size = n_sites * n_groups
+    counts = np.bincount(k_cells, minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        hdd_normal = np.bincount(k_cells, weights=X[:, 1], minlength=size) / counts
+        cdd_normal = np.bincount(k_cells, weights=X[:, 2], minlength=size) / counts
+
+    normalized = np.full(len(usage), np.nan)
+    c = coefficients[k_codes]
+    normalized[keep] = y - c[:, 1] * (X[:, 1] - hdd_normal[k_cells]) - c[:, 2] * (X[:, 2] - cdd_normal[k_cells])
+    return WeatherFit(coefficients, r_squared, observations, normalized)
+
+
+class WeatherEngine:
+    """Joins usage with degree days, fits all sites in one batch and caches the results"""
+
+    def __init__(self):
+        # (usage version, degree-day version, sites) -> (years, WeatherFit)
+        self.annual_cache = {}
+        # (interval version, degree-day version) -> (site codes, days, daily usage, WeatherFit)
+        self.daily_cache = {}
+
+    def normalize_annual(self, sites, years, usage, version, degree_days):
+        """Weather-normalize the annual usage of many sites against annual HDD/CDD totals in one batch
+
+        `usage` is a (site, year) matrix over `years` (NaN where a site has no row); the fit's
+        normalized usage has the same shape.
+        """
+        cache_key = (version, degree_days.version, tuple(sites))
+        result = self.annual_cache.get(cache_key)
+        if result is None:
+            years = np.asarray(years, dtype=np.int64)
+            usage = np.asarray(usage, dtype=np.float64).reshape(len(sites), len(years))
+
+            # Look every (site, year) cell up in the (station, year) degree-day totals at once
+            first, hdd_totals, cdd_totals = degree_days.annual_totals()
+            stations = degree_days.stations(sites)[:, None]
+            columns = (years - first)[None, :]
+            known = (stations >= 0) & (columns >= 0) & (columns < hdd_totals.shape[1])
+            hdd = np.full(usage.shape, np.nan)
+            cdd = np.full(usage.shape, np.nan)
+            station_rows, year_columns = np.broadcast_to(stations, usage.shape)[known], np.broadcast_to(columns, usage.shape)[known]
+            hdd[known] = hdd_totals[station_rows, year_columns]
+            cdd[known] = cdd_totals[station_rows, year_columns]
+
+            codes = np.repeat(np.arange(len(sites)), len(years))
+            fit = fit_degree_day_models(codes, usage.ravel(), hdd.ravel(), cdd.ravel(), len(sites))
+            result = (years, fit._replace(normalized=fit.normalized.reshape(usage.shape)))
+            self.annual_cache[cache_key] = result
+        return result
+
+    def normalize_daily(self, intervals, degree_days):
+        """Weather-normalize the daily usage of every interval site in one batch"""
+        cache_key = (intervals.version, degree_days.version)
+        result = self.daily_cache.get(cache_key)
+        if result is None:
+            # Daily usage per site from one bincount over (site, day) cells
+            codes = intervals.site_codes()
+            days = intervals.timestamps // NS_PER_DAY
+            first = days.min() if len(days) else 0
+            n_days = int(days.max() - first) + 1 if len(days) else 0
+            cells = codes * n_days + (days - first)
+            counts = np.bincount(cells, minlength=len(intervals.sites) * n_days)
+            usage = np.bincount(cells, weights=intervals.values, minlength=len(counts))
+            cells = np.flatnonzero(counts)
+            site_codes, day_values = cells // max(n_days, 1), cells % max(n_days, 1) + first
+
+            hdd, cdd = degree_days.join(intervals.sites, site_codes, day_values)
+
+            # Each day is compared with the normal degree days of the same day of the year
+            year_starts = day_values.astype('datetime64[D]').astype('datetime64[Y]').astype('datetime64[D]').astype(np.int64)
+            day_of_year = day_values - year_starts
+            fit = fit_degree_day_models(site_codes, usage[cells], hdd, cdd, len(intervals.sites), normal_groups=day_of_year)
+            result = (site_codes, day_values.astype('datetime64[D]'), usage[cells], fit)
+            self.daily_cache[cache_key] = result
+        return result